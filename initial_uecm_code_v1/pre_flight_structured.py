@@ -1,150 +1,174 @@
-import requests
+import os
 import json
-import pandas as pd
 from rich.console import Console
-from gliner import GLiNER  # Assuming GLiNER is available as an NER tool
+from uecm_llm_client import get_client, LLMError
+from uecm_models import get_gliner, DEFAULT_GLINER_MODEL
+from uecm_structured_profile import recognize_column_entities, DEFAULT_SAMPLE_SIZE, DEFAULT_STRATA
+from uecm_structured_loader import profile_structured_file, DEFAULT_CHUNK_ROWS
+import uecm_trace
 
 # Initialize the console for pretty printing
 console = Console()
 
 # Configuration for OLLAMA LLM
-API_URL = "http://localhost:11434/api/generate"  # Replace with actual API endpoint if different
 MODEL = "llama3.1:latest"
+
+# GLiNER model and default labels for the initial analysis
+GLINER_MODEL_ID = DEFAULT_GLINER_MODEL
+default_labels = ["PERSON", "ORGANIZATION", "LOCATION", "DATE", "MISC"]
+
+# Structured input: a JSON array, JSON Lines (.jsonl), CSV or Parquet file, read LOAD_CHUNK_ROWS rows at a time.
+# Set SCHEMA_SAMPLE_ROWS to profile only the leading rows instead of the whole file.
+DATA_PATH = 'structured_data.json'
+LOAD_CHUNK_ROWS = DEFAULT_CHUNK_ROWS
+SCHEMA_SAMPLE_ROWS = None
+
+# Column profiling: NER runs on at most PROFILE_SAMPLE_SIZE distinct values per column, sampled across
+# PROFILE_STRATA frequency bands
+PROFILE_SAMPLE_SIZE = DEFAULT_SAMPLE_SIZE
+PROFILE_STRATA = DEFAULT_STRATA
 SYSTEM_INSTRUCTIONS = "You are a helpful assistant specializing in data analysis and entity recognition. Provide concise and accurate responses in JSON format."
 
 # Function to generate a response using OLLAMA LLM
-def generate_response(prompt):
-    headers = {
-        'Content-Type': 'application/json'
-    }
-    data = {
-        "model": MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "format": "json"
-    }
-    response = requests.post(API_URL, headers=headers, data=json.dumps(data))
-    if response.status_code == 200:
-        return response.json()
-    else:
-        console.print(f"Error: {response.status_code}")
+def generate_response(prompt, model=MODEL):
+    try:
+        return get_client().generate(prompt, model=model, format="json")
+    except LLMError as e:
+        console.print(f"Error: {e}")
         return None
 
-# Step 1: User input to define research objective
-console.print("Please enter your research objective:")
-user_objective = input("Research Objective: ")
-
-# Load structured JSON data from a file
-try:
-    with open('structured_data.json', 'r') as file:
-        structured_data = json.load(file)
-except FileNotFoundError:
-    console.print("Error: structured_data.json file not found. Please ensure the file exists in the current directory.")
-    exit()
-except json.JSONDecodeError:
-    console.print("Error: Invalid JSON in structured_data.json. Please check the file contents.")
-    exit()
-
-# Convert JSON data to Pandas DataFrame
-df = pd.DataFrame(structured_data)
-
-# Discover schema using Pandas
-console.print("Discovered Schema:")
-schema_info = df.dtypes.apply(lambda x: x.name).to_dict()
-console.print_json(data=json.dumps(schema_info, indent=4))
-
-# Initialize GLiNER model with default labels for initial analysis
-default_labels = ["PERSON", "ORGANIZATION", "LOCATION", "DATE", "MISC"]
-try:
-    gliner_model = GLiNER.from_pretrained("urchade/gliner_small-v2.1")
-except Exception as e:
-    console.print(f"Error initializing GLiNER model: {str(e)}")
-    exit()
+# Function to perform initial entity recognition on the profiled column values.
+# `predictions` holds per-value NER spans shared across passes, so a later pass only runs labels not seen yet.
+def perform_initial_entity_recognition(value_counts, columns, labels=None, predictions=None, model_id=None):
+    labels = default_labels if labels is None else labels
+    with uecm_trace.span("structured.ner", "preflight", columns=len(columns), labels=len(labels)):
+        return recognize_column_entities(get_gliner(model_id or GLINER_MODEL_ID), value_counts, labels, sample_size=PROFILE_SAMPLE_SIZE, strata=PROFILE_STRATA,
+                                         columns=list(columns), predictions=predictions)
+
+# Function to pick the columns the LLM tied to the entity structure; all columns if it named none that exist
+def relevant_columns(entity_structure, columns):
+    named = {col for entity in entity_structure for col in (entity.get('source_columns') or []) if isinstance(col, str)}
+    selected = [col for col in columns if col in named]
+    return selected or list(columns)
+
+# Function to run the structured pre-flight without prompts and write its schema to output_dir.
+# Returns the preflight schema, or None if a step failed.
+def run_structured_preflight(user_objective, data_path=DATA_PATH, output_dir=".", model=MODEL, gliner_model_id=GLINER_MODEL_ID):
+    # Load the structured data chunk by chunk, discovering the schema and per-column value counts as we go
+    try:
+        with uecm_trace.span("structured.profile", "preflight", file=data_path):
+            schema_info, column_value_counts, row_count = profile_structured_file(data_path, chunk_rows=LOAD_CHUNK_ROWS, sample_rows=SCHEMA_SAMPLE_ROWS)
+    except FileNotFoundError:
+        console.print(f"Error: {data_path} file not found. Please ensure the file exists in the current directory.")
+        return None
+    except ValueError:
+        console.print(f"Error: Invalid data in {data_path}. Please check the file contents.")
+        return None
+
+    # Display the discovered schema
+    console.print(f"Discovered Schema ({row_count} rows):")
+    console.print_json(data=json.dumps(schema_info, indent=4))
+
+    # Load the GLiNER model now that the data is known to be readable
+    try:
+        get_gliner(gliner_model_id)
+    except Exception as e:
+        console.print(f"Error initializing GLiNER model: {str(e)}")
+        return None
 
-# Function to perform initial entity recognition on DataFrame columns
-def perform_initial_entity_recognition(df: pd.DataFrame, columns):
-    entities = []
-    for col in columns:
-        text = ' '.join(df[col].dropna().astype(str))
-        detected_entities = gliner_model.predict_entities(text, default_labels)
-        entities.append({col: detected_entities})
-    return entities
+    # Perform Initial Entity Recognition
+    value_predictions = {}
+    initial_entity_recognition_results = perform_initial_entity_recognition(column_value_counts, schema_info, predictions=value_predictions, model_id=gliner_model_id)
 
-# Perform Initial Entity Recognition
-initial_entity_recognition_results = perform_initial_entity_recognition(df, df.columns)
+    # Display Initial Entity Recognition Results
+    console.print("\nInitial Entity Recognition Results:")
+    console.print_json(data=json.dumps(initial_entity_recognition_results, indent=4))
 
-# Display Initial Entity Recognition Results
-console.print("\nInitial Entity Recognition Results:")
-console.print_json(data=json.dumps(initial_entity_recognition_results, indent=4))
+    # Use LLM to determine the most appropriate entity structure
+    llm_prompt = f"""
+    {SYSTEM_INSTRUCTIONS}
 
-# Use LLM to determine the most appropriate entity structure
-llm_prompt = f"""
-{SYSTEM_INSTRUCTIONS}
+    Given the following information:
 
-Given the following information:
+    1. User's Research Objective: {user_objective}
 
-1. User's Research Objective: {user_objective}
+    2. Structured Data Schema: {json.dumps(schema_info, indent=2)}
 
-2. Structured Data Schema: {json.dumps(schema_info, indent=2)}
+    3. Initial Entity Recognition Results: {json.dumps(initial_entity_recognition_results, indent=2)}
 
-3. Initial Entity Recognition Results: {json.dumps(initial_entity_recognition_results, indent=2)}
+    Please analyze the user's objective and the structured data, and determine the most appropriate entity structure for this specific research goal. Return a JSON object with the following structure:
 
-Please analyze the user's objective and the structured data, and determine the most appropriate entity structure for this specific research goal. Return a JSON object with the following structure:
+    {{
+        "entity_structure": [
+            {{
+                "entity_name": "string",
+                "description": "string",
+                "relevance_to_objective": "string",
+                "source_columns": ["column name from the schema", ...]
+            }},
+            ...
+        ],
+        "explanation": "string"
+    }}
 
-{{
-    "entity_structure": [
-        {{
-            "entity_name": "string",
-            "description": "string",
-            "relevance_to_objective": "string"
-        }},
-        ...
-    ],
-    "explanation": "string"
-}}
+    Ensure that the entity structure is tailored to the user's research objective and the content of the structured data. List in "source_columns" only the schema columns where each entity appears.
+    """
 
-Ensure that the entity structure is tailored to the user's research objective and the content of the structured data.
-"""
+    llm_response = generate_response(llm_prompt, model)
 
-llm_response = generate_response(llm_prompt)
+    if not llm_response:
+        console.print("Failed to determine entity structure with the LLM.")
+        return None
 
-if llm_response:
     console.print("\nLLM Entity Structure Determination:")
     console.print_json(data=json.dumps(llm_response, indent=4))
-    
+
     try:
         entity_structure = json.loads(llm_response.get('response', '{}')).get('entity_structure', [])
         explanation = json.loads(llm_response.get('response', '{}')).get('explanation', '')
-        
-        if entity_structure:
-            console.print("\nDetermined Entity Structure:")
-            console.print_json(data=json.dumps(entity_structure, indent=4))
-            console.print(f"\nExplanation: {explanation}")
-            
-            # Use the determined entity structure for final entity recognition
-            final_labels = [entity['entity_name'] for entity in entity_structure]
-            
-            # Perform final entity recognition with new labels
-            final_entity_recognition_results = perform_initial_entity_recognition(df, df.columns)
-            
-            console.print("\nFinal Entity Recognition Results:")
-            console.print_json(data=json.dumps(final_entity_recognition_results, indent=4))
-            
-            # Generate and save the final preflight schema
-            preflight_schema = {
-                "user_objective": user_objective,
-                "entity_structure": entity_structure,
-                "schema": schema_info,
-                "entity_recognition_results": final_entity_recognition_results
-            }
-            
-            with open('UECM_preflight_structured.json', 'w') as outfile:
-                json.dump(preflight_schema, outfile, indent=4)
-            
-            console.print("\nFinal Preflight Schema saved to UECM_preflight_structured.json")
-        else:
-            console.print("Error: No entity structure provided by the LLM.")
     except json.JSONDecodeError:
         console.print("Error: Unable to parse the entity structure from LLM response.")
-else:
-    console.print("Failed to determine entity structure with the LLM.")
\ No newline at end of file
+        return None
+
+    if not entity_structure:
+        console.print("Error: No entity structure provided by the LLM.")
+        return None
+
+    console.print("\nDetermined Entity Structure:")
+    console.print_json(data=json.dumps(entity_structure, indent=4))
+    console.print(f"\nExplanation: {explanation}")
+
+    # Use the determined entity structure for final entity recognition
+    final_labels = list(dict.fromkeys(entity['entity_name'] for entity in entity_structure if entity.get('entity_name')))
+    final_columns = relevant_columns(entity_structure, schema_info)
+
+    # Perform final entity recognition with new labels on the relevant columns only
+    final_entity_recognition_results = perform_initial_entity_recognition(column_value_counts, final_columns, final_labels, predictions=value_predictions, model_id=gliner_model_id)
+
+    console.print("\nFinal Entity Recognition Results:")
+    console.print_json(data=json.dumps(final_entity_recognition_results, indent=4))
+
+    # Generate and save the final preflight schema
+    preflight_schema = {
+        "user_objective": user_objective,
+        "entity_structure": entity_structure,
+        "schema": schema_info,
+        "entity_recognition_results": final_entity_recognition_results
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, 'UECM_preflight_structured.json')
+    with open(output_path, 'w') as outfile:
+        json.dump(preflight_schema, outfile, indent=4)
+
+    console.print(f"\nFinal Preflight Schema saved to {output_path}")
+    return preflight_schema
+
+def main():
+    # Step 1: User input to define research objective
+    console.print("Please enter your research objective:")
+    user_objective = input("Research Objective: ")
+    run_structured_preflight(user_objective)
+
+if __name__ == "__main__":
+    main()
@@ -1,32 +1,25 @@
 import os
 import json
-import ollama
+import time
 import tqdm
 import loguru
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-from PyPDF2 import PdfReader
-from gliner import GLiNER
+from uecm_llm_client import get_client
+from uecm_models import get_gliner
+from uecm_ingest import extract_text_from_pdf
+from uecm_ner_engine import NEREngine, count_entities, DEFAULT_BATCH_SIZE, DEFAULT_WINDOW_TOKENS, DEFAULT_OVERLAP_TOKENS
 
 # Initialize logging
 loguru.logger.add("uecm_unstructured.log", rotation="10 MB")
 
-# Initialize GLiNER model
-gliner_model = GLiNER.from_pretrained("urchade/gliner_small-v2.1")
+# GLiNER model, loaded from the model registry on first use
+gliner_model = get_gliner("urchade/gliner_small-v2.1", lazy=True)
 default_labels = ["DISEASE", "DRUG", "TREATMENT", "MECHANISM", "TRIAL_PHASE", "APPROVAL_STATUS", "SIDE_EFFECT"]
 
 def extract_text_from_pdfs(pdf_folder):
     extracted_texts = []
     for filename in tqdm.tqdm(os.listdir(pdf_folder), desc="Processing files"):
         if filename.endswith(".pdf"):
-            filepath = os.path.join(pdf_folder, filename)
-            reader = PdfReader(filepath)
-            text = ''
-            for page in reader.pages:
-                raw_text = page.extract_text()
-                cleaned_text = clean_text(raw_text)
-                text += cleaned_text
-            extracted_texts.append(text)
+            extracted_texts.extend(extract_text_from_pdf(os.path.join(pdf_folder, filename)))
     return extracted_texts
 
 def clean_text(text):
@@ -34,18 +27,17 @@ def clean_text(text):
     text = ' '.join(text.split())
     return text
 
-def perform_ner(texts, threshold=0.5):
+def perform_ner(texts, threshold=0.5, batch_size=DEFAULT_BATCH_SIZE, window_tokens=DEFAULT_WINDOW_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS):
+    engine = NEREngine(gliner_model, default_labels, window_tokens=window_tokens, overlap_tokens=overlap_tokens, batch_size=batch_size, threshold=threshold)
     entities = {}
-    for text in tqdm.tqdm(texts, desc="Performing NER"):
-        detected_entities = gliner_model.predict_entities(text, default_labels)
-        for entity in detected_entities:
-            if entity['score'] >= threshold:
-                entity_name = f"{entity['label']}: {entity['text']}"
-                if entity_name in entities:
-                    entities[entity_name] += 1
-                else:
-                    entities[entity_name] = 1
-    
+    started = time.perf_counter()
+    total = len(texts) if hasattr(texts, '__len__') else None
+    for _, spans in tqdm.tqdm(engine.iter_predict(texts), total=total, desc="Performing NER"):
+        count_entities(spans, threshold, entities)
+    
+    stats = engine.throughput(time.perf_counter() - started)
+    loguru.logger.info(f"NER throughput: {stats['documents']} docs, {stats['windows']} windows in {stats['batches']} batches "
+                       f"({stats['docs_per_sec']:.2f} docs/sec, {stats['windows_per_sec']:.2f} windows/sec)")
     loguru.logger.info(f"Found {len(entities)} unique entities")
     return entities
 
@@ -76,7 +68,7 @@ def analyze_entities_with_objective(entities, objective):
     Remember, your entire response must be valid JSON. Do not include any text outside of the JSON structure.
     """
     
-    response = ollama.generate(model='llama3.1:latest', prompt=prompt)
+    response = get_client().generate(prompt, model='llama3.1:latest', format="json")
     try:
         return json.loads(response["response"])
     except json.JSONDecodeError:
@@ -99,6 +91,8 @@ def generate_word_cloud(entities):
         entity_text = entity.split(": ", 1)[1] if ": " in entity else entity
         entity_frequencies[entity_text] = count
     
+    from wordcloud import WordCloud
+    import matplotlib.pyplot as plt
     try:
         wordcloud = WordCloud(width=800, height=400, 
                               background_color='white', 
@@ -0,0 +1,185 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import loguru
+from uecm_ner_cache import NERCache, DEFAULT_CACHE_PATH
+from uecm_normalize import load_synonyms
+import uecm_trace
+
+DEFAULT_OUTPUT_ROOT = "uecm_jobs"
+DEFAULT_MAX_WORKERS = 4
+JOB_FIELDS = {"name", "objective", "research_goal", "structured_data", "unstructured_folder", "structured_schema",
+              "unstructured_schema", "threshold", "mode", "model", "output_dir", "normalize", "synonyms", "wordcloud", "graph"}
+PATH_FIELDS = ("structured_data", "unstructured_folder", "structured_schema", "unstructured_schema", "output_dir", "synonyms")
+
+
+# Function to read a job spec file: either one job object or {"defaults": {...}, "jobs": [...]}.
+# Relative paths are resolved against the spec file's directory. Returns a list of job dicts.
+def load_job_spec(path):
+    with open(path, 'r') as f:
+        spec = json.load(f)
+    if isinstance(spec, dict) and "jobs" not in spec:
+        spec = {"jobs": [spec]}
+    if not isinstance(spec, dict) or not isinstance(spec.get("jobs"), list):
+        raise ValueError(f"{path}: expected a job object or {{\"jobs\": [...]}}")
+    base = os.path.dirname(os.path.abspath(path))
+    defaults = spec.get("defaults", {})
+    output_root = defaults.pop("output_root", DEFAULT_OUTPUT_ROOT)
+    jobs, names = [], set()
+    for index, entry in enumerate(spec["jobs"]):
+        job = {**defaults, **entry}
+        unknown = set(job) - JOB_FIELDS
+        if unknown:
+            raise ValueError(f"{path}: job {index} has unknown fields {sorted(unknown)}")
+        if not job.get("objective"):
+            raise ValueError(f"{path}: job {index} needs an 'objective'")
+        if not (job.get("structured_data") or job.get("structured_schema") or job.get("unstructured_folder") or job.get("unstructured_schema")):
+            raise ValueError(f"{path}: job {index} has no structured or unstructured input")
+        if not _job_has_stages(job):
+            raise ValueError(f"{path}: job {index} produces no stage: it needs structured_data or unstructured_folder without a "
+                             f"ready schema to run a pre-flight, or both a structured and an unstructured input to merge")
+        job["name"] = job.get("name") or f"job-{index + 1}"
+        if job["name"] in names:
+            raise ValueError(f"{path}: duplicate job name {job['name']!r}")
+        names.add(job["name"])
+        job.setdefault("output_dir", os.path.join(output_root, re.sub(r"[^\w.-]+", "_", job["name"])))
+        for field in PATH_FIELDS:
+            if job.get(field):
+                job[field] = os.path.join(base, job[field])
+        jobs.append(job)
+    return jobs
+
+
+# Function to tell whether a job produces any stage: a pre-flight for raw data without a ready
+# schema, or a merge once both a structured and an unstructured input are present
+def _job_has_stages(job):
+    structured = job.get("structured_schema") or job.get("structured_data")
+    unstructured = job.get("unstructured_schema") or job.get("unstructured_folder")
+    preflight = ((job.get("structured_data") and not job.get("structured_schema"))
+                 or (job.get("unstructured_folder") and not job.get("unstructured_schema")))
+    return bool(preflight or (structured and unstructured))
+
+
+# Function to expand jobs into DAG stages: (stage id, dependencies, callable)
+def plan_stages(jobs, cache=None):
+    import pre_flight_structured
+    import uecm_pre_flight_unstructured
+    from uecm_service import load_compare_module
+    compare = load_compare_module()
+    stages = []
+    for job in jobs:
+        name, output_dir = job["name"], job["output_dir"]
+        llm = {"model": job["model"]} if job.get("model") else {}
+        structured_path = job.get("structured_schema")
+        unstructured_path = job.get("unstructured_schema")
+        dependencies = []
+        if not structured_path and job.get("structured_data"):
+            structured_path = os.path.join(output_dir, "UECM_preflight_structured.json")
+            dependencies.append(f"{name}/structured")
+            stages.append((f"{name}/structured", [], lambda job=job, llm=llm: pre_flight_structured.run_structured_preflight(
+                job["objective"], data_path=job["structured_data"], output_dir=job["output_dir"], **llm)))
+        if not unstructured_path and job.get("unstructured_folder"):
+            unstructured_path = os.path.join(output_dir, "UECM_preflight_unstructured.json")
+            dependencies.append(f"{name}/unstructured")
+            stages.append((f"{name}/unstructured", [], lambda job=job, llm=llm: uecm_pre_flight_unstructured.run_unstructured_preflight(
+                job["objective"], job["unstructured_folder"], job.get("threshold", 0.5), output_dir=job["output_dir"], mode=job.get("mode"),
+                cache=cache, normalize=job.get("normalize", True), wordcloud=job.get("wordcloud", False),
+                synonyms=load_synonyms(job["synonyms"]) if job.get("synonyms") else None, **llm)))
+        if structured_path and unstructured_path:
+            stages.append((f"{name}/merge", dependencies, lambda job=job, llm=llm, structured_path=structured_path, unstructured_path=unstructured_path: compare.run_schema_merge(
+                structured_path, unstructured_path, job.get("research_goal") or job["objective"], output_dir=job["output_dir"],
+                graph=job.get("graph", True), **llm)))
+    return stages
+
+
+# Function to run stages as a DAG on a thread pool.
+# A stage starts once all its dependencies succeeded; a stage that raises or returns None fails,
+# and everything downstream of it is skipped. Returns {stage id: {"status", "seconds", "error"?}}.
+def run_stages(stages, max_workers=DEFAULT_MAX_WORKERS):
+    results = {}
+    waiting = list(stages)
+    running = {}
+
+    def timed(stage_id, function):
+        started = time.perf_counter()
+        with uecm_trace.span(stage_id, "stage"):
+            result = function()
+        return result, time.perf_counter() - started
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while waiting or running:
+            for stage in list(waiting):
+                stage_id, dependencies, function = stage
+                statuses = [results.get(dependency, {}).get("status") for dependency in dependencies]
+                if any(status in ("failed", "skipped") for status in statuses):
+                    results[stage_id] = {"status": "skipped", "seconds": 0.0}
+                    loguru.logger.warning(f"Skipping {stage_id}: a dependency failed")
+                    waiting.remove(stage)
+                elif all(status == "done" for status in statuses):
+                    loguru.logger.info(f"Starting {stage_id}")
+                    running[executor.submit(timed, stage_id, function)] = stage_id
+                    waiting.remove(stage)
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage_id = running.pop(future)
+                try:
+                    result, seconds = future.result()
+                except Exception as e:
+                    loguru.logger.exception(f"{stage_id} failed")
+                    results[stage_id] = {"status": "failed", "seconds": 0.0, "error": str(e)}
+                    continue
+                results[stage_id] = {"status": "done" if result is not None else "failed", "seconds": round(seconds, 2)}
+                loguru.logger.info(f"Finished {stage_id}: {results[stage_id]['status']} in {seconds:.1f}s")
+    return results
+
+
+def write_job_reports(jobs, results):
+    for job in jobs:
+        stages = {stage_id.rsplit("/", 1)[1]: result for stage_id, result in results.items() if stage_id.rsplit("/", 1)[0] == job["name"]}
+        os.makedirs(job["output_dir"], exist_ok=True)
+        with open(os.path.join(job["output_dir"], "job_status.json"), 'w') as f:
+            json.dump({"job": job, "stages": stages}, f, indent=4)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run UECM structured pre-flight, unstructured pre-flight and schema merge for a batch of jobs")
+    parser.add_argument("spec", help="JSON job spec: one job object or {\"defaults\": {...}, \"jobs\": [...]}")
+    parser.add_argument("--max-workers", type=int, default=DEFAULT_MAX_WORKERS, help="stages run concurrently across all jobs")
+    parser.add_argument("--dry-run", action="store_true", help="print the stage plan without running it")
+    parser.add_argument("--no-cache", action="store_true", help="do not share the NER span cache between jobs")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite file holding cached NER spans")
+    parser.add_argument("--trace", help="write a Chrome trace-event JSON of all stages to this file")
+    parser.add_argument("--metrics-out", help="write a Prometheus text snapshot of the run's counters to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    jobs = load_job_spec(args.spec)
+    cache = None if args.no_cache or args.dry_run else NERCache(args.cache_path)
+    stages = plan_stages(jobs, cache)
+    if args.dry_run:
+        for stage_id, dependencies, _ in stages:
+            print(f"{stage_id}" + (f" <- {', '.join(dependencies)}" if dependencies else ""))
+        return 0
+    loguru.logger.info(f"Running {len(stages)} stages for {len(jobs)} jobs with {args.max_workers} workers")
+    if args.trace or args.metrics_out:
+        uecm_trace.enable()
+    try:
+        results = run_stages(stages, args.max_workers)
+    finally:
+        uecm_trace.export(args.trace, args.metrics_out)
+    write_job_reports(jobs, results)
+    for stage_id, result in results.items():
+        print(f"{stage_id}: {result['status']} ({result['seconds']}s)")
+    return 0 if all(result["status"] == "done" for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import resource
+import tempfile
+import threading
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import loguru
+import uecm_trace
+
+SCALES = {
+    "small": {"documents": 40, "words": 1500, "rows": 5000, "queries": 50},
+    "medium": {"documents": 200, "words": 4000, "rows": 50000, "queries": 200},
+    "large": {"documents": 1000, "words": 8000, "rows": 500000, "queries": 1000},
+}
+DEFAULT_RESULTS_PATH = "uecm_benchmark_results.json"
+DEFAULT_TOLERANCE = 0.2
+MIN_REGRESSION_SECONDS = 0.05
+FORMATS = ("pdf", "html", "md", "txt")
+
+# Synthetic vocabulary: entity words the stub NER model recognizes, and filler text around them
+ENTITY_WORDS = {
+    "DRUG": ["aspirin", "imatinib", "vincristine", "methotrexate", "cisplatin", "doxorubicin", "rituximab", "temozolomide"],
+    "DISEASE": ["leukemia", "neuroblastoma", "glioma", "lymphoma", "sarcoma", "retinoblastoma", "medulloblastoma"],
+    "MECHANISM": ["kinase", "topoisomerase", "alkylation", "apoptosis", "angiogenesis"],
+    "TRIAL_PHASE": ["phase1", "phase2", "phase3"],
+    "SIDE_EFFECT": ["neutropenia", "nausea", "alopecia", "cardiotoxicity"],
+}
+ENTITY_LABELS = {word: label for label, words in ENTITY_WORDS.items() for word in words}
+ENTITY_PATTERN = re.compile(r"\b(" + "|".join(sorted(ENTITY_LABELS, key=len, reverse=True)) + r")\b", re.IGNORECASE)
+FILLER_WORDS = ("the study patients treatment response cohort results were observed during analysis with significant "
+                "improvement in outcomes among children receiving therapy compared to baseline measurements").split()
+
+
+# Deterministic GLiNER stand-in: tags vocabulary words and sleeps `latency` seconds per window
+class StubNER:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def batch_predict_entities(self, texts, labels, threshold=0.5):
+        if self.latency:
+            time.sleep(self.latency * len(texts))
+        wanted = set(labels)
+        return [
+            [{"text": match.group(0), "label": ENTITY_LABELS[match.group(0).lower()], "score": 0.9, "start": match.start(), "end": match.end()}
+             for match in ENTITY_PATTERN.finditer(text) if ENTITY_LABELS[match.group(0).lower()] in wanted]
+            for text in texts
+        ]
+
+    def predict_entities(self, text, labels, threshold=0.5):
+        return self.batch_predict_entities([text], labels, threshold)[0]
+
+
+class _StubToken:
+    def __init__(self, text):
+        self.text = text
+        self.lemma_ = text.lower()
+        self.is_punct = not any(char.isalnum() for char in text)
+        self.is_space = text.isspace()
+        self.is_stop = False
+
+
+class _StubDoc:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = [_StubToken(token) for token in re.findall(r"\w+|[^\w\s]", text)]
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+
+# spaCy stand-in with the parts MemoryManager and EntityIndex use: nlp(text) and nlp.pipe(texts)
+class StubNLP:
+    def __call__(self, text):
+        return _StubDoc(text)
+
+    def pipe(self, texts, **kwargs):
+        return (_StubDoc(text) for text in texts)
+
+
+# Ollama stand-in: answers /api/generate (plain or streamed) after `latency` seconds with a JSON
+# object holding every key the UECM prompts ask for, and reports token counts like Ollama does
+class StubLLMServer:
+    RESPONSE = json.dumps({
+        "relevant_entities": [], "key_concepts": ["stub"], "suggested_focus_areas": ["stub"], "data_quality_assessment": "stub",
+        "entity_structure": [], "explanation": "stub", "resolutions": [], "scores": [], "relationships": [],
+        "insights": [{"description": "stub insight", "relevance_to_goal": "stub"}], "suggestions": [{"title": "stub", "description": "stub"}],
+        "possible_queries": [],
+    })
+
+    def __init__(self, latency=0.0):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if stub.latency:
+                    time.sleep(stub.latency)
+                counts = {"prompt_eval_count": len(payload.get("prompt", "")) // 4, "eval_count": len(stub.RESPONSE) // 4}
+                if payload.get("stream"):
+                    chunks = [stub.RESPONSE[start:start + 64] for start in range(0, len(stub.RESPONSE), 64)]
+                    lines = [json.dumps({"response": chunk, "done": False}) for chunk in chunks]
+                    lines.append(json.dumps({"response": "", "done": True, **counts}))
+                    body = ("\n".join(lines) + "\n").encode("utf-8")
+                    content_type = "application/x-ndjson"
+                else:
+                    body = json.dumps({"response": stub.RESPONSE, "done": True, **counts}).encode("utf-8")
+                    content_type = "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.latency = latency
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _pdf_string(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Function to write a minimal valid PDF: one Helvetica text page per entry of `pages` (lists of lines)
+def write_minimal_pdf(path, pages):
+    page_count = len(pages)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        ("<< /Type /Pages /Kids [" + " ".join(f"{4 + 2 * index} 0 R" for index in range(page_count)) + f"] /Count {page_count} >>").encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for index, lines in enumerate(pages):
+        content = ("BT /F1 10 Tf 12 TL 50 780 Td " + " ".join(f"({_pdf_string(line)}) Tj T*" for line in lines) + " ET").encode("latin-1", "replace")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * index} 0 R >>".encode())
+        objects.append(f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    output += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def _synthetic_words(rng, count, entity_share=0.1):
+    entity_words = list(ENTITY_LABELS)
+    return [rng.choice(entity_words) if rng.random() < entity_share else rng.choice(FILLER_WORDS) for _ in range(count)]
+
+
+# Function to write `documents` files of about `words` words each, cycling through the formats
+def generate_corpus(folder, documents, words, formats=FORMATS, seed=0):
+    rng = random.Random(seed)
+    os.makedirs(folder, exist_ok=True)
+    for index in range(documents):
+        extension = formats[index % len(formats)]
+        tokens = _synthetic_words(rng, words)
+        lines = [" ".join(tokens[start:start + 12]) for start in range(0, len(tokens), 12)]
+        path = os.path.join(folder, f"doc_{index:05d}.{extension}")
+        if extension == "pdf":
+            write_minimal_pdf(path, [lines[start:start + 60] for start in range(0, len(lines), 60)])
+        elif extension == "html":
+            with open(path, "w") as f:
+                f.write("<html><body>" + "".join(f"<p>{line}</p>" for line in lines) + "</body></html>")
+        elif extension == "md":
+            with open(path, "w") as f:
+                f.write("# Synthetic study\n\n" + "\n\n".join(lines))
+        else:
+            with open(path, "w") as f:
+                f.write("\n".join(lines))
+    return folder
+
+
+# Function to write a JSON array table of `rows` synthetic trial records
+def generate_table(path, rows, seed=0):
+    rng = random.Random(seed)
+    drugs, diseases = ENTITY_WORDS["DRUG"], ENTITY_WORDS["DISEASE"]
+    sites = [f"Site {index}" for index in range(200)]
+    with open(path, "w") as f:
+        f.write("[")
+        for row in range(rows):
+            record = {
+                "trial_id": f"NCT{row:08d}",
+                "drug": rng.choice(drugs),
+                "condition": rng.choice(diseases),
+                "phase": rng.choice(ENTITY_WORDS["TRIAL_PHASE"]),
+                "site": rng.choice(sites),
+                "enrolled": rng.randint(10, 500),
+                "response_rate": round(rng.random(), 3),
+            }
+            f.write(("," if row else "") + json.dumps(record))
+        f.write("]")
+    return path
+
+
+def _peak_rss_mb():
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(own / divisor, 1), round(children / divisor, 1)
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def run(self, name, function, items=None):
+        started = time.perf_counter()
+        result = function()
+        seconds = time.perf_counter() - started
+        count = items(result) if callable(items) else items
+        peak, children_peak = _peak_rss_mb()
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "items": count,
+            "per_second": round(count / seconds, 2) if count and seconds > 0 else None,
+            "peak_rss_mb": peak,
+            "children_peak_rss_mb": children_peak,
+        }
+        loguru.logger.info(f"{name}: {seconds:.3f}s" + (f", {count} items ({count / seconds:.1f}/s)" if count and seconds > 0 else "") + f", peak RSS {peak} MB")
+        return result
+
+
+# Function to run every stage on synthetic data with stub models; returns the results dict
+def run_benchmark(config, work_dir):
+    import uecm_models
+    from uecm_llm_client import OllamaClient, set_client
+    from uecm_ingest import ingest_files_from_folders
+    from uecm_structured_loader import profile_structured_file
+    from uecm_structured_profile import recognize_column_entities
+    from uecm_service import load_compare_module
+    import uecm_pre_flight_unstructured as unstructured
+
+    stub_llm = StubLLMServer(config["llm_latency_ms"] / 1000)
+    set_client(OllamaClient(base_url=stub_llm.url, cache=None))
+    stub_ner = StubNER(config["ner_latency_ms"] / 1000)
+    uecm_models.register("gliner", unstructured.GLINER_MODEL_ID, stub_ner)
+    uecm_models.register("spacy", uecm_models.DEFAULT_SPACY_MODEL, StubNLP())
+    compare = load_compare_module()
+
+    corpus = generate_corpus(os.path.join(work_dir, "corpus"), config["documents"], config["words"], seed=config["seed"])
+    table = generate_table(os.path.join(work_dir, "structured_data.json"), config["rows"], seed=config["seed"])
+    timer = StageTimer()
+    try:
+        texts = timer.run("ingest", lambda: ingest_files_from_folders(corpus, workers=config["workers"]), items=config["documents"])
+        entities = timer.run("ner", lambda: unstructured.perform_ner(texts, 0.5), items=len(texts))
+        schema_info, value_counts, rows = timer.run("structured_profile", lambda: profile_structured_file(table), items=config["rows"])
+        timer.run("structured_ner", lambda: recognize_column_entities(stub_ner, value_counts, ["DRUG", "DISEASE", "TRIAL_PHASE"]), items=len(schema_info))
+        analysis = timer.run("analyze_entities", lambda: unstructured.analyze_entities_with_objective(entities, "benchmark objective"), items=len(entities))
+
+        structured_schema = {"entity_structure": [{"entity_name": column, "description": f"{dtype} column"} for column, dtype in schema_info.items()]}
+        unstructured_schema = {"entity_analysis": {**analysis, "relevant_entities": [
+            {"entity": name, "relevance_score": min(1.0, count / 100), "description": "synthetic"} for name, count in entities.items()
+        ]}}
+        merged = timer.run("schema_merge", lambda: compare.integrate_schemas([structured_schema, unstructured_schema], "benchmark goal"),
+                           items=lambda result: len(result["entities"]))
+        rng = random.Random(config["seed"])
+        for entity in merged["entities"]:
+            entity["relationships"] = [{"target": rng.choice(merged["entities"])["name"], "type": "mechanism of action", "description": "synthetic"}]
+
+        manager = compare.MemoryManager(merged, semantic_index=False)
+        names = [entity["name"] for entity in merged["entities"]] or ["nothing"]
+        templates = ("What is the mechanism of action of {0}?", "Which clinical trials tested {0}?", "How is {0} related to {1}?")
+        queries = [rng.choice(templates).format(rng.choice(names), rng.choice(names)) for _ in range(config["queries"])]
+        timer.run("memory_index", lambda: manager.entity_index)
+        timer.run("query", lambda: [manager.process_query(query) for query in queries], items=len(queries))
+    finally:
+        stub_llm.close()
+    return {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": config,
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "stages": timer.stages,
+    }
+
+
+# Function to compare stage timings against a baseline run; returns a list of regression descriptions
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    regressions = []
+    for name, stage in results["stages"].items():
+        before = baseline.get("stages", {}).get(name)
+        if not before or not before.get("seconds"):
+            continue
+        ratio = stage["seconds"] / before["seconds"]
+        marker = ""
+        if ratio > 1 + tolerance and stage["seconds"] - before["seconds"] > MIN_REGRESSION_SECONDS:
+            regressions.append(f"{name}: {before['seconds']:.3f}s -> {stage['seconds']:.3f}s ({ratio:.2f}x)")
+            marker = "  REGRESSION"
+        print(f"{name:20s} {before['seconds']:10.3f}s {stage['seconds']:10.3f}s {ratio:7.2f}x{marker}")
+    if baseline.get("config") != results["config"]:
+        loguru.logger.warning("Baseline was recorded with a different configuration; timings may not be comparable")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark UECM stages offline on synthetic data with stub NER and LLM backends")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="preset corpus, table and query sizes")
+    parser.add_argument("--documents", type=int, help="number of synthetic documents (overrides the scale)")
+    parser.add_argument("--words", type=int, help="words per synthetic document (overrides the scale)")
+    parser.add_argument("--rows", type=int, help="rows in the synthetic structured table (overrides the scale)")
+    parser.add_argument("--queries", type=int, help="MemoryManager queries to run (overrides the scale)")
+    parser.add_argument("--ner-latency-ms", type=float, default=0.0, help="stub NER latency per window")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0, help="stub LLM latency per call")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="ingestion worker processes")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the synthetic data")
+    parser.add_argument("--work-dir", help="where to write the synthetic data (a temporary directory by default)")
+    parser.add_argument("--output", default=DEFAULT_RESULTS_PATH, help="JSON results file to write")
+    parser.add_argument("--baseline", help="earlier results file to compare against; exits 1 on regressions")
+    parser.add_argument("--trace", help="also write a Chrome trace-event JSON of the run (tracing adds a little overhead)")
+    parser.add_argument("--metrics-out", help="also write a Prometheus text snapshot of the run's counters")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="allowed slowdown before a stage counts as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    config = dict(SCALES[args.scale])
+    for key in ("documents", "words", "rows", "queries"):
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    config.update(scale=args.scale, ner_latency_ms=args.ner_latency_ms, llm_latency_ms=args.llm_latency_ms, workers=args.workers, seed=args.seed)
+
+    if args.trace or args.metrics_out:
+        uecm_trace.enable()
+    if args.work_dir:
+        results = run_benchmark(config, args.work_dir)
+    else:
+        with tempfile.TemporaryDirectory(prefix="uecm_benchmark_") as work_dir:
+            results = run_benchmark(config, work_dir)
+    uecm_trace.export(args.trace, args.metrics_out)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=4)
+    loguru.logger.info(f"Benchmark results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            loguru.logger.error("Performance regressions: " + "; ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
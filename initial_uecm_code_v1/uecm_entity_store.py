@@ -0,0 +1,223 @@
+import json
+import numpy as np
+
+MAGIC = b"UECMES01"
+ALIGNMENT = 8
+
+
+# Compact store of entity mention counts.
+#
+# Labels and surface forms are interned into integer ids, and each (label, surface) pair is one row
+# of three NumPy arrays, so counting a mention never builds a "LABEL: text" string. Stores merge,
+# rank and filter with vectorized operations, and save to a binary file whose arrays can be
+# memory-mapped back without parsing. to_dict()/from_dict() convert to the raw_entities JSON shape.
+class EntityStore:
+    def __init__(self):
+        self.labels = []
+        self.label_ids = {}
+        self.surfaces = []
+        self._surface_ids = None
+        self._rows = {}
+        self._size = 0
+        self.label_idx = np.zeros(0, dtype=np.int32)
+        self.surface_idx = np.zeros(0, dtype=np.int32)
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def surface_ids(self):
+        if self._surface_ids is None:
+            self._surface_ids = {surface: index for index, surface in enumerate(self.surfaces)}
+        return self._surface_ids
+
+    def _intern_label(self, label):
+        label_id = self.label_ids.get(label)
+        if label_id is None:
+            label_id = self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+        return label_id
+
+    def _intern_surface(self, text):
+        surface_id = self.surface_ids.get(text)
+        if surface_id is None:
+            if not isinstance(self.surfaces, list):
+                self.surfaces = list(self.surfaces)
+            surface_id = self.surface_ids[text] = len(self.surfaces)
+            self.surfaces.append(text)
+        return surface_id
+
+    def _ensure_rows(self):
+        if len(self._rows) != self._size:
+            self._rows = {(int(l), int(s)): row for row, (l, s) in enumerate(zip(self.label_idx[:self._size], self.surface_idx[:self._size]))}
+
+    def _grow(self):
+        capacity = max(1024, len(self.counts) * 2)
+        for name in ("label_idx", "surface_idx", "counts"):
+            array = np.array(getattr(self, name)[:self._size])
+            grown = np.zeros(capacity, dtype=array.dtype)
+            grown[:self._size] = array
+            setattr(self, name, grown)
+
+    def add(self, label, text, count=1):
+        self._ensure_rows()
+        if not self.counts.flags.writeable:
+            # Copy memory-mapped arrays before the first write
+            self._grow()
+        key = (self._intern_label(label), self._intern_surface(text))
+        row = self._rows.get(key)
+        if row is None:
+            if self._size == len(self.counts):
+                self._grow()
+            row = self._rows[key] = self._size
+            self.label_idx[row], self.surface_idx[row] = key
+            self._size += 1
+        self.counts[row] += count
+
+    # Function to count detected spans at or above a threshold
+    def add_spans(self, spans, threshold):
+        for entity in spans:
+            if entity['score'] >= threshold:
+                self.add(entity['label'], entity['text'])
+        return self
+
+    @classmethod
+    def from_dict(cls, entities):
+        store = cls()
+        for entity_name, count in entities.items():
+            label, _, text = entity_name.partition(": ")
+            store.add(label, text, count)
+        return store
+
+    def _rows_view(self):
+        return self.label_idx[:self._size], self.surface_idx[:self._size], self.counts[:self._size]
+
+    def to_dict(self):
+        label_idx, surface_idx, counts = self._rows_view()
+        return {f"{self.labels[l]}: {self.surfaces[s]}": int(c) for l, s, c in zip(label_idx.tolist(), surface_idx.tolist(), counts.tolist())}
+
+    # Function to merge two stores into a new one; counts of shared (label, surface) pairs are summed
+    def merge(self, other):
+        merged = EntityStore()
+        merged.labels = list(self.labels)
+        merged.label_ids = dict(self.label_ids)
+        merged.surfaces = list(self.surfaces)
+        merged._surface_ids = dict(self.surface_ids)
+        label_map = np.array([merged._intern_label(label) for label in other.labels], dtype=np.int64)
+        surface_map = np.array([merged._intern_surface(surface) for surface in other.surfaces], dtype=np.int64)
+        self_labels, self_surfaces, self_counts = self._rows_view()
+        other_labels, other_surfaces, other_counts = other._rows_view()
+        n_surfaces = max(len(merged.surfaces), 1)
+        keys = np.concatenate([
+            self_labels.astype(np.int64) * n_surfaces + self_surfaces,
+            (label_map[other_labels] * n_surfaces + surface_map[other_surfaces]) if len(other_counts) else np.zeros(0, dtype=np.int64),
+        ])
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        merged.counts = np.bincount(inverse, weights=np.concatenate([self_counts, other_counts]), minlength=len(unique_keys)).astype(np.int64)
+        merged.label_idx = (unique_keys // n_surfaces).astype(np.int32)
+        merged.surface_idx = (unique_keys % n_surfaces).astype(np.int32)
+        merged._size = len(unique_keys)
+        return merged
+
+    def _select(self, rows):
+        label_idx, surface_idx, counts = self._rows_view()
+        return [(self.labels[label_idx[row]], self.surfaces[surface_idx[row]], int(counts[row])) for row in rows]
+
+    def _label_mask(self, label):
+        label_idx, _, _ = self._rows_view()
+        if label is None:
+            return np.ones(len(label_idx), dtype=bool)
+        return label_idx == self.label_ids.get(label, -1)
+
+    # Function to return the k most frequent (label, surface, count) rows
+    def top_k(self, k, label=None):
+        _, _, counts = self._rows_view()
+        rows = np.flatnonzero(self._label_mask(label))
+        if k < len(rows):
+            rows = rows[np.argpartition(-counts[rows], k)[:k]]
+        rows = rows[np.lexsort((rows, -counts[rows]))]
+        return self._select(rows)
+
+    # Function to return every (label, surface, count) row with at least min_count mentions
+    def above(self, min_count, label=None):
+        _, _, counts = self._rows_view()
+        rows = np.flatnonzero(self._label_mask(label) & (counts >= min_count))
+        return self._select(rows[np.argsort(-counts[rows], kind="stable")])
+
+    # Function to total counts per surface form across labels (used for word clouds)
+    def surface_frequencies(self):
+        _, surface_idx, counts = self._rows_view()
+        totals = np.bincount(surface_idx, weights=counts, minlength=len(self.surfaces))
+        return {self.surfaces[index]: int(totals[index]) for index in np.flatnonzero(totals)}
+
+    # Function to write the store as: magic, header length, JSON header, then 8-byte aligned arrays
+    def save(self, path):
+        encoded = [surface.encode("utf-8") for surface in self.surfaces]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(surface) for surface in encoded])
+        label_idx, surface_idx, counts = self._rows_view()
+        arrays = [
+            ("surface_offsets", offsets),
+            ("surface_bytes", np.frombuffer(b"".join(encoded), dtype=np.uint8)),
+            ("label_idx", np.ascontiguousarray(label_idx, dtype=np.int32)),
+            ("surface_idx", np.ascontiguousarray(surface_idx, dtype=np.int32)),
+            ("counts", np.ascontiguousarray(counts, dtype=np.int64)),
+        ]
+        layout = {}
+        position = 0
+        for name, array in arrays:
+            layout[name] = {"offset": position, "dtype": array.dtype.str, "length": len(array)}
+            position += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+        header = json.dumps({"labels": self.labels, "rows": self._size, "arrays": layout}).encode("utf-8")
+        header += b" " * (-(len(MAGIC) + 8 + len(header)) % ALIGNMENT)
+        with open(path, "wb") as f:
+            f.write(MAGIC)
+            f.write(np.array([len(header)], dtype="<u8").tobytes())
+            f.write(header)
+            for name, array in arrays:
+                data = array.tobytes()
+                f.write(data + b"\0" * (-len(data) % ALIGNMENT))
+
+    # Function to open a saved store; with mmap=True the count arrays are mapped, not read
+    @classmethod
+    def load(cls, path, mmap=True):
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not an entity store file")
+            header_length = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            header = json.loads(f.read(header_length))
+        base = len(MAGIC) + 8 + header_length
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            if mmap and spec["length"]:
+                arrays[name] = np.memmap(path, dtype=np.dtype(spec["dtype"]), mode="r", offset=base + spec["offset"], shape=(spec["length"],))
+            else:
+                with open(path, "rb") as f:
+                    f.seek(base + spec["offset"])
+                    arrays[name] = np.fromfile(f, dtype=np.dtype(spec["dtype"]), count=spec["length"])
+        store = cls()
+        store.labels = header["labels"]
+        store.label_ids = {label: index for index, label in enumerate(store.labels)}
+        store.surfaces = _StringTable(arrays["surface_offsets"], arrays["surface_bytes"])
+        store.label_idx = arrays["label_idx"]
+        store.surface_idx = arrays["surface_idx"]
+        store.counts = arrays["counts"]
+        store._size = header["rows"]
+        return store
+
+
+# Read-only view of a saved string table that decodes surface forms on access
+class _StringTable:
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        return bytes(self.data[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
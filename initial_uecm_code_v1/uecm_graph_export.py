@@ -0,0 +1,411 @@
+import os
+import json
+import random
+import loguru
+import numpy as np
+
+DEFAULT_LAYOUT_ITERATIONS = 60
+LOCAL_LAYOUT_MAX_NODES = 300
+LOCAL_LAYOUT_MIN_NODES = 16
+COMMUNITY_LAYOUT_MAX = 256
+LAYOUT_SCALE = 1000
+REPULSION_BLOCK = 512
+
+
+# Knowledge graph built from UECM schema entities.
+#
+# Nodes are kept in a list with a name -> index dict, so adding an edge is an O(1) lookup instead of
+# scanning the node list. Relationships to entities that are not in the schema are counted and
+# reported once rather than per edge.
+class KnowledgeGraph:
+    def __init__(self, entities):
+        self.names, self.types, self.relevance, self.descriptions = [], [], [], []
+        self.index = {}
+        for entity in entities:
+            name = entity.get('name')
+            if not name or name in self.index:
+                continue
+            self.index[name] = len(self.names)
+            self.names.append(name)
+            self.types.append(entity.get('type') or "")
+            self.relevance.append(float(entity.get('relevance_score') or 0.0))
+            self.descriptions.append(entity.get('description') or "")
+        self.edge_types, self.edges = [], []
+        edge_type_ids = {}
+        missing = {}
+        for entity in entities:
+            source = self.index.get(entity.get('name'))
+            for relationship in entity.get('relationships') or []:
+                if source is None or not isinstance(relationship, dict):
+                    continue
+                target = self.index.get(relationship.get('target'))
+                if target is None:
+                    missing[relationship.get('target')] = missing.get(relationship.get('target'), 0) + 1
+                    continue
+                kind = relationship.get('type') or ""
+                if kind not in edge_type_ids:
+                    edge_type_ids[kind] = len(self.edge_types)
+                    self.edge_types.append(kind)
+                self.edges.append((source, target, edge_type_ids[kind]))
+        if missing:
+            examples = ", ".join(repr(name) for name in list(missing)[:5])
+            loguru.logger.warning(f"{sum(missing.values())} relationships point to {len(missing)} entities not in the schema (e.g. {examples})")
+
+    def __len__(self):
+        return len(self.names)
+
+    def degrees(self):
+        degree = np.zeros(len(self.names), dtype=np.int64)
+        if self.edges:
+            endpoints = np.asarray(self.edges, dtype=np.int64)[:, :2]
+            np.add.at(degree, endpoints.ravel(), 1)
+        return degree
+
+    # Function to keep a subset of node indices, remapping the edges between kept nodes
+    def subgraph(self, keep):
+        keep = sorted(set(int(node) for node in keep))
+        remap = {old: new for new, old in enumerate(keep)}
+        graph = KnowledgeGraph.__new__(KnowledgeGraph)
+        graph.names = [self.names[node] for node in keep]
+        graph.types = [self.types[node] for node in keep]
+        graph.relevance = [self.relevance[node] for node in keep]
+        graph.descriptions = [self.descriptions[node] for node in keep]
+        graph.index = {name: node for node, name in enumerate(graph.names)}
+        graph.edge_types = self.edge_types
+        graph.edges = [(remap[s], remap[t], k) for s, t, k in self.edges if s in remap and t in remap]
+        return graph
+
+    # Function to drop nodes below a relevance score or degree and keep at most max_nodes,
+    # preferring the most relevant and then best connected entities
+    def prune(self, min_relevance=None, min_degree=0, max_nodes=None):
+        graph = self
+        if min_relevance is not None:
+            graph = graph.subgraph(node for node, score in enumerate(graph.relevance) if score >= min_relevance)
+        if min_degree:
+            graph = graph.subgraph(np.flatnonzero(graph.degrees() >= min_degree))
+        if max_nodes is not None and len(graph) > max_nodes:
+            order = np.lexsort((-graph.degrees(), -np.asarray(graph.relevance)))
+            graph = graph.subgraph(order[:max_nodes])
+        if len(graph) != len(self):
+            loguru.logger.info(f"Pruned knowledge graph from {len(self)} to {len(graph)} nodes")
+        return graph
+
+    def neighbours(self):
+        adjacency = [[] for _ in self.names]
+        for source, target, _ in self.edges:
+            if source != target:
+                adjacency[source].append(target)
+                adjacency[target].append(source)
+        return adjacency
+
+
+# Function to group nodes into communities by label propagation.
+# Nodes without any edges share one community so they do not each become a cluster of one.
+def detect_communities(graph, iterations=20, seed=0):
+    adjacency = graph.neighbours()
+    labels = list(range(len(graph)))
+    rng = random.Random(seed)
+    order = sorted(range(len(graph)), key=lambda node: -len(adjacency[node]))
+    for _ in range(iterations):
+        changed = False
+        for node in order:
+            if not adjacency[node]:
+                continue
+            counts = {}
+            for neighbour in adjacency[node]:
+                counts[labels[neighbour]] = counts.get(labels[neighbour], 0) + 1
+            best = max(counts.values())
+            candidates = [label for label, count in counts.items() if count == best]
+            if labels[node] not in candidates:
+                labels[node] = rng.choice(sorted(candidates))
+                changed = True
+        if not changed:
+            break
+    isolated = [node for node in range(len(graph)) if not adjacency[node]]
+    for node in isolated:
+        labels[node] = -1
+    renumber = {}
+    return np.array([renumber.setdefault(label, len(renumber)) for label in labels], dtype=np.int64)
+
+
+# Function to compute a Fruchterman-Reingold layout in the unit disc.
+# Repulsion is evaluated in row blocks so memory stays O(block * n) instead of O(n^2).
+def force_layout(count, edges, weights=None, iterations=DEFAULT_LAYOUT_ITERATIONS, seed=0):
+    if count <= 1:
+        return np.zeros((count, 2))
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-1.0, 1.0, (count, 2))
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    weights = np.ones(len(edges)) if weights is None else np.asarray(weights, dtype=np.float64)
+    k = np.sqrt(4.0 / count)
+    for iteration in range(iterations):
+        displacement = np.zeros((count, 2))
+        for start in range(0, count, REPULSION_BLOCK):
+            delta = positions[start:start + REPULSION_BLOCK, None, :] - positions[None, :, :]
+            distance2 = np.maximum((delta ** 2).sum(-1), 1e-6)
+            displacement[start:start + REPULSION_BLOCK] += (delta * (k * k / distance2)[..., None]).sum(1)
+        if len(edges):
+            delta = positions[edges[:, 0]] - positions[edges[:, 1]]
+            pull = delta * (np.linalg.norm(delta, axis=1) / k * weights)[:, None]
+            np.add.at(displacement, edges[:, 0], -pull)
+            np.add.at(displacement, edges[:, 1], pull)
+        length = np.maximum(np.linalg.norm(displacement, axis=1), 1e-9)[:, None]
+        temperature = 0.1 * (1.0 - iteration / iterations)
+        positions += displacement / length * np.minimum(length, temperature)
+    positions -= positions.mean(axis=0)
+    radius = np.linalg.norm(positions, axis=1).max()
+    return positions / radius if radius > 0 else positions
+
+
+# Function to place nodes in concentric order (hubs first) for communities too small or too large for a force layout
+def spiral_layout(count):
+    angles = np.arange(count) * np.pi * (3.0 - np.sqrt(5.0))
+    radii = np.sqrt((np.arange(count) + 0.5) / max(count, 1))
+    return np.column_stack([radii * np.cos(angles), radii * np.sin(angles)])
+
+
+# Function to place community centres: the COMMUNITY_LAYOUT_MAX largest communities by a force layout
+# on the community graph, and any smaller ones on a spiral around them, largest first, so the cost
+# stays linear in the number of communities when label propagation leaves thousands of small ones
+def _community_centres(sizes, radii, weights, iterations, seed):
+    count = len(sizes)
+    order = np.argsort(-sizes, kind="stable")
+    major = order[:COMMUNITY_LAYOUT_MAX]
+    local = {int(community): index for index, community in enumerate(major)}
+    major_edges = [(local[a], local[b], weight) for (a, b), weight in weights.items() if a in local and b in local]
+    layout = force_layout(len(major), [(a, b) for a, b, _ in major_edges], [weight for _, _, weight in major_edges], iterations, seed)
+    centres = np.zeros((count, 2))
+    if len(major) > 1:
+        # Spread the centres so neighbouring communities overlap little
+        layout *= 1.5 * radii[major].max() * np.sqrt(len(major))
+    centres[major] = layout
+    minor = order[COMMUNITY_LAYOUT_MAX:]
+    if len(minor):
+        extent = np.linalg.norm(layout, axis=1).max() + radii[major].max()
+        spiral = spiral_layout(count)[len(major):]
+        inner = np.sqrt(len(major) / count)
+        scale = max(1.1 * extent / inner, 2.2 * radii[minor].max() * np.sqrt(count / np.pi))
+        centres[minor] = spiral * scale
+    return centres
+
+
+# Function to lay out the graph in two levels: community centres are placed first (see
+# _community_centres), then each community's members are placed around its centre. Returns an (n, 2)
+# array of coordinates and the community summaries used for the collapsed overview.
+def compute_layout(graph, communities, iterations=DEFAULT_LAYOUT_ITERATIONS, seed=0):
+    if not len(graph):
+        return np.zeros((0, 2)), np.zeros((0, 2)), [], {}
+    community_count = int(communities.max()) + 1
+    members = [[] for _ in range(community_count)]
+    for node, community in enumerate(communities.tolist()):
+        members[community].append(node)
+    weights = {}
+    for source, target, _ in graph.edges:
+        a, b = int(communities[source]), int(communities[target])
+        if a != b:
+            key = (min(a, b), max(a, b))
+            weights[key] = weights.get(key, 0) + 1
+    sizes = np.array([len(nodes) for nodes in members], dtype=np.float64)
+    radii = np.sqrt(sizes) / np.sqrt(sizes.max())
+    centres = _community_centres(sizes, radii, weights, iterations, seed)
+
+    degree = graph.degrees()
+    positions = np.zeros((len(graph), 2))
+    local_edges = [[] for _ in range(community_count)]
+    for source, target, _ in graph.edges:
+        if communities[source] == communities[target] and source != target:
+            local_edges[int(communities[source])].append((source, target))
+    for community, nodes in enumerate(members):
+        if LOCAL_LAYOUT_MIN_NODES <= len(nodes) <= LOCAL_LAYOUT_MAX_NODES:
+            local = {node: index for index, node in enumerate(nodes)}
+            layout = force_layout(len(nodes), [(local[s], local[t]) for s, t in local_edges[community]], iterations=iterations, seed=seed + community)
+        else:
+            nodes = sorted(nodes, key=lambda node: -degree[node])
+            layout = spiral_layout(len(nodes))
+        positions[nodes] = centres[community] + layout * radii[community]
+
+    summaries = []
+    for community, nodes in enumerate(members):
+        hub = max(nodes, key=lambda node: (degree[node], graph.relevance[node]))
+        summaries.append({
+            "label": graph.names[hub],
+            "size": len(nodes),
+            "relevance": round(float(np.mean([graph.relevance[node] for node in nodes])), 3),
+        })
+    return positions, centres, summaries, weights
+
+
+# Function to write the graph as compact column-oriented JSON: node attributes as parallel arrays,
+# edges as a flat [source, target, type, ...] list, plus the collapsed community level of detail
+def export_graph_json(graph, path, iterations=DEFAULT_LAYOUT_ITERATIONS, seed=0):
+    communities = detect_communities(graph, seed=seed) if len(graph) else np.zeros(0, dtype=np.int64)
+    positions, centres, summaries, community_weights = compute_layout(graph, communities, iterations, seed)
+    scale = LAYOUT_SCALE / max(np.abs(positions).max(), 1e-9) if len(graph) else 1.0
+    type_names = sorted(set(graph.types))
+    type_ids = {name: index for index, name in enumerate(type_names)}
+    data = {
+        "version": 1,
+        "names": graph.names,
+        "types": type_names,
+        "node_type": [type_ids[name] for name in graph.types],
+        "relevance": [round(score, 3) for score in graph.relevance],
+        "x": np.rint(positions[:, 0] * scale).astype(int).tolist(),
+        "y": np.rint(positions[:, 1] * scale).astype(int).tolist(),
+        "community": communities.tolist(),
+        "edge_types": graph.edge_types,
+        "edges": [value for edge in graph.edges for value in edge],
+        "communities": [
+            {**summary, "x": int(round(centres[index][0] * scale)), "y": int(round(centres[index][1] * scale))}
+            for index, summary in enumerate(summaries)
+        ],
+        "community_edges": [value for (a, b), weight in community_weights.items() for value in (a, b, weight)],
+    }
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(",", ":"))
+    return data
+
+
+# Function to write the viewer page; it fetches the JSON file after load and draws on a canvas,
+# showing communities when zoomed out and individual entities (only those on screen) when zoomed in
+def write_graph_html(html_path, json_path, title="UECM Knowledge Graph"):
+    data_url = os.path.relpath(json_path, os.path.dirname(os.path.abspath(html_path)) or ".")
+    page = GRAPH_HTML.replace("__TITLE__", title).replace("__DATA_URL__", json.dumps(data_url.replace(os.sep, "/")))
+    with open(html_path, 'w') as f:
+        f.write(page)
+
+
+# Function to compute node coordinates scaled to +/- LAYOUT_SCALE, e.g. for a pyvis page with physics off
+def layout_positions(graph, iterations=DEFAULT_LAYOUT_ITERATIONS, seed=0):
+    if not len(graph):
+        return np.zeros((0, 2), dtype=int)
+    positions, _, _, _ = compute_layout(graph, detect_communities(graph, seed=seed), iterations, seed)
+    return np.rint(positions * LAYOUT_SCALE / max(np.abs(positions).max(), 1e-9)).astype(int)
+
+
+# Function to export a graph as <name>.json plus a lazily loading HTML viewer
+def write_graph_bundle(graph, html_path='UECM_knowledge_graph.html', json_path=None):
+    json_path = json_path or os.path.splitext(html_path)[0] + ".json"
+    data = export_graph_json(graph, json_path)
+    write_graph_html(html_path, json_path)
+    loguru.logger.info(f"Knowledge graph with {len(graph)} nodes, {len(graph.edges)} edges and {len(data['communities'])} communities saved to {html_path} and {json_path}")
+    return data
+
+
+# Function to export a schema's knowledge graph, optionally pruned by relevance, degree and size
+def export_knowledge_graph(schema, html_path='UECM_knowledge_graph.html', json_path=None, min_relevance=None, min_degree=0, max_nodes=None):
+    graph = KnowledgeGraph(schema.get('entities', [])).prune(min_relevance, min_degree, max_nodes)
+    return write_graph_bundle(graph, html_path, json_path)
+
+
+GRAPH_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>__TITLE__</title>
+<style>
+  html, body { margin: 0; height: 100%; background: #222; color: #eee; font: 13px sans-serif; overflow: hidden; }
+  canvas { display: block; }
+  #info { position: absolute; top: 8px; left: 8px; max-width: 360px; background: rgba(0,0,0,0.6); padding: 6px 8px; }
+</style>
+</head>
+<body>
+<canvas id="graph"></canvas>
+<div id="info">Loading graph&hellip;</div>
+<script>
+const DATA_URL = __DATA_URL__;
+const DETAIL_ZOOM = 0.6, LABEL_ZOOM = 1.5, MAX_EDGES = 20000;
+const canvas = document.getElementById("graph"), ctx = canvas.getContext("2d"), info = document.getElementById("info");
+let data = null, view = {x: 0, y: 0, zoom: 0.3}, drag = null;
+
+function colour(score) { return `rgb(${Math.round(255 * (1 - score))},${Math.round(255 * score)},0)`; }
+function toScreen(x, y) { return [(x - view.x) * view.zoom + canvas.width / 2, (y - view.y) * view.zoom + canvas.height / 2]; }
+function toWorld(px, py) { return [(px - canvas.width / 2) / view.zoom + view.x, (py - canvas.height / 2) / view.zoom + view.y]; }
+function visible(px, py) { return px > -20 && py > -20 && px < canvas.width + 20 && py < canvas.height + 20; }
+
+function draw() {
+  canvas.width = window.innerWidth; canvas.height = window.innerHeight;
+  ctx.clearRect(0, 0, canvas.width, canvas.height);
+  if (!data) return;
+  ctx.strokeStyle = "rgba(180,180,180,0.25)";
+  if (view.zoom < DETAIL_ZOOM) {
+    const e = data.community_edges;
+    ctx.beginPath();
+    for (let i = 0; i < e.length; i += 3) {
+      const a = data.communities[e[i]], b = data.communities[e[i + 1]];
+      ctx.moveTo(...toScreen(a.x, a.y)); ctx.lineTo(...toScreen(b.x, b.y));
+    }
+    ctx.stroke();
+    for (const c of data.communities) {
+      const [px, py] = toScreen(c.x, c.y);
+      if (!visible(px, py)) continue;
+      ctx.fillStyle = colour(c.relevance);
+      ctx.beginPath(); ctx.arc(px, py, 3 + Math.sqrt(c.size) * 2, 0, 2 * Math.PI); ctx.fill();
+      ctx.fillStyle = "#eee"; ctx.fillText(`${c.label} (${c.size})`, px + 6, py);
+    }
+    return;
+  }
+  const e = data.edges;
+  let drawn = 0;
+  ctx.beginPath();
+  for (let i = 0; i < e.length && drawn < MAX_EDGES; i += 3) {
+    const [ax, ay] = toScreen(data.x[e[i]], data.y[e[i]]), [bx, by] = toScreen(data.x[e[i + 1]], data.y[e[i + 1]]);
+    if (!visible(ax, ay) && !visible(bx, by)) continue;
+    ctx.moveTo(ax, ay); ctx.lineTo(bx, by); drawn++;
+  }
+  ctx.stroke();
+  for (let n = 0; n < data.names.length; n++) {
+    const [px, py] = toScreen(data.x[n], data.y[n]);
+    if (!visible(px, py)) continue;
+    ctx.fillStyle = colour(data.relevance[n]);
+    ctx.beginPath(); ctx.arc(px, py, 4, 0, 2 * Math.PI); ctx.fill();
+    if (view.zoom >= LABEL_ZOOM) { ctx.fillStyle = "#eee"; ctx.fillText(data.names[n], px + 6, py); }
+  }
+}
+
+function nearest(px, py) {
+  const [wx, wy] = toWorld(px, py);
+  let best = -1, bestDistance = (8 / view.zoom) ** 2;
+  for (let n = 0; n < data.names.length; n++) {
+    const d = (data.x[n] - wx) ** 2 + (data.y[n] - wy) ** 2;
+    if (d < bestDistance) { best = n; bestDistance = d; }
+  }
+  return best;
+}
+
+canvas.addEventListener("wheel", event => {
+  event.preventDefault();
+  const [wx, wy] = toWorld(event.clientX, event.clientY);
+  view.zoom *= event.deltaY < 0 ? 1.2 : 1 / 1.2;
+  const [nx, ny] = toWorld(event.clientX, event.clientY);
+  view.x += wx - nx; view.y += wy - ny;
+  draw();
+}, {passive: false});
+canvas.addEventListener("mousedown", event => { drag = {x: event.clientX, y: event.clientY, moved: false}; });
+canvas.addEventListener("mousemove", event => {
+  if (!drag) return;
+  view.x -= (event.clientX - drag.x) / view.zoom; view.y -= (event.clientY - drag.y) / view.zoom;
+  drag = {x: event.clientX, y: event.clientY, moved: true};
+  draw();
+});
+canvas.addEventListener("mouseup", event => {
+  if (data && drag && !drag.moved && view.zoom >= DETAIL_ZOOM) {
+    const n = nearest(event.clientX, event.clientY);
+    if (n >= 0) info.textContent = `${data.names[n]} | ${data.types[data.node_type[n]]} | relevance ${data.relevance[n]}`;
+  }
+  drag = null;
+});
+window.addEventListener("resize", draw);
+
+window.addEventListener("load", () => {
+  fetch(DATA_URL).then(response => response.json()).then(graph => {
+    data = graph;
+    info.textContent = `${data.names.length} entities, ${data.edges.length / 3} relationships, ${data.communities.length} communities. Scroll to zoom, drag to pan, click an entity for details.`;
+    draw();
+  }).catch(error => {
+    info.textContent = `Could not load ${DATA_URL} (${error}). Browsers block file:// requests; serve this folder, e.g. python -m http.server.`;
+  });
+});
+</script>
+</body>
+</html>
+"""
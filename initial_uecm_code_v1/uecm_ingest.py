@@ -0,0 +1,297 @@
+import os
+import time
+import bisect
+import loguru
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from PyPDF2 import PdfReader
+from bs4 import BeautifulSoup
+import uecm_trace
+
+# PDF limits: pages past PDF_MAX_PAGES are not read, and a document stops extracting after PDF_MAX_SECONDS.
+# In parallel ingestion, PDFs with more than PDF_SPLIT_PAGES pages are extracted PDF_RANGE_PAGES pages per worker.
+PDF_MAX_PAGES = 5000
+PDF_MAX_SECONDS = 600
+PDF_SPLIT_PAGES = 200
+PDF_RANGE_PAGES = 100
+PAGE_SEPARATOR = " "
+
+# Function to recursively ingest files from folders and subfolders
+def ingest_files_from_folders(main_folder, workers=1):
+    if workers != 1:
+        return [text for _, text in iter_ingest_parallel(main_folder, max_workers=workers)]
+    extracted_texts = []
+    for root, _, files in os.walk(main_folder):
+        for filename in files:
+            filepath = os.path.join(root, filename)
+            extension = os.path.splitext(filename)[1]
+            if extension not in FILE_FORMATS:
+                continue
+            with uecm_trace.span("ingest.file", "ingest", format=FILE_FORMATS[extension][0], file=filepath):
+                if filename.endswith(".pdf"):
+                    texts = extract_text_from_pdf(filepath)
+                elif filename.endswith(".txt"):
+                    texts = extract_text_from_text_file(filepath)
+                elif filename.endswith(".md"):
+                    texts = extract_text_from_markdown(filepath)
+                else:
+                    texts = extract_text_from_html(filepath)
+            uecm_trace.count("ingest_files", format=FILE_FORMATS[extension][0])
+            uecm_trace.count("ingest_characters", sum(len(text) for text in texts), format=FILE_FORMATS[extension][0])
+            extracted_texts.extend(texts)
+    return extracted_texts
+
+# Function to extract text from PDFs
+def extract_text_from_pdf(filepath):
+    texts = []
+    try:
+        texts.append(_read_pdf(filepath))
+    except Exception as e:
+        loguru.logger.error(f"Failed to extract text from PDF {filepath}: {e}")
+    return texts
+
+# Function to extract text from plain text files
+def extract_text_from_text_file(filepath):
+    texts = []
+    try:
+        texts.append(_read_text(filepath))
+    except Exception as e:
+        loguru.logger.error(f"Failed to extract text from text file {filepath}: {e}")
+    return texts
+
+# Function to extract text from markdown files
+def extract_text_from_markdown(filepath):
+    texts = []
+    try:
+        texts.append(_read_text(filepath))
+    except Exception as e:
+        loguru.logger.error(f"Failed to extract text from markdown file {filepath}: {e}")
+    return texts
+
+# Function to extract text from HTML files
+def extract_text_from_html(filepath):
+    texts = []
+    try:
+        texts.append(_read_html(filepath))
+    except Exception as e:
+        loguru.logger.error(f"Failed to extract text from HTML file {filepath}: {e}")
+    return texts
+
+# Function to clean the extracted text
+def clean_text(text):
+    text = text.replace('\n', ' ').replace('\r', '')
+    text = ' '.join(text.split())
+    return text
+
+# Text of a paged document. Behaves as the joined string; `page_starts` holds the character offset
+# where each kept page begins and `page_numbers` its 1-based page number, so spans can be mapped back.
+class PagedText(str):
+    def __new__(cls, pages=()):
+        pages = list(pages)
+        text = super().__new__(cls, PAGE_SEPARATOR.join(text for _, text in pages))
+        text.page_numbers = [number for number, _ in pages]
+        text.page_starts = []
+        offset = 0
+        for _, page_text in pages:
+            text.page_starts.append(offset)
+            offset += len(page_text) + len(PAGE_SEPARATOR)
+        return text
+
+    def __reduce__(self):
+        return _paged_text, (str(self), self.page_numbers, self.page_starts)
+
+    # Function to get the page number a character offset falls on (None for an empty document)
+    def page_at(self, offset):
+        index = bisect.bisect_right(self.page_starts, offset) - 1
+        return self.page_numbers[index] if index >= 0 else None
+
+
+def _paged_text(text, page_numbers, page_starts):
+    paged = str.__new__(PagedText, text)
+    paged.page_numbers, paged.page_starts = page_numbers, page_starts
+    return paged
+
+
+def _resolve(obj):
+    return obj.get_object() if hasattr(obj, "get_object") else obj
+
+
+# A page without fonts draws no text; if it also has no form XObjects (which may carry their own
+# fonts) it is image-only or blank, and extract_text can be skipped
+def _page_has_text(page):
+    resources = _resolve(page.get("/Resources")) or {}
+    if resources.get("/Font"):
+        return True
+    xobjects = _resolve(resources.get("/XObject")) or {}
+    return any(_resolve(xobject).get("/Subtype") == "/Form" for xobject in xobjects.values())
+
+
+def pdf_page_count(filepath):
+    return len(PdfReader(filepath).pages)
+
+
+# Function to lazily yield (page number, cleaned text) for pages [start, stop) of a PDF.
+# Image-only and empty pages are skipped; reading stops at max_pages or after max_seconds.
+# An already opened PdfReader can be passed as `reader` to avoid parsing the file twice.
+def iter_pdf_pages(filepath, start=0, stop=None, max_pages=PDF_MAX_PAGES, max_seconds=PDF_MAX_SECONDS, reader=None):
+    reader = reader or PdfReader(filepath)
+    total = len(reader.pages)
+    stop = total if stop is None else min(stop, total)
+    if max_pages is not None and stop > max_pages:
+        loguru.logger.warning(f"{filepath}: reading only the first {max_pages} of {total} pages")
+        stop = max_pages
+    deadline = None if max_seconds is None else time.perf_counter() + max_seconds
+    for index in range(start, stop):
+        if deadline is not None and time.perf_counter() > deadline:
+            loguru.logger.warning(f"{filepath}: stopped at page {index + 1} after {max_seconds}s; pages {index + 1}-{stop} not read")
+            uecm_trace.count("pdf_pages_unread", stop - index)
+            return
+        page = reader.pages[index]
+        if not _page_has_text(page):
+            uecm_trace.count("pdf_pages_skipped")
+            continue
+        text = clean_text(page.extract_text() or "")
+        uecm_trace.count("pdf_pages")
+        if text:
+            yield index + 1, text
+
+def _read_pdf(filepath):
+    return PagedText(iter_pdf_pages(filepath, max_pages=PDF_MAX_PAGES, max_seconds=PDF_MAX_SECONDS))
+
+# Worker entry point for one page range of a split PDF; returns the pages instead of raising
+def _extract_pdf_range(filepath, start, stop, max_seconds):
+    started = time.perf_counter()
+    try:
+        pages, error = list(iter_pdf_pages(filepath, start, stop, max_pages=None, max_seconds=max_seconds)), None
+    except Exception as e:
+        pages, error = [], str(e)
+    return filepath, ".pdf", pages, error, started, time.perf_counter() - started, os.getpid()
+
+def _read_text(filepath):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        return clean_text(file.read())
+
+def _read_html(filepath):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        soup = BeautifulSoup(file, 'html.parser')
+        return clean_text(soup.get_text())
+
+# Supported extensions, the name used in error logs and the reader that raises on failure
+FILE_FORMATS = {
+    ".pdf": ("PDF", _read_pdf),
+    ".txt": ("text file", _read_text),
+    ".md": ("markdown file", _read_text),
+    ".html": ("HTML file", _read_html),
+}
+
+# Function to list every supported file below a folder
+def iter_ingestable_files(main_folder):
+    for root, _, files in os.walk(main_folder):
+        for filename in files:
+            if os.path.splitext(filename)[1] in FILE_FORMATS:
+                yield os.path.join(root, filename)
+
+# Returned by a worker in place of text when a PDF has too many pages for one worker
+class _SplitPDF:
+    def __init__(self, pages):
+        self.pages = pages
+
+# Worker entry point: extract and clean one file, returning the error instead of logging it.
+# A PDF with more than split_pages pages is not read; its page count comes back as a _SplitPDF.
+def _extract_file(filepath, split_pages=None):
+    extension = os.path.splitext(filepath)[1]
+    started = time.perf_counter()
+    try:
+        if extension == ".pdf" and split_pages is not None:
+            reader = PdfReader(filepath)
+            if len(reader.pages) > split_pages:
+                text = _SplitPDF(len(reader.pages))
+            else:
+                text = PagedText(iter_pdf_pages(filepath, max_pages=PDF_MAX_PAGES, max_seconds=PDF_MAX_SECONDS, reader=reader))
+            error = None
+        else:
+            text, error = FILE_FORMATS[extension][1](filepath), None
+    except Exception as e:
+        text, error = None, str(e)
+    return filepath, extension, text, error, started, time.perf_counter() - started, os.getpid()
+
+# Page ranges a split PDF is extracted in, each with its share of the per-document time budget
+def _pdf_ranges(filepath, pages):
+    limit = pages if PDF_MAX_PAGES is None else min(pages, PDF_MAX_PAGES)
+    if limit < pages:
+        loguru.logger.warning(f"{filepath}: reading only the first {limit} of {pages} pages")
+    for start in range(0, limit, PDF_RANGE_PAGES):
+        stop = min(start + PDF_RANGE_PAGES, limit)
+        yield start, stop, None if PDF_MAX_SECONDS is None else PDF_MAX_SECONDS * (stop - start) / limit
+
+# Function to ingest a folder tree with a process pool, yielding (path, text) in completion order.
+# At most max_in_flight files are submitted at once so a slow consumer bounds memory use.
+# PDFs longer than PDF_SPLIT_PAGES are extracted as page ranges on several workers and joined here.
+# Per-format counts of files, errors and extraction seconds are collected into `stats` if given.
+# A split PDF whose page ranges only partly failed is still yielded with the pages that were read;
+# its path is added to `partial` if given, so callers can avoid treating it as fully processed.
+def iter_ingest_parallel(main_folder, max_workers=None, max_in_flight=None, stats=None, filepaths=None, partial=None):
+    max_workers = max_workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or max_workers * 4
+    stats = {} if stats is None else stats
+    filepaths = iter(iter_ingestable_files(main_folder) if filepaths is None else filepaths)
+    split = {}  # path -> pages, ranges still running, worker seconds and errors of a split PDF
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        in_flight = set()
+        exhausted = False
+        while in_flight or not exhausted:
+            while not exhausted and len(in_flight) < max_in_flight:
+                filepath = next(filepaths, None)
+                if filepath is None:
+                    exhausted = True
+                else:
+                    in_flight.add(executor.submit(_extract_file, filepath, PDF_SPLIT_PAGES))
+            if not in_flight:
+                break
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                filepath, extension, text, error, started, seconds, pid = future.result()
+                name = FILE_FORMATS[extension][0]
+                # perf_counter is the system-wide monotonic clock on Linux and macOS, so worker start
+                # times line up with spans recorded in this process
+                span_name = "ingest.pdf_range" if filepath in split else "ingest.file"
+                uecm_trace.add_span(span_name, started, seconds, "ingest", {"format": name, "file": filepath, "error": error},
+                                    thread=f"ingest worker {pid}")
+                if isinstance(text, _SplitPDF):
+                    ranges = list(_pdf_ranges(filepath, text.pages))
+                    split[filepath] = {"pages": [], "remaining": len(ranges), "seconds": seconds, "errors": []}
+                    for start, stop, max_seconds in ranges:
+                        in_flight.add(executor.submit(_extract_pdf_range, filepath, start, stop, max_seconds))
+                    loguru.logger.info(f"Extracting {filepath} ({text.pages} pages) in {len(ranges)} page ranges")
+                    continue
+                if filepath in split:
+                    part = split[filepath]
+                    part["pages"].extend(text)
+                    part["seconds"] += seconds
+                    part["remaining"] -= 1
+                    if error is not None:
+                        part["errors"].append(error)
+                    if part["remaining"]:
+                        continue
+                    del split[filepath]
+                    text, seconds, error = PagedText(sorted(part["pages"])), part["seconds"], None
+                    if part["errors"] and not part["pages"]:
+                        error = "; ".join(part["errors"])
+                    elif part["errors"]:
+                        loguru.logger.warning(f"{filepath}: {len(part['errors'])} page range(s) failed: {'; '.join(part['errors'])}")
+                        uecm_trace.count("ingest_partial_files", format=name)
+                        if partial is not None:
+                            partial.add(filepath)
+                format_stats = stats.setdefault(name, {"files": 0, "errors": 0, "seconds": 0.0})
+                format_stats["files"] += 1
+                format_stats["seconds"] += seconds
+                uecm_trace.count("ingest_files", format=name)
+                if error is not None:
+                    format_stats["errors"] += 1
+                    uecm_trace.count("ingest_errors", format=name)
+                    loguru.logger.error(f"Failed to extract text from {name} {filepath}: {error}")
+                    continue
+                uecm_trace.count("ingest_characters", len(text), format=name)
+                yield filepath, text
+    for name, format_stats in stats.items():
+        loguru.logger.info(f"Ingested {format_stats['files']} {name}(s) with {format_stats['errors']} error(s) "
+                           f"in {format_stats['seconds']:.1f}s of worker time")
@@ -0,0 +1,101 @@
+import json
+
+
+class StreamAbort(ValueError):
+    pass
+
+
+# Incremental parser for a JSON object arriving in chunks.
+#
+# Items of the top-level arrays named in `keys` are returned by feed() as soon as their closing
+# bracket arrives, as (key, item) pairs. Structural errors that make the final document unparseable
+# (text before the opening brace, mismatched brackets, an item that does not decode, anything
+# after the closing brace) raise StreamAbort immediately so the caller can stop the generation.
+class IncrementalJSONItems:
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.length = 0
+        self.chunks = []
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.string_parts = None
+        self.last_string = None
+        self.current_key = None
+        self.tracked_key = None
+        self.item_parts = None
+        self.done = False
+
+    def _fail(self, message):
+        raise StreamAbort(f"{message} at offset {self.length}")
+
+    # Each chunk is scanned once. The text of an item (or of a top-level key string) still being
+    # read is kept as a list of chunk pieces and joined once when it closes, so no buffer is recopied.
+    def feed(self, chunk):
+        items = []
+        self.chunks.append(chunk)
+        offset = self.length
+        item_from = string_from = 0
+        for position, char in enumerate(chunk):
+            self.length = offset + position
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == "\\":
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+                    if self.string_parts is not None:
+                        self.string_parts.append(chunk[string_from:position + 1])
+                        self.last_string = json.loads("".join(self.string_parts))
+                        self.string_parts = None
+                continue
+            if char in " \t\r\n":
+                continue
+            if self.done:
+                self._fail("Unexpected data after the JSON object")
+            if not self.stack and char != "{":
+                self._fail(f"Expected '{{' but got {char!r}")
+            depth = len(self.stack)
+            if char == '"':
+                self.in_string = True
+                if depth == 1:
+                    self.string_parts, string_from = [], position
+            elif char == ":" and depth == 1:
+                self.current_key = self.last_string
+            elif char == "," and depth == 1:
+                self.current_key = None
+            elif char in "{[":
+                if depth == 1 and char == "[" and self.current_key in self.keys:
+                    self.tracked_key = self.current_key
+                elif depth == 2 and self.tracked_key is not None and self.stack[-1] == "[":
+                    self.item_parts, item_from = [], position
+                self.stack.append(char)
+            elif char in "}]":
+                if not self.stack or {"}": "{", "]": "["}[char] != self.stack[-1]:
+                    self._fail(f"Mismatched {char!r}")
+                self.stack.pop()
+                depth = len(self.stack)
+                if depth == 2 and self.item_parts is not None:
+                    self.item_parts.append(chunk[item_from:position + 1])
+                    try:
+                        items.append((self.tracked_key, json.loads("".join(self.item_parts))))
+                    except json.JSONDecodeError as e:
+                        self._fail(f"Invalid {self.tracked_key} item ({e.msg})")
+                    self.item_parts = None
+                elif depth == 1 and char == "]":
+                    self.tracked_key = None
+                elif depth == 0:
+                    self.done = True
+        if self.item_parts is not None:
+            self.item_parts.append(chunk[item_from:])
+        if self.string_parts is not None:
+            self.string_parts.append(chunk[string_from:])
+        self.length = offset + len(chunk)
+        return items
+
+    # Function to parse the complete document once the stream has ended
+    def close(self):
+        if self.in_string or self.stack or not self.done:
+            raise StreamAbort("JSON stream ended before the object was complete")
+        return json.loads("".join(self.chunks))
@@ -0,0 +1,281 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+import loguru
+import requests
+from requests.adapters import HTTPAdapter
+from uecm_llm_cache import LLMCache, request_key
+import uecm_trace
+
+DEFAULT_BASE_URL = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+DEFAULT_MODEL = "llama3.1:latest"
+DEFAULT_TIMEOUT = 300
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+# Set UECM_LLM_CACHE_BYPASS=1 to always call the model; UECM_LLM_CACHE_PATH moves the cache file
+CACHE_BYPASS = os.environ.get("UECM_LLM_CACHE_BYPASS", "") not in ("", "0", "false")
+
+
+class LLMError(Exception):
+    pass
+
+
+# Function to decide whether a response may be cached: a format="json" answer is only kept if its
+# text parses, so a truncated or malformed answer is retried next time instead of replayed
+def _cacheable(format, result):
+    if format != "json":
+        return True
+    try:
+        json.loads(result.get("response", ""))
+    except (json.JSONDecodeError, AttributeError, TypeError):
+        loguru.logger.warning("Not caching an LLM response that is not valid JSON")
+        return False
+    return True
+
+
+# Shared client for the Ollama /api/generate endpoint.
+#
+# One keep-alive requests.Session is pooled across threads, at most max_concurrency calls are in
+# flight at once, and 5xx responses, timeouts and dropped connections are retried with
+# exponential backoff. Every call records its latency and prompt/completion token counts.
+# `generate` is blocking; `agenerate` and `agenerate_many` are the asyncio API over the same pool.
+# With an LLMCache attached, identical requests (model, prompt, format, options and extra fields) are answered from
+# disk; bypass_cache on the client or the call skips the lookup but still refreshes the entry.
+class OllamaClient:
+    def __init__(self, base_url=DEFAULT_BASE_URL, model=DEFAULT_MODEL, timeout=DEFAULT_TIMEOUT,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF,
+                 cache=None, bypass_cache=False):
+        if not base_url.startswith("http"):
+            base_url = f"http://{base_url}"
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._async_semaphores = {}
+        self._metrics_lock = threading.Lock()
+        self.calls = deque(maxlen=1000)
+        self.totals = {"calls": 0, "errors": 0, "retries": 0, "seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+                       "cache_hits": 0, "cache_misses": 0}
+
+    def _payload(self, prompt, model, format, options, extra):
+        payload = {"model": model or self.model, "prompt": prompt, "stream": False}
+        if format:
+            payload["format"] = format
+        if options:
+            payload["options"] = options
+        payload.update(extra)
+        return payload
+
+    def _record(self, model, started, attempts, result, error=None):
+        latency = time.perf_counter() - started
+        call = {
+            "model": model,
+            "latency": latency,
+            "attempts": attempts,
+            "prompt_tokens": (result or {}).get("prompt_eval_count", 0),
+            "completion_tokens": (result or {}).get("eval_count", 0),
+            "error": error,
+        }
+        with self._metrics_lock:
+            self.calls.append(call)
+            self.totals["calls"] += 1
+            self.totals["retries"] += attempts - 1
+            self.totals["seconds"] += latency
+            self.totals["prompt_tokens"] += call["prompt_tokens"]
+            self.totals["completion_tokens"] += call["completion_tokens"]
+            if error:
+                self.totals["errors"] += 1
+        uecm_trace.add_span("llm.generate", started, latency, "llm", {key: value for key, value in call.items() if key != "latency"})
+        uecm_trace.count("llm_calls", model=model)
+        uecm_trace.count("llm_prompt_tokens", call["prompt_tokens"], model=model)
+        uecm_trace.count("llm_completion_tokens", call["completion_tokens"], model=model)
+        if error:
+            uecm_trace.count("llm_errors", model=model)
+        loguru.logger.debug(f"LLM call to {model}: {latency:.2f}s, {attempts} attempt(s), "
+                            f"{call['prompt_tokens']} prompt / {call['completion_tokens']} completion tokens")
+
+    # Function to POST a payload with retries on 5xx, timeouts and connection errors
+    def _post(self, path, payload):
+        started = time.perf_counter()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                response = self.session.post(f"{self.base_url}{path}", json=payload, timeout=self.timeout)
+                if response.status_code < 500:
+                    break
+                error = f"HTTP {response.status_code}"
+            except (requests.Timeout, requests.ConnectionError) as e:
+                error = f"{type(e).__name__}: {e}"
+            if attempt > self.max_retries:
+                self._record(payload["model"], started, attempt, None, error)
+                raise LLMError(f"LLM request failed after {attempt} attempts: {error}")
+            delay = self.backoff * 2 ** (attempt - 1) * (0.5 + random.random() / 2)
+            loguru.logger.warning(f"LLM request failed ({error}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+        if response.status_code != 200:
+            self._record(payload["model"], started, attempt, None, f"HTTP {response.status_code}")
+            raise LLMError(f"LLM request failed with HTTP {response.status_code}: {response.text[:200]}")
+        try:
+            result = response.json()
+        except ValueError as e:
+            self._record(payload["model"], started, attempt, None, "invalid JSON")
+            raise LLMError(f"LLM response is not valid JSON: {e}") from e
+        if not isinstance(result, dict):
+            self._record(payload["model"], started, attempt, None, "invalid JSON")
+            raise LLMError(f"LLM response is {type(result).__name__}, expected a JSON object")
+        self._record(payload["model"], started, attempt, result)
+        return result
+
+    # Function to run one non-streaming generation; returns Ollama's response dict
+    def generate(self, prompt, model=None, format=None, options=None, bypass_cache=False, **extra):
+        payload = self._payload(prompt, model, format, options, extra)
+        key = None if self.cache is None else request_key(payload["model"], prompt, format, options, extra)
+        if key is not None and not (bypass_cache or self.bypass_cache):
+            cached = self.cache.get(key)
+            with self._metrics_lock:
+                self.totals["cache_hits" if cached is not None else "cache_misses"] += 1
+            uecm_trace.count("llm_cache_hits" if cached is not None else "llm_cache_misses", model=payload["model"])
+            if cached is not None:
+                return cached
+        with self._semaphore:
+            result = self._post("/api/generate", payload)
+        if key is not None and _cacheable(format, result):
+            self.cache.put(key, payload["model"], result)
+        return result
+
+    # Function to stream a generation, yielding response text chunks as Ollama produces them.
+    # Retries only happen before the first chunk; closing the generator early closes the HTTP
+    # response, which stops the generation on the server. A cached response is replayed as one chunk.
+    def stream_generate(self, prompt, model=None, format=None, options=None, bypass_cache=False, **extra):
+        payload = self._payload(prompt, model, format, options, extra)
+        payload["stream"] = True
+        key = None if self.cache is None else request_key(payload["model"], prompt, format, options, extra)
+        if key is not None and not (bypass_cache or self.bypass_cache):
+            cached = self.cache.get(key)
+            with self._metrics_lock:
+                self.totals["cache_hits" if cached is not None else "cache_misses"] += 1
+            uecm_trace.count("llm_cache_hits" if cached is not None else "llm_cache_misses", model=payload["model"])
+            if cached is not None:
+                yield cached.get("response", "")
+                return
+        with self._semaphore:
+            started = time.perf_counter()
+            attempt = 0
+            while True:
+                attempt += 1
+                try:
+                    response = self.session.post(f"{self.base_url}/api/generate", json=payload, timeout=self.timeout, stream=True)
+                    if response.status_code < 500:
+                        break
+                    error = f"HTTP {response.status_code}"
+                    response.close()
+                except (requests.Timeout, requests.ConnectionError) as e:
+                    error = f"{type(e).__name__}: {e}"
+                if attempt > self.max_retries:
+                    self._record(payload["model"], started, attempt, None, error)
+                    raise LLMError(f"LLM request failed after {attempt} attempts: {error}")
+                delay = self.backoff * 2 ** (attempt - 1) * (0.5 + random.random() / 2)
+                loguru.logger.warning(f"LLM request failed ({error}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+            with response:
+                if response.status_code != 200:
+                    self._record(payload["model"], started, attempt, None, f"HTTP {response.status_code}")
+                    raise LLMError(f"LLM request failed with HTTP {response.status_code}: {response.text[:200]}")
+                parts = []
+                final = {}
+                completed = False
+                try:
+                    for line in response.iter_lines():
+                        if not line:
+                            continue
+                        try:
+                            message = json.loads(line)
+                        except ValueError as e:
+                            raise LLMError(f"LLM stream sent a line that is not valid JSON: {e}") from e
+                        if not isinstance(message, dict):
+                            raise LLMError(f"LLM stream sent {type(message).__name__}, expected a JSON object")
+                        if "error" in message:
+                            raise LLMError(f"LLM stream failed: {message['error']}")
+                        chunk = message.get("response", "")
+                        if chunk:
+                            parts.append(chunk)
+                            yield chunk
+                        if message.get("done"):
+                            final = message
+                            completed = True
+                            break
+                finally:
+                    self._record(payload["model"], started, attempt, final, None if completed else "stream closed early")
+        if key is not None and completed:
+            result = {**final, "response": "".join(parts)}
+            if _cacheable(format, result):
+                self.cache.put(key, payload["model"], result)
+
+    # Function to run a generation and parse its "response" field as JSON
+    def generate_json(self, prompt, model=None, options=None, bypass_cache=False, **extra):
+        result = self.generate(prompt, model=model, format="json", options=options, bypass_cache=bypass_cache, **extra)
+        try:
+            return json.loads(result.get("response", "{}"))
+        except json.JSONDecodeError as e:
+            raise LLMError(f"LLM response is not valid JSON: {e}") from e
+
+    def _async_semaphore(self):
+        loop = asyncio.get_running_loop()
+        if loop not in self._async_semaphores:
+            self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return self._async_semaphores[loop]
+
+    async def agenerate(self, prompt, model=None, format=None, options=None, bypass_cache=False, **extra):
+        async with self._async_semaphore():
+            return await asyncio.to_thread(self.generate, prompt, model, format, options, bypass_cache, **extra)
+
+    # Function to run many generations concurrently; failed calls come back as LLMError instances
+    async def agenerate_many(self, prompts, model=None, format=None, options=None, **extra):
+        return await asyncio.gather(*(self.agenerate(prompt, model, format, options, **extra) for prompt in prompts),
+                                    return_exceptions=True)
+
+    def metrics(self):
+        with self._metrics_lock:
+            totals = dict(self.totals)
+        totals["mean_latency"] = totals["seconds"] / totals["calls"] if totals["calls"] else 0.0
+        return totals
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+# Function to get the process-wide shared client
+def get_client():
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            cache = LLMCache(os.environ.get("UECM_LLM_CACHE_PATH", "uecm_llm_cache.sqlite"))
+            _default_client = OllamaClient(cache=cache, bypass_cache=CACHE_BYPASS)
+        return _default_client
+
+
+# Function to replace the process-wide shared client, e.g. to point every caller at another server
+def set_client(client):
+    global _default_client
+    with _default_client_lock:
+        _default_client = client
+    return client
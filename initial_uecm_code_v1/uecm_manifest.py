@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import loguru
+from uecm_ingest import iter_ingestable_files
+
+DEFAULT_MANIFEST_PATH = "UECM_preflight_unstructured.manifest.json"
+MANIFEST_VERSION = 1
+
+
+# Function to hash a file's bytes without reading it into memory at once
+def file_hash(filepath, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Function to load a manifest, returning an empty one when it is missing, unreadable or was
+# produced with different NER settings (model, labels, threshold, windows)
+def load_manifest(path, settings):
+    empty = {"version": MANIFEST_VERSION, "settings": settings, "files": {}, "raw_entities": {}}
+    if not os.path.exists(path):
+        return empty
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+    except Exception as e:
+        loguru.logger.error(f"Failed to load manifest {path}, processing all files: {e}")
+        return empty
+    if manifest.get("version") != MANIFEST_VERSION or manifest.get("settings") != settings:
+        loguru.logger.info("NER settings changed since the last run, processing all files")
+        return empty
+    return manifest
+
+
+def save_manifest(manifest, path):
+    try:
+        with open(path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        loguru.logger.info(f"Manifest saved to '{path}'")
+    except Exception as e:
+        loguru.logger.error(f"Failed to save manifest: {e}")
+
+
+# Function to compare a folder against the manifest.
+# Returns (new, changed, deleted) relative paths; files whose mtime or size moved but whose hash
+# did not are refreshed in place and treated as unchanged.
+def scan_changes(main_folder, manifest):
+    files = manifest["files"]
+    seen = set()
+    new, changed = [], []
+    for filepath in iter_ingestable_files(main_folder):
+        relpath = os.path.relpath(filepath, main_folder)
+        seen.add(relpath)
+        stat = os.stat(filepath)
+        entry = files.get(relpath)
+        if entry is None:
+            new.append(relpath)
+        elif entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            if entry["hash"] == file_hash(filepath):
+                entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            else:
+                changed.append(relpath)
+    deleted = [relpath for relpath in files if relpath not in seen]
+    return new, changed, deleted
+
+
+# Function to subtract (sign=-1) or add (sign=1) one file's counts to the running totals
+def apply_counts(totals, counts, sign):
+    for entity_name, count in counts.items():
+        total = totals.get(entity_name, 0) + sign * count
+        if total > 0:
+            totals[entity_name] = total
+        else:
+            totals.pop(entity_name, None)
+    return totals
+
+
+# Function to bring a manifest up to date with a folder.
+# `process` is called with the absolute paths to (re)process and must yield (path, counts);
+# counts of deleted and changed files are removed from raw_entities before new counts are added.
+# Files `process` does not yield (extraction errors, no text) are recorded with empty counts, so
+# they are only retried once their contents change. Files yielded with counts=None failed part way
+# (e.g. a NER batch raised) and are left out of the manifest so the next run retries them.
+def update_manifest(main_folder, manifest, process):
+    new, changed, deleted = scan_changes(main_folder, manifest)
+    loguru.logger.info(f"Incremental run: {len(new)} new, {len(changed)} changed, {len(deleted)} deleted, "
+                       f"{len(manifest['files']) - len(changed) - len(deleted)} unchanged files")
+    totals = manifest["raw_entities"]
+    for relpath in changed + deleted:
+        apply_counts(totals, manifest["files"].pop(relpath)["counts"], -1)
+    to_process = [os.path.join(main_folder, relpath) for relpath in new + changed]
+    if to_process:
+        failed = set()
+        for filepath, counts in process(to_process):
+            if counts is None:
+                failed.add(os.path.relpath(filepath, main_folder))
+                continue
+            record_file(manifest, main_folder, filepath, counts)
+            apply_counts(totals, counts, 1)
+        if failed:
+            loguru.logger.warning(f"{len(failed)} file(s) failed and were left out of the manifest; they are retried on the next run")
+        skipped = [filepath for filepath in to_process if os.path.relpath(filepath, main_folder) not in manifest["files"]
+                   and os.path.relpath(filepath, main_folder) not in failed and os.path.exists(filepath)]
+        for filepath in skipped:
+            record_file(manifest, main_folder, filepath, {})
+        if skipped:
+            loguru.logger.info(f"Recorded {len(skipped)} file(s) without extractable text; they are retried when they change")
+    return manifest
+
+
+def record_file(manifest, main_folder, filepath, counts):
+    stat = os.stat(filepath)
+    manifest["files"][os.path.relpath(filepath, main_folder)] = {
+        "mtime": stat.st_mtime,
+        "size": stat.st_size,
+        "hash": file_hash(filepath),
+        "counts": counts,
+    }
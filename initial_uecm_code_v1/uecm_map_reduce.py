@@ -0,0 +1,78 @@
+import json
+
+# Rough characters-per-token ratio for llama-style tokenizers, used to budget prompt sizes
+CHARS_PER_TOKEN = 4
+DEFAULT_SHARD_TOKENS = 1500
+
+
+# Function to estimate how many tokens a JSON-serialized value takes in a prompt
+def estimate_tokens(value):
+    text = value if isinstance(value, str) else json.dumps(value, indent=2)
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+# Function to split an entity count dict into shards that each fit a token budget.
+# Entities are ordered by descending count, so the first shard always holds the most frequent ones.
+def shard_entities(entities, max_tokens=DEFAULT_SHARD_TOKENS):
+    shards = []
+    shard, shard_tokens = {}, 0
+    for entity_name, count in sorted(entities.items(), key=lambda item: (-item[1], item[0])):
+        entry_tokens = estimate_tokens(f'  "{entity_name}": {count},\n')
+        if shard and shard_tokens + entry_tokens > max_tokens:
+            shards.append(shard)
+            shard, shard_tokens = {}, 0
+        shard[entity_name] = count
+        shard_tokens += entry_tokens
+    if shard:
+        shards.append(shard)
+    return shards
+
+
+# Function to merge strings from several shards, ranked by how many shards mention them
+def _merge_ranked_strings(lists):
+    first_seen, mentions, display = {}, {}, {}
+    for values in lists:
+        for value in values or []:
+            if not isinstance(value, str) or not value.strip():
+                continue
+            key = value.strip().lower()
+            first_seen.setdefault(key, len(first_seen))
+            mentions[key] = mentions.get(key, 0) + 1
+            display.setdefault(key, value.strip())
+    return [display[key] for key in sorted(first_seen, key=lambda key: (-mentions[key], first_seen[key]))]
+
+
+# Function to reduce per-shard entity analyses into one with the same JSON shape.
+# Duplicate relevant entities keep their highest score; concepts and focus areas are deduplicated.
+def merge_entity_analyses(analyses, unable="Unable to assess"):
+    usable = [analysis for analysis in analyses if analysis and analysis.get("data_quality_assessment") != unable]
+    if not usable:
+        return {
+            "relevant_entities": [],
+            "key_concepts": [],
+            "suggested_focus_areas": [],
+            "data_quality_assessment": unable
+        }
+    relevant = {}
+    for analysis in usable:
+        for item in analysis.get("relevant_entities") or []:
+            if not isinstance(item, dict) or "entity" not in item:
+                continue
+            try:
+                score = float(item.get("relevance_score", 0))
+            except (TypeError, ValueError):
+                score = 0.0
+            current = relevant.get(item["entity"])
+            if current is None or score > current["relevance_score"]:
+                relevant[item["entity"]] = {**item, "relevance_score": score}
+    assessments = []
+    for analysis in usable:
+        assessment = analysis.get("data_quality_assessment")
+        if isinstance(assessment, str) and assessment and assessment not in assessments:
+            assessments.append(assessment)
+    return {
+        "relevant_entities": sorted(relevant.values(), key=lambda item: -item["relevance_score"]),
+        "key_concepts": _merge_ranked_strings(analysis.get("key_concepts") for analysis in usable),
+        "suggested_focus_areas": _merge_ranked_strings(analysis.get("suggested_focus_areas") for analysis in usable),
+        "data_quality_assessment": " ".join(assessments)
+    }
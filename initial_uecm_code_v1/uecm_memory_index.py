@@ -0,0 +1,263 @@
+import re
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+WORD_PATTERN = re.compile(r"\w+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from", "how", "in", "is", "it",
+    "of", "on", "or", "the", "to", "what", "which", "who", "with",
+}
+DEFAULT_MAX_NGRAM = 3
+
+
+# Function to split text into lowercased word tokens
+def tokenize(text):
+    return WORD_PATTERN.findall(text.lower())
+
+
+# Inverted index from entity-name tokens, lemmas and word n-grams to entity names.
+#
+# Built once per schema; lookups cost O(query tokens) instead of scanning every entity for every
+# token. Whole entity names are also matched as phrases anywhere in the query, with an Aho-Corasick
+# automaton when pyahocorasick is installed and an n-gram table otherwise.
+class EntityIndex:
+    def __init__(self, entities, nlp=None, max_ngram=DEFAULT_MAX_NGRAM):
+        self.entities = entities
+        self.max_ngram = max_ngram
+        self.postings = {}
+        self.name_terms = {}
+        self.phrases = {}
+        names = list(entities)
+        lemmas = self._lemmatize(names, nlp)
+        for name, name_lemmas in zip(names, lemmas):
+            tokens = tokenize(name)
+            if len(name_lemmas) != len(tokens):
+                name_lemmas = tokens
+            # Each content word of the name matches through its surface form or its lemma
+            forms = [frozenset((token, lemma)) for token, lemma in zip(tokens, name_lemmas) if token not in STOPWORDS]
+            forms = forms or [frozenset((token,)) for token in tokens]
+            self.name_terms[name] = forms
+            for form in forms:
+                for term in form:
+                    self.postings.setdefault(term, set()).add(name)
+            for size in range(2, min(max_ngram, len(tokens)) + 1):
+                for start in range(len(tokens) - size + 1):
+                    self.postings.setdefault(" ".join(tokens[start:start + size]), set()).add(name)
+            if tokens:
+                self.phrases.setdefault(" ".join(tokens), set()).add(name)
+        self.automaton = None
+        if ahocorasick is not None and self.phrases:
+            self.automaton = ahocorasick.Automaton()
+            for phrase, phrase_names in self.phrases.items():
+                self.automaton.add_word(f" {phrase} ", (phrase, phrase_names))
+            self.automaton.make_automaton()
+        self.longest_phrase = max((len(phrase.split()) for phrase in self.phrases), default=0)
+
+    @staticmethod
+    def _lemmatize(names, nlp):
+        if nlp is None:
+            return [[] for _ in names]
+        lemmas = []
+        for doc in nlp.pipe(names, disable=["parser", "ner"]):
+            name_lemmas = []
+            for token in doc:
+                name_lemmas.extend(tokenize(token.lemma_) if len(tokenize(token.text)) == 1 else tokenize(token.text))
+            lemmas.append(name_lemmas)
+        return lemmas
+
+    # Function to collect the query's terms (tokens plus lemmas when a spaCy doc is given)
+    def _query_terms(self, query):
+        if hasattr(query, "text") and hasattr(query, "__iter__"):
+            terms = set()
+            for token in query:
+                if token.is_punct or token.is_space:
+                    continue
+                text = token.text.lower()
+                if text in STOPWORDS or token.is_stop:
+                    continue
+                terms.update(tokenize(text))
+                terms.update(tokenize(token.lemma_.lower()))
+            return terms, query.text
+        return {token for token in tokenize(query) if token not in STOPWORDS}, query
+
+    def _phrase_matches(self, text):
+        tokens = tokenize(text)
+        if self.automaton is not None:
+            matches = set()
+            for _, (_, phrase_names) in self.automaton.iter(f" {' '.join(tokens)} "):
+                matches.update(phrase_names)
+            return matches
+        matches = set()
+        for size in range(1, min(self.longest_phrase, len(tokens)) + 1):
+            for start in range(len(tokens) - size + 1):
+                matches.update(self.phrases.get(" ".join(tokens[start:start + size]), ()))
+        return matches
+
+    # Function to find entities for a query string or spaCy doc.
+    # Returns deduplicated (entity, score) pairs, best first; a score is the share of the entity
+    # name's terms found in the query, or 1.0 when the whole name appears as a phrase.
+    def lookup(self, query, min_score=0.0):
+        terms, text = self._query_terms(query)
+        tokens = tokenize(text)
+        for size in range(2, self.max_ngram + 1):
+            for start in range(len(tokens) - size + 1):
+                terms.add(" ".join(tokens[start:start + size]))
+        hits = {}
+        for term in terms:
+            for name in self.postings.get(term, ()):
+                hits.setdefault(name, set()).add(term)
+        scores = {}
+        for name, matched in hits.items():
+            forms = self.name_terms[name]
+            covered = sum(1 for form in forms if form & matched)
+            scores[name] = covered / len(forms) if forms else 0.0
+            if not covered:
+                # Matched only through an n-gram that spans stopwords
+                scores[name] = 1.0 / max(len(forms), 1)
+        for name in self._phrase_matches(text):
+            scores[name] = 1.0
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.entities[name], score) for name, score in ranked if score > min_score]
+
+
+DEFAULT_MAX_DEPTH = 3
+DEFAULT_MAX_PATHS = 50
+
+
+# Adjacency index over the relationships of a merged UECM schema.
+#
+# Edges are indexed by source, by (source, relationship type), by target and by (target,
+# relationship type), so typed neighbour lookups in either direction are dictionary hits.
+# Names are matched case-insensitively. traverse() and find_paths() walk the graph breadth-first
+# with a depth limit for multi-hop questions such as drug -> mechanism -> gene -> disease.
+class RelationshipGraph:
+    def __init__(self, entities):
+        self.entities = {entity['name']: entity for entity in entities}
+        self.canonical = {}
+        self.outgoing = {}
+        self.incoming = {}
+        self.outgoing_by_type = {}
+        self.incoming_by_type = {}
+        for entity in entities:
+            self._name(entity['name'])
+        for entity in entities:
+            source = self._name(entity['name'])
+            for relationship in entity.get('relationships') or []:
+                if not isinstance(relationship, dict) or not relationship.get('target'):
+                    continue
+                target = self._name(relationship['target'])
+                edge = {
+                    "source": source,
+                    "target": target,
+                    "type": relationship.get('type', ''),
+                    "description": relationship.get('description', ''),
+                }
+                rel_type = edge["type"].lower()
+                self.outgoing.setdefault(source, []).append(edge)
+                self.incoming.setdefault(target, []).append(edge)
+                self.outgoing_by_type.setdefault((source, rel_type), []).append(edge)
+                self.incoming_by_type.setdefault((target, rel_type), []).append(edge)
+
+    def _name(self, name):
+        return self.canonical.setdefault(name.lower(), name)
+
+    def resolve(self, name):
+        return self.canonical.get(name.lower())
+
+    # Function to list edges touching a node, optionally limited to one relationship type
+    def edges(self, name, rel_type=None, direction="out"):
+        name = self.resolve(name)
+        if name is None:
+            return []
+        found = []
+        if direction in ("out", "both"):
+            found += self.outgoing.get(name, []) if rel_type is None else self.outgoing_by_type.get((name, rel_type.lower()), [])
+        if direction in ("in", "both"):
+            found += self.incoming.get(name, []) if rel_type is None else self.incoming_by_type.get((name, rel_type.lower()), [])
+        return found
+
+    # Function to list (neighbour, edge) pairs, optionally filtered by the neighbour's entity type
+    def neighbors(self, name, rel_type=None, direction="out", entity_type=None):
+        name = self.resolve(name)
+        pairs = []
+        for edge in self.edges(name, rel_type, direction) if name else []:
+            neighbor = edge["target"] if edge["source"] == name else edge["source"]
+            if entity_type is not None and self.entities.get(neighbor, {}).get('type', '').lower() != entity_type.lower():
+                continue
+            pairs.append((neighbor, edge))
+        return pairs
+
+    # Function to find a node's edges whose target or type mentions a keyword (e.g. "mechanism")
+    def edges_matching(self, name, keyword, direction="out"):
+        keyword = keyword.lower()
+        return [edge for edge in self.edges(name, direction=direction)
+                if keyword in edge["type"].lower() or keyword in edge["target"].lower()]
+
+    # Function to walk outward from a node; returns every path (a list of edges) up to max_depth.
+    # `rel_types` may give one relationship type per hop, e.g. ["targets", "encoded_by", "associated_with"].
+    def traverse(self, start, max_depth=DEFAULT_MAX_DEPTH, rel_types=None, direction="out", max_paths=DEFAULT_MAX_PATHS):
+        start = self.resolve(start)
+        if start is None:
+            return []
+        if rel_types is not None:
+            max_depth = min(max_depth, len(rel_types))
+        paths = []
+        frontier = [(start, [], {start})]
+        for depth in range(max_depth):
+            next_frontier = []
+            rel_type = rel_types[depth] if rel_types is not None else None
+            for node, path, visited in frontier:
+                for neighbor, edge in self.neighbors(node, rel_type, direction):
+                    if neighbor in visited:
+                        continue
+                    extended = path + [edge]
+                    if rel_types is None or depth == len(rel_types) - 1:
+                        paths.append(extended)
+                        if len(paths) >= max_paths:
+                            return paths
+                    next_frontier.append((neighbor, extended, visited | {neighbor}))
+            frontier = next_frontier
+        return paths
+
+    # Function to find the shortest connecting paths between two nodes, ignoring edge direction
+    def find_paths(self, source, target, max_depth=DEFAULT_MAX_DEPTH + 1, max_paths=DEFAULT_MAX_PATHS):
+        source, target = self.resolve(source), self.resolve(target)
+        if source is None or target is None or source == target:
+            return []
+        paths = []
+        frontier = [(source, [], {source})]
+        for _ in range(max_depth):
+            next_frontier = []
+            for node, path, visited in frontier:
+                for neighbor, edge in self.neighbors(node, direction="both"):
+                    if neighbor in visited:
+                        continue
+                    if neighbor == target:
+                        paths.append(path + [edge])
+                        if len(paths) >= max_paths:
+                            return paths
+                    else:
+                        next_frontier.append((neighbor, path + [edge], visited | {neighbor}))
+            if paths:
+                return paths
+            frontier = next_frontier
+        return paths
+
+
+# Function to render a path of edges walked from `start` as "A -[type]-> B <-[type]- C"
+def format_path(path, start=None):
+    if not path:
+        return ""
+    node = start or path[0]["source"]
+    parts = [node]
+    for edge in path:
+        if edge["source"] == node:
+            parts.append(f"-[{edge['type']}]-> {edge['target']}")
+            node = edge["target"]
+        else:
+            parts.append(f"<-[{edge['type']}]- {edge['source']}")
+            node = edge["source"]
+    return " ".join(parts)
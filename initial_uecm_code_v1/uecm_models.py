@@ -0,0 +1,96 @@
+import threading
+import time
+import loguru
+
+DEFAULT_GLINER_MODEL = "urchade/gliner_small-v2.1"
+DEFAULT_SPACY_MODEL = "en_core_web_sm"
+DEFAULT_SENTENCE_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _load_gliner(name):
+    from gliner import GLiNER
+    return GLiNER.from_pretrained(name)
+
+
+def _load_spacy(name):
+    import spacy
+    return spacy.load(name)
+
+
+def _load_sentence_model(name):
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(name, device="cpu")
+
+
+LOADERS = {
+    "gliner": _load_gliner,
+    "spacy": _load_spacy,
+    "sentence": _load_sentence_model,
+}
+
+
+# Process-wide registry of loaded models.
+#
+# Models are loaded on first request and kept for the life of the process, so every caller (and
+# every request in service mode) shares one warm instance per (kind, name). Heavy libraries are only
+# imported by the loaders above. register() installs a ready-made instance, e.g. a stub model in a
+# benchmark or a model that was loaded elsewhere.
+def get_model(kind, name):
+    key = (kind, name)
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    with lock:
+        model = _models.get(key)
+        if model is None:
+            started = time.perf_counter()
+            model = LOADERS[kind](name)
+            _models[key] = model
+            loguru.logger.info(f"Loaded {kind} model {name} in {time.perf_counter() - started:.1f}s")
+    return model
+
+
+def register(kind, name, model):
+    _models[(kind, name)] = model
+
+
+def unload(kind=None, name=None):
+    for key in list(_models):
+        if (kind is None or key[0] == kind) and (name is None or key[1] == name):
+            del _models[key]
+
+
+def is_loaded(kind, name):
+    return (kind, name) in _models
+
+
+# Stand-in that loads the real model on first attribute access, for code that may never need it
+# (e.g. a NER run served entirely from the span cache)
+class LazyModel:
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+
+    def __getattr__(self, attribute):
+        return getattr(get_model(self.kind, self.name), attribute)
+
+    def __call__(self, *args, **kwargs):
+        return get_model(self.kind, self.name)(*args, **kwargs)
+
+
+def get_gliner(name=DEFAULT_GLINER_MODEL, lazy=False):
+    return LazyModel("gliner", name) if lazy else get_model("gliner", name)
+
+
+def get_spacy(name=DEFAULT_SPACY_MODEL, lazy=False):
+    return LazyModel("spacy", name) if lazy else get_model("spacy", name)
+
+
+def get_sentence_model(name=DEFAULT_SENTENCE_MODEL, lazy=False):
+    return LazyModel("sentence", name) if lazy else get_model("sentence", name)
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+import loguru
+
+DEFAULT_CACHE_PATH = "uecm_ner_cache.sqlite"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Spans are stored down to this score so any threshold the pre-flight accepts (0.1 to 1.0) can be
+# applied at read time without re-running the model
+CACHE_FLOOR_THRESHOLD = 0.1
+
+
+# Function to hash a document for cache lookups
+def document_hash(text):
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+# Content-addressed store of raw GLiNER spans keyed by (document hash, model id, label set).
+# Entries carry their compressed size and last access time; once the total size passes
+# max_bytes the least recently used entries are evicted.
+class NERCache:
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES, floor_threshold=CACHE_FLOOR_THRESHOLD):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.floor_threshold = floor_threshold
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS ner_spans (
+            doc_hash TEXT NOT NULL,
+            model_id TEXT NOT NULL,
+            labels TEXT NOT NULL,
+            spans BLOB NOT NULL,
+            size INTEGER NOT NULL,
+            last_access REAL NOT NULL,
+            PRIMARY KEY (doc_hash, model_id, labels))""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ner_spans_last_access ON ner_spans (last_access)")
+        self._conn.commit()
+
+    @staticmethod
+    def labels_key(labels):
+        return json.dumps(sorted(labels))
+
+    # Return cached spans at or above `threshold`, or None on a miss. Spans below floor_threshold
+    # are never stored, so a lower threshold is always a miss and the caller re-runs the model.
+    def get(self, doc_hash, model_id, labels, threshold=None):
+        if threshold is not None and threshold < self.floor_threshold:
+            return None
+        labels_key = self.labels_key(labels)
+        with self._lock:
+            row = self._conn.execute("SELECT spans FROM ner_spans WHERE doc_hash = ? AND model_id = ? AND labels = ?",
+                                     (doc_hash, model_id, labels_key)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE ner_spans SET last_access = ? WHERE doc_hash = ? AND model_id = ? AND labels = ?",
+                               (time.time(), doc_hash, model_id, labels_key))
+            self._conn.commit()
+        spans = json.loads(zlib.decompress(row[0]))
+        if threshold is not None:
+            spans = [span for span in spans if span["score"] >= threshold]
+        return spans
+
+    def put(self, doc_hash, model_id, labels, spans):
+        spans = [span for span in spans if span["score"] >= self.floor_threshold]
+        blob = zlib.compress(json.dumps(spans, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO ner_spans VALUES (?, ?, ?, ?, ?, ?)",
+                               (doc_hash, model_id, self.labels_key(labels), blob, len(blob), time.time()))
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ner_spans").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for doc_hash, model_id, labels, size in self._conn.execute(
+                "SELECT doc_hash, model_id, labels, size FROM ner_spans ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM ner_spans WHERE doc_hash = ? AND model_id = ? AND labels = ?",
+                               (doc_hash, model_id, labels))
+            total -= size
+            evicted += 1
+        self._conn.commit()
+        loguru.logger.info(f"Evicted {evicted} NER cache entries to stay under {self.max_bytes} bytes")
+
+    def size_bytes(self):
+        with self._lock:
+            return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ner_spans").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
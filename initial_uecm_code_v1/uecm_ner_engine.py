@@ -0,0 +1,179 @@
+import re
+import time
+import loguru
+from uecm_ner_cache import document_hash
+import uecm_trace
+
+# GLiNER splits text into words with this pattern, so the window budget is counted the same way
+WORD_PATTERN = re.compile(r"\w+(?:[-_]\w+)*|\S")
+
+DEFAULT_WINDOW_TOKENS = 256
+DEFAULT_OVERLAP_TOKENS = 32
+DEFAULT_BATCH_SIZE = 8
+
+
+# Batched, window-aware NER over whole documents.
+#
+# Each document is split into overlapping windows that fit the model's context, windows from
+# several documents are sent to GLiNER together, and spans are mapped back to document offsets.
+# A span is only kept from the window whose "core" (the window minus half the overlap on each
+# side) contains its midpoint, so entities seen twice in an overlap are counted once.
+#
+# With a NERCache attached, documents already seen with the same model, labels and window
+# settings are answered from the cache, and new results are stored down to the cache's floor
+# threshold so a later run can re-threshold without inference.
+#
+# Documents that know their page layout (uecm_ingest.PagedText) get a "page" on every span.
+class NEREngine:
+    def __init__(self, model, labels, window_tokens=DEFAULT_WINDOW_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS,
+                 batch_size=DEFAULT_BATCH_SIZE, threshold=0.5, cache=None, model_id=None):
+        if overlap_tokens >= window_tokens:
+            raise ValueError("overlap_tokens must be smaller than window_tokens")
+        self.model = model
+        self.labels = list(labels)
+        self.window_tokens = window_tokens
+        self.overlap_tokens = overlap_tokens
+        self.batch_size = max(1, batch_size)
+        self.threshold = threshold
+        self.cache = cache
+        self.cache_model_id = f"{model_id or type(model).__name__}|w{window_tokens}|o{overlap_tokens}"
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"documents": 0, "windows": 0, "batches": 0, "seconds": 0.0, "cache_hits": 0}
+
+    # Split a document into (start, end, core_start, core_end) character windows
+    def split_windows(self, text):
+        offsets = [(m.start(), m.end()) for m in WORD_PATTERN.finditer(text)]
+        if not offsets:
+            return []
+        step = self.window_tokens - self.overlap_tokens
+        half_overlap = self.overlap_tokens // 2
+        windows = []
+        first = 0
+        while True:
+            last = min(first + self.window_tokens, len(offsets)) - 1
+            is_first = first == 0
+            is_last = last == len(offsets) - 1
+            core_first = first if is_first else first + half_overlap
+            core_last = last if is_last else last - (self.overlap_tokens - half_overlap)
+            core_start = 0 if is_first else offsets[core_first][0]
+            core_end = len(text) if is_last else offsets[core_last + 1][0]
+            windows.append((offsets[first][0], offsets[last][1], core_start, core_end))
+            if is_last:
+                break
+            first += step
+        return windows
+
+    # Run one batch of window texts through GLiNER.
+    # Windows in a batch go through the model together, so the trace span covers the batch and
+    # carries its window count; per-window cost is the span duration divided by that count.
+    def _predict_batch(self, window_texts, threshold):
+        started = time.perf_counter()
+        with uecm_trace.span("ner.batch", "ner", windows=len(window_texts), characters=sum(len(text) for text in window_texts)):
+            if hasattr(self.model, "batch_predict_entities"):
+                predictions = self.model.batch_predict_entities(window_texts, self.labels, threshold=threshold)
+            else:
+                predictions = [self.model.predict_entities(text, self.labels, threshold=threshold) for text in window_texts]
+        self.stats["seconds"] += time.perf_counter() - started
+        self.stats["batches"] += 1
+        self.stats["windows"] += len(window_texts)
+        uecm_trace.count("ner_batches")
+        uecm_trace.count("ner_windows", len(window_texts))
+        return predictions
+
+    # Predict entities for an iterable of documents, yielding (index, spans) in document order.
+    # Span offsets refer to the original document text. With with_failures=True it yields
+    # (index, spans, failed) instead, where failed marks a document with a GLiNER batch that raised
+    # (its spans are incomplete and are not cached).
+    def iter_predict(self, texts, threshold=None, with_failures=False):
+        threshold = self.threshold if threshold is None else threshold
+        model_threshold = threshold if self.cache is None else min(threshold, self.cache.floor_threshold)
+        if self.cache is not None and threshold < self.cache.floor_threshold:
+            loguru.logger.warning(f"Threshold {threshold} is below the NER cache floor {self.cache.floor_threshold}; "
+                                  f"cached spans are not used for this run")
+        pending = []
+        queue = []  # (pending document, window)
+
+        def flush():
+            batch, queue[:] = queue[:self.batch_size], queue[self.batch_size:]
+            try:
+                predictions = self._predict_batch([doc["text"][w[0]:w[1]] for doc, w in batch], model_threshold)
+            except Exception as e:
+                loguru.logger.error(f"Error during NER batch: {e}")
+                predictions = [[] for _ in batch]
+                for doc, _ in batch:
+                    doc["failed"] = True
+            for (doc, window), detected in zip(batch, predictions):
+                start, _, core_start, core_end = window
+                for entity in detected:
+                    span_start = entity["start"] + start
+                    span_end = entity["end"] + start
+                    if not core_start <= (span_start + span_end) // 2 < core_end:
+                        continue
+                    key = (span_start, span_end, entity["label"])
+                    if key not in doc["spans"] or doc["spans"][key]["score"] < entity["score"]:
+                        doc["spans"][key] = {**entity, "start": span_start, "end": span_end}
+                doc["remaining"] -= 1
+
+        def drain():
+            while pending and pending[0]["remaining"] == 0:
+                doc = pending.pop(0)
+                self.stats["documents"] += 1
+                if doc["cached"] is not None:
+                    spans = with_pages(doc, doc["cached"])
+                else:
+                    spans = sorted(doc["spans"].values(), key=lambda span: span["start"])
+                    if self.cache is not None and not doc["failed"]:
+                        self.cache.put(doc["hash"], self.cache_model_id, self.labels, spans)
+                    spans = with_pages(doc, [span for span in spans if span["score"] >= threshold])
+                yield (doc["index"], spans, doc["failed"]) if with_failures else (doc["index"], spans)
+
+        # Page numbers are added after the cache so cached spans stay valid for any page layout
+        def with_pages(doc, spans):
+            page_at = getattr(doc["text"], "page_at", None)
+            if page_at is None:
+                return spans
+            return [{**span, "page": page_at(span["start"])} for span in spans]
+
+        for index, text in enumerate(texts):
+            doc = {"index": index, "text": text or "", "remaining": 0, "spans": {}, "hash": None, "cached": None, "failed": False}
+            if self.cache is not None:
+                doc["hash"] = document_hash(doc["text"])
+                doc["cached"] = self.cache.get(doc["hash"], self.cache_model_id, self.labels, threshold)
+            if doc["cached"] is not None:
+                self.stats["cache_hits"] += 1
+                uecm_trace.count("ner_cache_hits")
+            else:
+                windows = self.split_windows(doc["text"])
+                doc["remaining"] = len(windows)
+                queue.extend((doc, window) for window in windows)
+            pending.append(doc)
+            while len(queue) >= self.batch_size:
+                flush()
+            yield from drain()
+        while queue:
+            flush()
+        yield from drain()
+
+    def predict_documents(self, texts, threshold=None):
+        return [spans for _, spans in self.iter_predict(texts, threshold)]
+
+    # Throughput summary for the documents processed since the last reset
+    def throughput(self, elapsed=None):
+        elapsed = self.stats["seconds"] if elapsed is None else elapsed
+        return {
+            **self.stats,
+            "docs_per_sec": self.stats["documents"] / elapsed if elapsed else 0.0,
+            "windows_per_sec": self.stats["windows"] / elapsed if elapsed else 0.0,
+        }
+
+
+# Function to fold detected spans into "LABEL: text" counts above a threshold
+def count_entities(spans, threshold, entities=None):
+    entities = {} if entities is None else entities
+    for entity in spans:
+        if entity['score'] >= threshold:
+            entity_name = f"{entity['label']}: {entity['text']}"
+            entities[entity_name] = entities.get(entity_name, 0) + 1
+    return entities
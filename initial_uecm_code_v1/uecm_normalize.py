@@ -0,0 +1,195 @@
+import re
+import json
+import unicodedata
+import zlib
+import numpy as np
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.85
+HASH_DIMENSIONS = 4096
+BLOCK_PREFIX = 2
+ROW_CHUNK = 1024
+
+NON_WORD = re.compile(r"[^\w]+")
+# Tokens that identify a member of a series ("Phase II", "Interleukin 6", "Gardasil 9"); names whose
+# series tokens differ are different entities however similar their characters are
+SERIES_TOKEN = re.compile(r"\d+[a-z]?|x{0,3}(?:ix|iv|v?i{0,3})")
+# Salt and acid forms of a single-word drug stem ("alendronic acid", "pamidronate disodium") fold to the stem
+STRIP_SUFFIXES = ("acid", "sodium", "disodium", "potassium", "calcium", "hydrochloride", "hcl", "sulfate", "mesylate")
+
+
+# Function to fold case, accents, punctuation and hyphenation so trivial variants share one key
+def fold(text):
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = re.sub(r"(\w)['\u2019]s\b", r"\1", text.lower())
+    text = NON_WORD.sub(" ", text.replace("_", " "))
+    words = text.split()
+    if len(words) == 2 and words[1] in STRIP_SUFFIXES and len(words[0]) >= 5:
+        words = words[:1]
+    return " ".join(words)
+
+
+# Function to embed folded strings as L2-normalized hashed character-trigram count vectors
+def trigram_matrix(strings, dimensions=HASH_DIMENSIONS):
+    matrix = np.zeros((len(strings), dimensions), dtype=np.float32)
+    for row, text in enumerate(strings):
+        padded = f"  {text} "
+        for start in range(len(padded) - 2):
+            matrix[row, zlib.crc32(padded[start:start + 3].encode("utf-8")) % dimensions] += 1.0
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _series_tokens(tokens):
+    return sorted(token for token in tokens if SERIES_TOKEN.fullmatch(token))
+
+
+# Function to count single-character edits between two tokens, giving up once `limit` is exceeded
+def _edit_distance(first, second, limit):
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = list(range(len(second) + 1))
+    for row, char in enumerate(first, 1):
+        current = [row]
+        for column, other in enumerate(second, 1):
+            current.append(min(previous[column] + 1, current[column - 1] + 1, previous[column - 1] + (char != other)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1]
+
+
+# Function to allow one edit in short words and two in words of eight or more characters
+def _edit_limit(first, second):
+    return 1 if min(len(first), len(second)) < 8 else 2
+
+
+# Function to veto a similarity link: keys must agree on their numeric and roman-numeral tokens and
+# have the same number of distinct tokens, so a whole added or dropped word ("breast cancer" vs
+# "cancer") never merges. Every token found in only one key must also be a misspelling (a few edits)
+# of a token found only in the other, so "cancer"/"cancers" merge but "bivalent"/"quadrivalent" and
+# "chemotherapy"/"chemoimmunotherapy" stay apart
+def compatible(first, second):
+    first_tokens, second_tokens = first.split(), second.split()
+    if _series_tokens(first_tokens) != _series_tokens(second_tokens):
+        return False
+    first_only, second_only = set(first_tokens) - set(second_tokens), set(second_tokens) - set(first_tokens)
+    if len(first_only) != len(second_only) or len(set(first_tokens)) != len(set(second_tokens)):
+        return False
+    unmatched = sorted(second_only)
+    for token in sorted(first_only):
+        for candidate in unmatched:
+            limit = _edit_limit(token, candidate)
+            if _edit_distance(token, candidate, limit) <= limit:
+                unmatched.remove(candidate)
+                break
+        else:
+            return False
+    return True
+
+
+# Function to read a synonyms file: a JSON object mapping each alias to its preferred name
+def load_synonyms(path):
+    with open(path, 'r') as f:
+        synonyms = json.load(f)
+    if not isinstance(synonyms, dict) or not all(isinstance(alias, str) and isinstance(name, str) for alias, name in synonyms.items()):
+        raise ValueError(f"{path}: expected a JSON object of {{\"alias\": \"preferred name\"}}")
+    return synonyms
+
+
+class _UnionFind:
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, item):
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            self.parent[max(a, b)] = min(a, b)
+
+
+# Function to cluster "LABEL: text" entity counts into canonical entities.
+#
+# Names are folded (case, accents, punctuation, hyphens) and exact folded matches merge first.
+# The remaining keys are blocked by label and the first characters of the folded text, and within
+# each block a hashed character-trigram cosine similarity matrix links keys above `threshold`,
+# unless `compatible` vetoes the pair (different numbers or roman numerals, an extra word, or a
+# word that is not a misspelling of its counterpart).
+# `synonyms` optionally maps known aliases to a preferred name (e.g. "acetylsalicylic acid" ->
+# "aspirin"). Each cluster is named after its most frequent original surface form.
+# Returns (canonical counts, {original entity name: canonical entity name}).
+def normalize_entities(entities, threshold=DEFAULT_SIMILARITY_THRESHOLD, synonyms=None):
+    synonyms = {fold(alias): fold(name) for alias, name in (synonyms or {}).items()}
+    keys = {}
+    members = []
+    for entity_name, count in entities.items():
+        label, _, text = entity_name.partition(": ")
+        folded = fold(text)
+        folded = synonyms.get(folded, folded)
+        key = (label.lower(), folded)
+        if key not in keys:
+            keys[key] = len(members)
+            members.append([])
+        members[keys[key]].append((entity_name, label, text, count))
+
+    key_list = list(keys)
+    union = _UnionFind(len(key_list))
+    blocks = {}
+    for index, (label, folded) in enumerate(key_list):
+        blocks.setdefault((label, folded[:BLOCK_PREFIX]), []).append(index)
+    for block in blocks.values():
+        if len(block) < 2:
+            continue
+        matrix = trigram_matrix([key_list[index][1] for index in block])
+        for start in range(0, len(block), ROW_CHUNK):
+            similarity = matrix[start:start + ROW_CHUNK] @ matrix.T
+            rows, columns = np.nonzero(similarity >= threshold)
+            for row, column in zip(rows.tolist(), columns.tolist()):
+                if start + row < column and compatible(key_list[block[start + row]][1], key_list[block[column]][1]):
+                    union.union(block[start + row], block[column])
+
+    clusters = {}
+    for index in range(len(key_list)):
+        clusters.setdefault(union.find(index), []).extend(members[index])
+    normalized, mapping = {}, {}
+    for cluster in clusters.values():
+        _, label, text, _ = max(cluster, key=lambda member: (member[3], -len(member[2]), member[2]))
+        canonical = f"{label}: {text}"
+        normalized[canonical] = normalized.get(canonical, 0) + sum(member[3] for member in cluster)
+        for entity_name, _, _, _ in cluster:
+            mapping[entity_name] = canonical
+    return normalized, mapping
+
+
+# Regression checks for variants that must stay apart or must merge: python uecm_normalize.py
+def _self_check():
+    cases = [
+        ({"TRIAL_PHASE: Phase II": 5, "TRIAL_PHASE: Phase III": 3}, {"TRIAL_PHASE: Phase II": 5, "TRIAL_PHASE: Phase III": 3}, None),
+        ({"DRUG: Interleukin 6": 2, "DRUG: Interleukin 8": 4}, {"DRUG: Interleukin 6": 2, "DRUG: Interleukin 8": 4}, None),
+        ({"DRUG: Gardasil": 3, "DRUG: Gardasil 9": 2}, {"DRUG: Gardasil": 3, "DRUG: Gardasil 9": 2}, None),
+        ({"DISEASE: breast cancer": 2, "DISEASE: breast cancers": 1}, {"DISEASE: breast cancer": 3}, None),
+        ({"DRUG: Imatinib": 4, "DRUG: imatinib": 1, "DRUG: Imatinib mesylate": 2}, {"DRUG: Imatinib": 7}, None),
+        ({"DRUG: aspirin": 2, "DRUG: acetylsalicylic acid": 1}, {"DRUG: aspirin": 3}, {"acetylsalicylic acid": "aspirin"}),
+        ({"DRUG: Recombinant Human Papillomavirus (HPV) Bivalent Vaccine": 3, "DRUG: Recombinant Human Papillomavirus (HPV) Quadrivalent Vaccine": 2,
+          "DRUG: Recombinant Human Papillomavirus (HPV) Nonavalent Vaccine": 1},
+         {"DRUG: Recombinant Human Papillomavirus (HPV) Bivalent Vaccine": 3, "DRUG: Recombinant Human Papillomavirus (HPV) Quadrivalent Vaccine": 2,
+          "DRUG: Recombinant Human Papillomavirus (HPV) Nonavalent Vaccine": 1}, None),
+        ({"TREATMENT: first-line chemotherapy": 2, "TREATMENT: first-line chemoimmunotherapy": 1},
+         {"TREATMENT: first-line chemotherapy": 2, "TREATMENT: first-line chemoimmunotherapy": 1}, None),
+        ({"TREATMENT: chemotherapy": 2, "TREATMENT: chemoimmunotherapy": 1}, {"TREATMENT: chemotherapy": 2, "TREATMENT: chemoimmunotherapy": 1}, None),
+        ({"DISEASE: chronic myeloid leukaemia": 2, "DISEASE: chronic myeloid leukemia": 1}, {"DISEASE: chronic myeloid leukaemia": 3}, None),
+    ]
+    for entities, expected, synonyms in cases:
+        normalized, _ = normalize_entities(entities, synonyms=synonyms)
+        assert normalized == expected, f"{entities} normalized to {normalized}, expected {expected}"
+    print(f"{len(cases)} normalization checks passed")
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,82 @@
+import queue
+import threading
+import loguru
+from uecm_ingest import iter_ingest_parallel
+from uecm_ner_engine import count_entities
+
+DEFAULT_QUEUE_SIZE = 64
+
+_DONE = object()
+
+
+# Function to run an iterable in a background thread behind a bounded queue.
+# The producer blocks once `maxsize` items are waiting, so a slow consumer caps memory use;
+# exceptions raised by the producer are re-raised in the consumer.
+def bounded_stage(iterable, maxsize=DEFAULT_QUEUE_SIZE, name="stage"):
+    items = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+        except BaseException as e:
+            put((_DONE, e))
+            return
+        finally:
+            if hasattr(iterable, "close"):
+                iterable.close()
+        put((_DONE, None))
+
+    producer = threading.Thread(target=produce, name=f"uecm-{name}", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = items.get()
+            if isinstance(item, tuple) and len(item) == 2 and item[0] is _DONE:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            yield item
+    finally:
+        stop.set()
+        producer.join(timeout=1)
+
+
+# Function to stream a folder through ingestion, NER and counting.
+# Yields (path, document_counts, failed) as each document finishes, where failed marks a document
+# whose extraction or NER was incomplete, e.g. a split PDF with a failed page range or a GLiNER
+# batch that raised (its partial counts are still added to `totals`); `totals` is updated in
+# place so callers can watch the running entity counts without waiting for the whole corpus.
+# `filepaths` restricts ingestion to the given files instead of walking the whole folder.
+def stream_entity_counts(main_folder, engine, threshold, totals=None, workers=None, queue_size=DEFAULT_QUEUE_SIZE,
+                         ingest_stats=None, filepaths=None):
+    totals = {} if totals is None else totals
+    partial = set()
+    documents = bounded_stage(iter_ingest_parallel(main_folder, max_workers=workers, max_in_flight=queue_size,
+                                                   stats=ingest_stats, filepaths=filepaths, partial=partial),
+                              maxsize=queue_size, name="ingest")
+    paths = {}
+
+    def texts():
+        for index, (path, text) in enumerate(documents):
+            paths[index] = path
+            yield text
+
+    for index, spans, failed in engine.iter_predict(texts(), threshold, with_failures=True):
+        document_counts = count_entities(spans, threshold)
+        for entity_name, count in document_counts.items():
+            totals[entity_name] = totals.get(entity_name, 0) + count
+        path = paths.pop(index)
+        yield path, document_counts, failed or path in partial
+    loguru.logger.info(f"Streamed {engine.stats['documents']} documents, {len(totals)} unique entities")
@@ -1,116 +1,86 @@
 import os
 import json
-import ollama
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import tqdm
 import loguru
-from wordcloud import WordCloud
-import matplotlib.pyplot as plt
-from PyPDF2 import PdfReader
-from gliner import GLiNER
-from bs4 import BeautifulSoup
+from uecm_llm_client import get_client
+from uecm_models import get_gliner, DEFAULT_GLINER_MODEL
+from uecm_ner_engine import NEREngine, DEFAULT_BATCH_SIZE, DEFAULT_WINDOW_TOKENS, DEFAULT_OVERLAP_TOKENS
+from uecm_ner_cache import NERCache, DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES
+from uecm_manifest import load_manifest, save_manifest, update_manifest, DEFAULT_MANIFEST_PATH
+from uecm_entity_store import EntityStore
+from uecm_normalize import normalize_entities, load_synonyms, DEFAULT_SIMILARITY_THRESHOLD
+from uecm_map_reduce import shard_entities, merge_entity_analyses, DEFAULT_SHARD_TOKENS
+from uecm_pipeline import stream_entity_counts, DEFAULT_QUEUE_SIZE
+import uecm_trace
+from uecm_ingest import ingest_files_from_folders, extract_text_from_pdf, extract_text_from_text_file, extract_text_from_markdown, extract_text_from_html, clean_text
 
 # Initialize logging
 loguru.logger.add("uecm_unstructured.log", rotation="10 MB")
 
-# Initialize GLiNER model
-gliner_model = GLiNER.from_pretrained("urchade/gliner_small-v2.1")
+# GLiNER model, loaded from the model registry the first time a document misses the NER cache
+GLINER_MODEL_ID = DEFAULT_GLINER_MODEL
+MODEL = "llama3.1:latest"
 default_labels = ["DISEASE", "DRUG", "TREATMENT", "MECHANISM", "TRIAL_PHASE", "APPROVAL_STATUS", "SIDE_EFFECT"]
 
-# Function to recursively ingest files from folders and subfolders
-def ingest_files_from_folders(main_folder):
-    extracted_texts = []
-    for root, _, files in os.walk(main_folder):
-        for filename in files:
-            filepath = os.path.join(root, filename)
-            if filename.endswith(".pdf"):
-                extracted_texts.extend(extract_text_from_pdf(filepath))
-            elif filename.endswith(".txt"):
-                extracted_texts.extend(extract_text_from_text_file(filepath))
-            elif filename.endswith(".md"):
-                extracted_texts.extend(extract_text_from_markdown(filepath))
-            elif filename.endswith(".html"):
-                extracted_texts.extend(extract_text_from_html(filepath))
-    return extracted_texts
-
-# Function to extract text from PDFs
-def extract_text_from_pdf(filepath):
-    texts = []
-    try:
-        reader = PdfReader(filepath)
-        text = ''
-        for page in reader.pages:
-            raw_text = page.extract_text()
-            cleaned_text = clean_text(raw_text)
-            text += cleaned_text
-        texts.append(text)
-    except Exception as e:
-        loguru.logger.error(f"Failed to extract text from PDF {filepath}: {e}")
-    return texts
-
-# Function to extract text from plain text files
-def extract_text_from_text_file(filepath):
-    texts = []
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            text = file.read()
-            cleaned_text = clean_text(text)
-            texts.append(cleaned_text)
-    except Exception as e:
-        loguru.logger.error(f"Failed to extract text from text file {filepath}: {e}")
-    return texts
-
-# Function to extract text from markdown files
-def extract_text_from_markdown(filepath):
-    texts = []
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            text = file.read()
-            cleaned_text = clean_text(text)
-            texts.append(cleaned_text)
-    except Exception as e:
-        loguru.logger.error(f"Failed to extract text from markdown file {filepath}: {e}")
-    return texts
-
-# Function to extract text from HTML files
-def extract_text_from_html(filepath):
-    texts = []
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            soup = BeautifulSoup(file, 'html.parser')
-            text = soup.get_text()
-            cleaned_text = clean_text(text)
-            texts.append(cleaned_text)
-    except Exception as e:
-        loguru.logger.error(f"Failed to extract text from HTML file {filepath}: {e}")
-    return texts
-
-# Function to clean the extracted text
-def clean_text(text):
-    text = text.replace('\n', ' ').replace('\r', '')
-    text = ' '.join(text.split())
-    return text
-
 # Function to perform Named Entity Recognition (NER)
-def perform_ner(texts, threshold=0.5):
+def perform_ner(texts, threshold=0.5, batch_size=DEFAULT_BATCH_SIZE, window_tokens=DEFAULT_WINDOW_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, cache=None, return_store=False):
+    engine = NEREngine(get_gliner(GLINER_MODEL_ID, lazy=True), default_labels, window_tokens=window_tokens, overlap_tokens=overlap_tokens, batch_size=batch_size, threshold=threshold, cache=cache, model_id=GLINER_MODEL_ID)
+    store = EntityStore()
+    started = time.perf_counter()
+    total = len(texts) if hasattr(texts, '__len__') else None
+    for _, spans in tqdm.tqdm(engine.iter_predict(texts), total=total, desc="Performing NER"):
+        store.add_spans(spans, threshold)
+    
+    stats = engine.throughput(time.perf_counter() - started)
+    loguru.logger.info(f"NER throughput: {stats['documents']} docs, {stats['windows']} windows in {stats['batches']} batches "
+                       f"({stats['docs_per_sec']:.2f} docs/sec, {stats['windows_per_sec']:.2f} windows/sec, {stats['cache_hits']} cache hits)")
+    loguru.logger.info(f"Found {len(store)} unique entities")
+    return store if return_store else store.to_dict()
+
+# Function to ingest, NER and count a folder incrementally with bounded queues between stages
+def perform_streaming_ner(main_folder, threshold=0.5, batch_size=DEFAULT_BATCH_SIZE, window_tokens=DEFAULT_WINDOW_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, queue_size=DEFAULT_QUEUE_SIZE, cache=None):
+    engine = NEREngine(get_gliner(GLINER_MODEL_ID, lazy=True), default_labels, window_tokens=window_tokens, overlap_tokens=overlap_tokens, batch_size=batch_size, threshold=threshold, cache=cache, model_id=GLINER_MODEL_ID)
     entities = {}
-    for text in tqdm.tqdm(texts, desc="Performing NER"):
-        try:
-            detected_entities = gliner_model.predict_entities(text, default_labels)
-            for entity in detected_entities:
-                if entity['score'] >= threshold:
-                    entity_name = f"{entity['label']}: {entity['text']}"
-                    if entity_name in entities:
-                        entities[entity_name] += 1
-                    else:
-                        entities[entity_name] = 1
-        except Exception as e:
-            loguru.logger.error(f"Error during NER: {e}")
+    started = time.perf_counter()
+    for path, document_counts, failed in tqdm.tqdm(stream_entity_counts(main_folder, engine, threshold, totals=entities, queue_size=queue_size), desc="Streaming NER"):
+        if failed:
+            loguru.logger.warning(f"{path}: NER was incomplete, its entity counts are partial")
+        loguru.logger.debug(f"{path}: {sum(document_counts.values())} entities, {len(entities)} unique so far")
+    
+    stats = engine.throughput(time.perf_counter() - started)
+    loguru.logger.info(f"NER throughput: {stats['documents']} docs, {stats['windows']} windows in {stats['batches']} batches "
+                       f"({stats['docs_per_sec']:.2f} docs/sec, {stats['windows_per_sec']:.2f} windows/sec, {stats['cache_hits']} cache hits)")
+    loguru.logger.info(f"Found {len(entities)} unique entities")
+    return entities
+
+# Function to NER only the files added or modified since the last run, using the manifest's per-file counts
+def perform_incremental_ner(main_folder, threshold=0.5, manifest_path=DEFAULT_MANIFEST_PATH, batch_size=DEFAULT_BATCH_SIZE, window_tokens=DEFAULT_WINDOW_TOKENS, overlap_tokens=DEFAULT_OVERLAP_TOKENS, queue_size=DEFAULT_QUEUE_SIZE, cache=None):
+    engine = NEREngine(get_gliner(GLINER_MODEL_ID, lazy=True), default_labels, window_tokens=window_tokens, overlap_tokens=overlap_tokens, batch_size=batch_size, threshold=threshold, cache=cache, model_id=GLINER_MODEL_ID)
+    settings = {
+        "folder": os.path.abspath(main_folder),
+        "model_id": engine.cache_model_id,
+        "labels": default_labels,
+        "threshold": threshold,
+    }
+    manifest = load_manifest(manifest_path, settings)
+    
+    def process(filepaths):
+        documents = stream_entity_counts(main_folder, engine, threshold, filepaths=filepaths, queue_size=queue_size)
+        for path, document_counts, failed in tqdm.tqdm(documents, total=len(filepaths), desc="Incremental NER"):
+            yield path, None if failed else document_counts
     
+    update_manifest(main_folder, manifest, process)
+    save_manifest(manifest, manifest_path)
+    entities = dict(manifest["raw_entities"])
+    loguru.logger.info(f"Processed {engine.stats['documents']} changed documents ({engine.stats['cache_hits']} cache hits)")
     loguru.logger.info(f"Found {len(entities)} unique entities")
     return entities
 
 # Function to analyze entities with respect to the research objective
-def analyze_entities_with_objective(entities, objective):
+def analyze_entities_with_objective(entities, objective, model=MODEL):
     prompt = f"""SYSTEM INSTRUCTIONS:
     You are a helpful assistant specializing in data analysis and entity recognition. Your task is to analyze entities in the context of a research objective and provide a JSON formatted response. It is crucial that your entire response is valid JSON.
 
@@ -144,7 +114,7 @@ def analyze_entities_with_objective(entities, objective):
     """
     
     try:
-        response = ollama.generate(model='llama3.1:latest', prompt=prompt)
+        response = get_client().generate(prompt, model=model, format="json")
         return json.loads(response["response"])
     except Exception as e:
         loguru.logger.error(f"Failed to analyze entities with objective: {e}")
@@ -155,14 +125,32 @@ def analyze_entities_with_objective(entities, objective):
             "data_quality_assessment": "Unable to assess"
         }
 
+# Function to analyze a large entity dict in token-budgeted shards and merge the partial analyses
+def analyze_entities_map_reduce(entities, objective, max_shard_tokens=DEFAULT_SHARD_TOKENS, max_workers=4, model=MODEL):
+    shards = shard_entities(entities, max_shard_tokens)
+    if len(shards) <= 1:
+        return analyze_entities_with_objective(entities, objective, model)
+    
+    loguru.logger.info(f"Analyzing {len(entities)} entities in {len(shards)} shards")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        analyses = list(tqdm.tqdm(executor.map(lambda shard: analyze_entities_with_objective(shard, objective, model), shards), total=len(shards), desc="Analyzing entity shards"))
+    
+    failed = sum(1 for analysis in analyses if analysis.get("data_quality_assessment") == "Unable to assess")
+    if failed:
+        loguru.logger.warning(f"{failed} of {len(shards)} entity shards could not be analyzed")
+    return merge_entity_analyses(analyses)
+
 # Function to generate a word cloud from the entities
-def generate_word_cloud(entities):
+def generate_word_cloud(entities, filename='UECM_wordcloud.png'):
     if not entities:
         loguru.logger.error("No entities found or threshold too high.")
         return
     
-    entity_frequencies = {entity.split(": ")[1]: count for entity, count in entities.items()}
+    store = entities if isinstance(entities, EntityStore) else EntityStore.from_dict(entities)
+    entity_frequencies = store.surface_frequencies()
     
+    from wordcloud import WordCloud
+    import matplotlib.pyplot as plt
     try:
         wordcloud = WordCloud(width=800, height=400, background_color='white', min_font_size=10, max_words=100).generate_from_frequencies(entity_frequencies)
         plt.figure(figsize=(10, 5))
@@ -170,13 +158,22 @@ def generate_word_cloud(entities):
         plt.axis("off")
         plt.title("UEMC: Preflight Entity Checks")
         plt.tight_layout(pad=0)
-        plt.savefig('UECM_wordcloud.png')
-        loguru.logger.info("Word cloud saved as 'UECM_wordcloud.png'")
+        plt.savefig(filename)
+        loguru.logger.info(f"Word cloud saved as '{filename}'")
     except Exception as e:
         loguru.logger.error(f"Failed to generate or save word cloud: {e}")
     finally:
         plt.close()
 
+# Function to save raw entity counts as a memory-mappable binary store next to the JSON schema
+def save_entity_store(entities, filename='UECM_preflight_unstructured.entities.bin'):
+    try:
+        store = entities if isinstance(entities, EntityStore) else EntityStore.from_dict(entities)
+        store.save(filename)
+        loguru.logger.info(f"Entity store saved to '{filename}'")
+    except Exception as e:
+        loguru.logger.error(f"Failed to save entity store: {e}")
+
 # Function to save UECM schema
 def save_uecm_schema(schema, filename='UECM_preflight_unstructured.json'):
     try:
@@ -186,46 +183,108 @@ def save_uecm_schema(schema, filename='UECM_preflight_unstructured.json'):
     except Exception as e:
         loguru.logger.error(f"Failed to save UECM schema: {e}")
 
-def main():
-    loguru.logger.info("Starting UECM Schema Generation for Unstructured Data")
-    
-    # Get the research objective from the user
-    objective = input("Please enter your research objective: ")
-    
-    # Get the path to the folder containing files to process
-    pdf_folder = input("Enter the path to the folder containing your files (PDFs, text, markdown, HTML): ")
-    texts = ingest_files_from_folders(pdf_folder)
-    
-    # Get the NER confidence threshold
-    threshold = float(input("Enter NER confidence threshold (0.1 to 1.0, default 0.5): ") or 0.5)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="UECM pre-flight schema generation for unstructured data")
+    parser.add_argument("--stream", action="store_true", help="ingest, NER and count files incrementally instead of loading the whole corpus first")
+    parser.add_argument("--incremental", action="store_true", help="only ingest and NER files that are new or modified since the last run")
+    parser.add_argument("--manifest-path", default=DEFAULT_MANIFEST_PATH, help="manifest of processed files used by --incremental")
+    parser.add_argument("--shard-tokens", type=int, default=DEFAULT_SHARD_TOKENS, help="approximate prompt tokens of entities per LLM analysis shard")
+    parser.add_argument("--similarity-threshold", type=float, default=DEFAULT_SIMILARITY_THRESHOLD, help="trigram cosine similarity above which entity variants are merged")
+    parser.add_argument("--no-normalize", action="store_true", help="send raw entity variants to the LLM without clustering them")
+    parser.add_argument("--synonyms", help="JSON file mapping entity aliases to preferred names, e.g. {\"acetylsalicylic acid\": \"aspirin\"}")
+    parser.add_argument("--no-cache", action="store_true", help="always re-run GLiNER instead of reading cached spans")
+    parser.add_argument("--cache-path", default=DEFAULT_CACHE_PATH, help="SQLite file holding cached NER spans")
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_MAX_BYTES / (1024 * 1024), help="evict least recently used cache entries above this size")
+    parser.add_argument("--no-llm-cache", action="store_true", help="always call the LLM instead of reusing cached responses")
+    parser.add_argument("--no-wordcloud", action="store_true", help="skip rendering the entity word cloud")
+    parser.add_argument("--trace", help="write a Chrome trace-event JSON of the run to this file")
+    parser.add_argument("--metrics-out", help="write a Prometheus text snapshot of the run's counters to this file")
+    return parser.parse_args(argv)
+
+# Function to run the unstructured pre-flight without prompts and write its outputs to output_dir.
+# mode is None (load the folder, then NER), "stream" or "incremental". Returns the schema.
+def run_unstructured_preflight(objective, folder, threshold=0.5, output_dir=".", mode=None, cache=None, manifest_path=None,
+                               normalize=True, similarity_threshold=DEFAULT_SIMILARITY_THRESHOLD, shard_tokens=DEFAULT_SHARD_TOKENS,
+                               model=MODEL, wordcloud=True, synonyms=None):
+    os.makedirs(output_dir, exist_ok=True)
     
     # Perform Named Entity Recognition (NER)
     loguru.logger.info(f"Performing NER with threshold {threshold}.")
-    entities = perform_ner(texts, threshold)
+    if mode == "incremental":
+        with uecm_trace.span("preflight.ingest_ner", "preflight", mode=mode):
+            entities = perform_incremental_ner(folder, threshold, manifest_path=manifest_path or os.path.join(output_dir, DEFAULT_MANIFEST_PATH), cache=cache)
+    elif mode == "stream":
+        with uecm_trace.span("preflight.ingest_ner", "preflight", mode=mode):
+            entities = perform_streaming_ner(folder, threshold, cache=cache)
+    else:
+        with uecm_trace.span("preflight.ingest", "preflight"):
+            texts = ingest_files_from_folders(folder, workers=os.cpu_count())
+        with uecm_trace.span("preflight.ner", "preflight", documents=len(texts)):
+            entities = perform_ner(texts, threshold, cache=cache)
     
     if not entities:
         loguru.logger.warning("No entities found. Consider lowering the threshold.")
     else:
         loguru.logger.info(f"Found {len(entities)} unique entities.")
     
+    # Cluster case, punctuation and spelling variants before they reach the LLM
+    normalized_entities = entities
+    if normalize:
+        with uecm_trace.span("preflight.normalize", "preflight", entities=len(entities)):
+            normalized_entities, _ = normalize_entities(entities, threshold=similarity_threshold, synonyms=synonyms)
+        loguru.logger.info(f"Normalized {len(entities)} entity variants into {len(normalized_entities)} canonical entities.")
+    
     # Analyze the entities in relation to the research objective
     loguru.logger.info("Analyzing entities in relation to the research objective.")
-    analysis = analyze_entities_with_objective(entities, objective)
+    with uecm_trace.span("preflight.analyze", "preflight", entities=len(normalized_entities)):
+        analysis = analyze_entities_map_reduce(normalized_entities, objective, max_shard_tokens=shard_tokens, model=model)
     
     # Create the schema that includes the research objective, entity analysis, and raw entities
     schema = {
         "research_objective": objective,
         "entity_analysis": analysis,
-        "raw_entities": entities
+        "raw_entities": entities,
+        "normalized_entities": normalized_entities
     }
     
     # Save the UECM schema to a JSON file
     loguru.logger.info("Saving UECM schema to file.")
-    save_uecm_schema(schema)
+    save_uecm_schema(schema, os.path.join(output_dir, 'UECM_preflight_unstructured.json'))
+    save_entity_store(entities, os.path.join(output_dir, 'UECM_preflight_unstructured.entities.bin'))
     
     # Generate and save a word cloud based on the entities
-    loguru.logger.info("Generating word cloud from entities.")
-    generate_word_cloud(entities)
+    if wordcloud:
+        loguru.logger.info("Generating word cloud from entities.")
+        generate_word_cloud(entities, os.path.join(output_dir, 'UECM_wordcloud.png'))
+    return schema
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace or args.metrics_out:
+        uecm_trace.enable()
+    if args.no_llm_cache:
+        get_client().bypass_cache = True
+    synonyms = load_synonyms(args.synonyms) if args.synonyms else None
+    cache = None if args.no_cache else NERCache(args.cache_path, max_bytes=int(args.cache_max_mb * 1024 * 1024))
+    loguru.logger.info("Starting UECM Schema Generation for Unstructured Data")
+    
+    # Get the research objective from the user
+    objective = input("Please enter your research objective: ")
+    
+    # Get the path to the folder containing files to process
+    pdf_folder = input("Enter the path to the folder containing your files (PDFs, text, markdown, HTML): ")
+    
+    # Get the NER confidence threshold
+    threshold = float(input("Enter NER confidence threshold (0.1 to 1.0, default 0.5): ") or 0.5)
+    
+    mode = "incremental" if args.incremental else "stream" if args.stream else None
+    try:
+        run_unstructured_preflight(objective, pdf_folder, threshold, mode=mode, cache=cache, manifest_path=args.manifest_path,
+                                   normalize=not args.no_normalize, similarity_threshold=args.similarity_threshold,
+                                   synonyms=synonyms,
+                                   shard_tokens=args.shard_tokens, wordcloud=not args.no_wordcloud)
+    finally:
+        uecm_trace.export(args.trace, args.metrics_out)
 
     loguru.logger.info("UECM Schema Generation completed successfully")
     print("UECM Schema has been generated and saved. Please check the output files for results.")
@@ -1,66 +1,124 @@
+import os
 import json
+import argparse
 import loguru
-from pyvis.network import Network
 from rich.console import Console
-import requests
-import spacy
-import matplotlib.pyplot as plt
-import seaborn as sns
+from uecm_llm_client import get_client, LLMError
+from uecm_models import get_spacy
+from uecm_memory_index import EntityIndex, RelationshipGraph, format_path, DEFAULT_MAX_DEPTH
+from uecm_semantic_index import SemanticIndex
+from uecm_json_stream import IncrementalJSONItems, StreamAbort
+from uecm_graph_export import KnowledgeGraph, layout_positions, write_graph_bundle
+from uecm_schema_merge import merge_schemas
+import uecm_trace
 
 # Initialize the console for pretty printing
 console = Console()
 
 # Ollama API Configuration
-API_URL = "http://localhost:11434/api/generate"
 MODEL = "llama3.1:latest"
+# Graphs with more entities than this skip pyvis for the JSON + canvas export
+PYVIS_MAX_NODES = 1000
 SYSTEM_INSTRUCTIONS = "You are a helpful assistant specializing in data analysis and entity recognition. Provide concise and accurate responses in JSON format."
 
 class MemoryManager:
-    def __init__(self, uecm_schema):
+    def __init__(self, uecm_schema, semantic_index=True):
         self.schema = uecm_schema
         self.entities = {entity['name']: entity for entity in uecm_schema['entities']}
-        self.nlp = spacy.load("en_core_web_sm")
+        self._entity_index = None
+        self.graph = RelationshipGraph(uecm_schema['entities'])
+        self.semantic_index = None
+        if semantic_index:
+            try:
+                self.semantic_index = SemanticIndex(uecm_schema['entities'])
+            except Exception as e:
+                loguru.logger.warning(f"Semantic index unavailable, using keyword matching only: {e}")
+
+    # spaCy pipeline from the model registry, loaded by the first query
+    @property
+    def nlp(self):
+        return get_spacy()
+
+    @property
+    def entity_index(self):
+        if self._entity_index is None:
+            self._entity_index = EntityIndex(self.entities, nlp=self.nlp)
+        return self._entity_index
 
     def process_query(self, query):
-        doc = self.nlp(query)
-        relevant_entities = self.find_relevant_entities(doc)
-        return self.execute_query(doc, relevant_entities)
+        with uecm_trace.span("query", "query") as span:
+            doc = self.nlp(query)
+            relevant_entities = self.find_relevant_entities(doc)
+            intent = None
+            semantic = self.semantic_query(query)
+            if semantic is not None:
+                intent, _, nearest = semantic
+                seen = {entity['name'] for entity in relevant_entities}
+                relevant_entities += [self.entities[name] for name, _ in nearest if name not in seen and name in self.entities]
+            span.set(entities=len(relevant_entities), intent=intent)
+            uecm_trace.count("queries")
+            return self.execute_query(doc, relevant_entities, intent)
+
+    # A memory-mapped index only loads its encoder on the first query; if that fails, drop the
+    # semantic index for good and answer with keyword matching
+    def semantic_query(self, query):
+        if self.semantic_index is None:
+            return None
+        try:
+            return self.semantic_index.query(query)
+        except Exception as e:
+            loguru.logger.warning(f"Semantic index unavailable, using keyword matching only: {e}")
+            self.semantic_index = None
+            return None
 
     def find_relevant_entities(self, doc):
-        relevant_entities = []
-        for token in doc:
-            for entity_name, entity in self.entities.items():
-                if token.text.lower() in entity_name.lower():
-                    relevant_entities.append(entity)
-        return relevant_entities
-
-    def execute_query(self, doc, relevant_entities):
-        if "mechanism of action" in doc.text.lower():
+        return [entity for entity, _ in self.find_relevant_entities_scored(doc)]
+
+    def find_relevant_entities_scored(self, doc, min_score=0.0):
+        return self.entity_index.lookup(doc, min_score=min_score)
+
+    def execute_query(self, doc, relevant_entities, intent=None):
+        if "mechanism of action" in doc.text.lower() or intent == "mechanism_of_action":
             return self.query_mechanism_of_action(relevant_entities)
-        elif "clinical trial" in doc.text.lower():
+        elif "clinical trial" in doc.text.lower() or intent == "clinical_trials":
             return self.query_clinical_trials(relevant_entities)
+        elif (intent == "multi_hop" or any(word in doc.text.lower() for word in ("related", "connected", "link", "path", "pathway"))) and relevant_entities:
+            return self.query_multi_hop(relevant_entities)
         else:
             return f"Query not recognized. Relevant entities: {[e['name'] for e in relevant_entities]}"
 
     def query_mechanism_of_action(self, relevant_entities):
         results = []
         for entity in relevant_entities:
-            if entity['name'] == "Drug Name":
-                moa = next((r for r in entity['relationships'] if r['target'] == "Mechanism of Action"), None)
-                if moa:
-                    results.append(f"The mechanism of action for {entity['name']} is: {moa['description']}")
+            moa = next(iter(self.graph.edges_matching(entity['name'], "mechanism")), None)
+            if moa:
+                results.append(f"The mechanism of action for {entity['name']} is: {moa['description']}")
         return "\n".join(results) if results else "No mechanism of action information found."
 
     def query_clinical_trials(self, relevant_entities):
         results = []
         for entity in relevant_entities:
-            if entity['name'] == "Drug Name" or entity['name'] == "Disease Name":
-                trial = next((r for r in entity['relationships'] if r['target'] == "Clinical Trial Phase"), None)
-                if trial:
-                    results.append(f"Clinical trial information for {entity['name']}: {trial['description']}")
+            trial = next(iter(self.graph.edges_matching(entity['name'], "trial")), None)
+            if trial:
+                results.append(f"Clinical trial information for {entity['name']}: {trial['description']}")
         return "\n".join(results) if results else "No clinical trial information found."
 
+    # Connect the two best-matching entities, or list chains leading out of a single entity
+    def query_multi_hop(self, relevant_entities, max_depth=DEFAULT_MAX_DEPTH):
+        source = self.graph.resolve(relevant_entities[0]['name'])
+        if len(relevant_entities) >= 2:
+            target = self.graph.resolve(relevant_entities[1]['name'])
+            paths = self.graph.find_paths(source, target, max_depth=max_depth + 1)
+            if not paths:
+                return f"No path found between {source} and {target} within {max_depth + 1} hops."
+        else:
+            paths = self.graph.traverse(source, max_depth=max_depth)
+            if not paths:
+                return f"No relationships found for {source}."
+        return "\n".join(format_path(path, source) for path in paths)
+
     def visualize_query_results(self, query_result):
+        from pyvis.network import Network
         net = Network(height="500px", width="100%", bgcolor="#222222", font_color="white")
         entities = query_result.split("\n")
         for entity in entities:
@@ -68,6 +126,8 @@ class MemoryManager:
         net.show("query_result_visualization.html")
 
     def generate_heatmap(self, query_result):
+        import matplotlib.pyplot as plt
+        import seaborn as sns
         plt.figure(figsize=(10, 8))
         sns.heatmap([[1, 2, 3], [4, 5, 6], [7, 8, 9]], annot=True, cmap="YlGnBu")
         plt.title("Query Result Heatmap")
@@ -80,101 +140,69 @@ def get_user_research_goal():
     refined_goal = input("Refined Research Goal: ")
     return refined_goal
 
-def compare_and_integrate_schemas_with_llm(structured_schema, unstructured_schema, research_goal):
-    # Update prompt with specific instructions for pediatric cancer research
-    prompt = f"""
-    SYSTEM INSTRUCTIONS:
-    You are a helpful assistant specializing in data analysis and entity recognition. Please compare the following two JSON schemas and combine them into a unified schema. 
-    Ensure that the final schema accurately represents all entities and their relationships, with a focus on pediatric cancer research.
-
-    Research Goal: {research_goal}
-
-    Structured Schema:
-    {json.dumps(structured_schema, indent=4)}
-
-    Unstructured Schema:
-    {json.dumps(unstructured_schema, indent=4)}
-
-    Your task:
-    1. Merge the entities and relationships from both schemas.
-    2. Prioritize entities and relationships that are most relevant to pediatric cancers.
-    3. Assign a relevance score (0-1) to each entity based on its importance to the research goal.
-    4. Exclude entities that do not directly relate to childhood cancers.
-    5. Suggest new relationships or entities that might be valuable for pediatric cancer research.
-    6. Provide a brief explanation for any significant merges or additions.
-
-    Provide the final combined schema in valid JSON format with the following structure:
-    {{
-        "research_goal": "string",
-        "entities": [
-            {{
-                "name": "string",
-                "type": "string",
-                "relevance_score": float,
-                "description": "string",
-                "relationships": [
-                    {{
-                        "target": "string",
-                        "type": "string",
-                        "description": "string"
-                    }}
-                ]
-            }}
-        ],
-        "insights": [
-            {{
-                "description": "string",
-                "relevance_to_goal": "string"
-            }}
-        ],
-        "suggestions": [
-            {{
-                "title": "string",
-                "description": "string"
-            }}
-        ]
-    }}
-    """
-    # Same API call and response handling as before...
-
-
-    headers = {'Content-Type': 'application/json'}
-    data = {
-        "model": MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "format": "json"
-    }
-    response = requests.post(API_URL, headers=headers, data=json.dumps(data))
-
-    if response.status_code == 200:
-        try:
-            combined_schema = json.loads(response.json().get("response", "{}"))
-            return combined_schema
-        except json.JSONDecodeError as e:
-            console.print(f"JSON Decode Error: {e}")
-            return None
-    else:
-        console.print(f"Error: {response.status_code}")
+def compare_and_integrate_schemas_with_llm(structured_schema, unstructured_schema, research_goal, stream=False, on_item=None, model=MODEL):
+    return integrate_schemas([structured_schema, unstructured_schema], research_goal, stream=stream, on_item=on_item, model=model)
+
+# Function to merge any number of schemas. Matching entities are merged in code and only conflicts and
+# unscored entities reach the LLM; with stream=True the closing insights and suggestions are streamed to on_item
+def integrate_schemas(schemas, research_goal, stream=False, on_item=None, model=MODEL):
+    complete_summary = None
+    if stream:
+        complete_summary = lambda prompt: stream_schema_json(prompt, on_item, keys=("insights", "suggestions"), model=model)
+    return merge_schemas(schemas, research_goal, complete_summary=complete_summary, model=model)
+
+# Function to stream a JSON generation, handing each finished entity, insight and suggestion to
+# on_item(key, item) as it closes and aborting as soon as the output can no longer be valid JSON.
+# Returns the parsed object, or None if the stream failed or did not produce valid JSON
+def stream_schema_json(prompt, on_item=None, keys=("entities", "insights", "suggestions"), model=MODEL):
+    parser = IncrementalJSONItems(keys)
+    chunks = get_client().stream_generate(prompt, model=model, format="json")
+    try:
+        for chunk in chunks:
+            for key, item in parser.feed(chunk):
+                if on_item:
+                    on_item(key, item)
+        return parser.close()
+    except (StreamAbort, json.JSONDecodeError) as e:
+        console.print(f"JSON Decode Error: {e}")
         return None
-
-def visualize_knowledge_graph(schema):
+    except LLMError as e:
+        console.print(f"Error: {e}")
+        return None
+    finally:
+        chunks.close()
+
+# Function to print streamed schema items as they arrive
+def print_streamed_item(key, item):
+    if not isinstance(item, dict):
+        console.print(f"[dim]{key}:[/dim] {item}")
+        return
+    label = item.get('name') or item.get('title') or item.get('description', '')
+    console.print(f"[dim]{key}:[/dim] {label}")
+
+# Function to render the knowledge graph. Small graphs become a pyvis page with a precomputed layout
+# (physics off); graphs above PYVIS_MAX_NODES are written as compact JSON plus a canvas viewer that
+# loads it lazily and shows collapsed communities until zoomed in.
+def visualize_knowledge_graph(schema, filename='UECM_knowledge_graph.html', min_relevance=None, min_degree=0, max_nodes=None):
+    graph = KnowledgeGraph(schema.get('entities', [])).prune(min_relevance, min_degree, max_nodes)
+    if len(graph) > PYVIS_MAX_NODES:
+        write_graph_bundle(graph, filename)
+        console.print(f"Knowledge graph saved as '{filename}' with data in '{os.path.splitext(filename)[0]}.json'")
+        return
+
+    from pyvis.network import Network
     net = Network(height='750px', width='100%', directed=True, notebook=True)
+    positions = layout_positions(graph)
+    for node, name in enumerate(graph.names):
+        relevance = graph.relevance[node]
+        net.add_node(name, label=name, title=f"Type: {graph.types[node]}\nRelevance: {relevance:.2f}", color=get_node_color(relevance),
+                     x=int(positions[node][0]), y=int(positions[node][1]), physics=False)
+    for source, target, kind in graph.edges:
+        net.add_edge(graph.names[source], graph.names[target], title=graph.edge_types[kind], arrows='to')
     
-    for entity in schema.get('entities', []):
-        node_color = get_node_color(entity['relevance_score'])
-        net.add_node(entity['name'], label=entity['name'], title=f"Type: {entity['type']}\nRelevance: {entity['relevance_score']:.2f}", color=node_color)
-    
-    for entity in schema.get('entities', []):
-        for relationship in entity.get('relationships', []):
-            if relationship['target'] in [node['id'] for node in net.nodes]:
-                net.add_edge(entity['name'], relationship['target'], title=relationship['type'], arrows='to')
-            else:
-                loguru.logger.warning(f"Target node '{relationship['target']}' not found for relationship from '{entity['name']}'")
-    
-    net.show_buttons(filter_=['physics'])
-    net.save_graph('UECM_knowledge_graph.html')
-    console.print("Knowledge graph saved as 'UECM_knowledge_graph.html'")
+    net.toggle_physics(False)
+    net.save_graph(filename)
+    console.print(f"Knowledge graph saved as '{filename}'")
 
 def get_node_color(relevance_score):
     r = int(255 * (1 - relevance_score))
@@ -202,48 +230,76 @@ def generate_possible_queries(schema):
     }}
     """
 
-    headers = {'Content-Type': 'application/json'}
-    data = {
-        "model": MODEL,
-        "prompt": prompt,
-        "stream": False,
-        "format": "json"
-    }
-    response = requests.post(API_URL, headers=headers, data=json.dumps(data))
+    try:
+        response = get_client().generate(prompt, model=MODEL, format="json")
+    except LLMError as e:
+        console.print(f"Error: {e}")
+        return None
 
-    if response.status_code == 200:
-        try:
-            queries = json.loads(response.json().get("response", "{}"))
-            return queries
-        except json.JSONDecodeError as e:
-            console.print(f"JSON Decode Error: {e}")
-            return None
-    else:
-        console.print(f"Error: {response.status_code}")
+    try:
+        queries = json.loads(response.get("response", "{}"))
+        return queries
+    except json.JSONDecodeError as e:
+        console.print(f"JSON Decode Error: {e}")
         return None
 
-def main():
+# Function to merge saved pre-flight schemas (plus any extra_paths) without prompts and write the final
+# schema to output_dir. Returns the combined schema, or None if the merge failed.
+def run_schema_merge(structured_path, unstructured_path, research_goal, output_dir=".", model=MODEL, graph=True, stream=False, on_item=None,
+                     graph_min_relevance=None, graph_min_degree=0, graph_max_nodes=None, extra_paths=()):
     loguru.logger.info("Loading structured and unstructured schemas.")
-    
-    with open('UECM_preflight_structured.json', 'r') as file:
-        structured_schema = json.load(file)
-    with open('UECM_preflight_unstructured.json', 'r') as file:
-        unstructured_schema = json.load(file)
-    
-    refined_research_goal = get_user_research_goal()
-    
+    schemas = []
+    for path in [structured_path, unstructured_path, *extra_paths]:
+        with open(path, 'r') as file:
+            schemas.append(json.load(file))
+
     loguru.logger.info("Comparing and integrating schemas with refined research goal.")
-    combined_schema = compare_and_integrate_schemas_with_llm(structured_schema, unstructured_schema, refined_research_goal)
+    combined_schema = integrate_schemas(schemas, research_goal, stream=stream, on_item=on_item, model=model)
+    if not combined_schema:
+        loguru.logger.error("Failed to generate final UECM schema.")
+        return None
+
+    loguru.logger.info("Final UECM Schema generated successfully.")
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, 'UECM_final_schema.json'), 'w') as outfile:
+        json.dump(combined_schema, outfile, indent=4)
+    if graph:
+        loguru.logger.info("Visualizing knowledge graph.")
+        visualize_knowledge_graph(combined_schema, os.path.join(output_dir, 'UECM_knowledge_graph.html'),
+                                  min_relevance=graph_min_relevance, min_degree=graph_min_degree, max_nodes=graph_max_nodes)
+    return combined_schema
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="UECM schema comparison, integration and query session")
+    parser.add_argument("--no-graph", action="store_true", help="skip rendering the knowledge graph HTML")
+    parser.add_argument("--extra-schema", action="append", default=[], help="another UECM schema to merge in (repeatable)")
+    parser.add_argument("--graph-min-relevance", type=float, default=None, help="leave entities below this relevance score out of the knowledge graph")
+    parser.add_argument("--graph-min-degree", type=int, default=0, help="leave entities with fewer relationships out of the knowledge graph")
+    parser.add_argument("--graph-max-nodes", type=int, default=None, help="keep only this many of the most relevant entities in the knowledge graph")
+    parser.add_argument("--plot-queries", action="store_true", help="save a visualization and heatmap for each query result")
+    parser.add_argument("--trace", help="write a Chrome trace-event JSON of the run to this file")
+    parser.add_argument("--metrics-out", help="write a Prometheus text snapshot of the run's counters to this file")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace or args.metrics_out:
+        uecm_trace.enable()
+    try:
+        run_session(args)
+    finally:
+        uecm_trace.export(args.trace, args.metrics_out)
+
+def run_session(args):
+    refined_research_goal = get_user_research_goal()
+    combined_schema = run_schema_merge('UECM_preflight_structured.json', 'UECM_preflight_unstructured.json', refined_research_goal,
+                                       graph=not args.no_graph, stream=True, on_item=print_streamed_item,
+                                       graph_min_relevance=args.graph_min_relevance, graph_min_degree=args.graph_min_degree,
+                                       graph_max_nodes=args.graph_max_nodes, extra_paths=args.extra_schema)
 
     if combined_schema:
-        loguru.logger.info("Final UECM Schema generated successfully.")
-        with open('UECM_final_schema.json', 'w') as outfile:
-            json.dump(combined_schema, outfile, indent=4)
         console.print_json(data=json.dumps(combined_schema, indent=4))
         
-        loguru.logger.info("Visualizing knowledge graph.")
-        visualize_knowledge_graph(combined_schema)
-        
         console.print("\nKey Insights:")
         for insight in combined_schema.get('insights', []):
             console.print(f"- {insight['description']}")
@@ -280,14 +336,12 @@ def main():
             console.print(result)
 
             # Visualize the results
-            memory_manager.visualize_query_results(result)
-            memory_manager.generate_heatmap(result)
-
-            console.print("Query result visualization saved as 'query_result_visualization.html'")
-            console.print("Query result heatmap saved as 'query_result_heatmap.png'")
+            if args.plot_queries:
+                memory_manager.visualize_query_results(result)
+                memory_manager.generate_heatmap(result)
 
-    else:
-        loguru.logger.error("Failed to generate final UECM schema.")
+                console.print("Query result visualization saved as 'query_result_visualization.html'")
+                console.print("Query result heatmap saved as 'query_result_heatmap.png'")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
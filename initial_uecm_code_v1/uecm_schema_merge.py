@@ -0,0 +1,321 @@
+import json
+import threading
+import loguru
+from concurrent.futures import ThreadPoolExecutor
+from uecm_normalize import fold
+from uecm_llm_client import get_client, LLMError
+import uecm_trace
+
+DEFAULT_MODEL = "llama3.1:latest"
+DEFAULT_MERGE_WORKERS = 4
+DEFAULT_RELEVANCE = 0.5
+DESCRIPTION_CHARS = 200
+SCORING_BATCH_CHARS = 8000
+CONTEXT_ENTITIES = 50
+SYSTEM_INSTRUCTIONS = "You are a helpful assistant specializing in data analysis and entity recognition. Provide concise and accurate responses in JSON format."
+
+
+def _compact(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def _short(text):
+    text = text or ""
+    return text if len(text) <= DESCRIPTION_CHARS else text[:DESCRIPTION_CHARS - 3] + "..."
+
+
+def _entity(name, type_="", relevance_score=None, description="", relationships=None, source=None):
+    return {
+        "name": name,
+        "type": type_ or "",
+        "relevance_score": relevance_score,
+        "description": description or "",
+        "relationships": [dict(relationship) for relationship in relationships or [] if isinstance(relationship, dict) and isinstance(relationship.get('target'), str)],
+        "sources": [] if source is None else [source],
+    }
+
+
+# Function to read the entities of any UECM schema into one shape: a merged schema ("entities"),
+# a structured pre-flight ("entity_structure") or an unstructured pre-flight ("entity_analysis")
+def schema_entities(schema, source=None):
+    entities = []
+    for entity in schema.get('entities') or []:
+        if isinstance(entity, dict) and entity.get('name'):
+            entities.append(_entity(entity['name'], entity.get('type'), entity.get('relevance_score'), entity.get('description'), entity.get('relationships'), source))
+    for entity in schema.get('entity_structure') or []:
+        if isinstance(entity, dict) and entity.get('entity_name'):
+            description = entity.get('description') or ""
+            if entity.get('relevance_to_objective'):
+                description = f"{description} {entity['relevance_to_objective']}".strip()
+            entities.append(_entity(entity['entity_name'], "", None, description, None, source))
+    for entity in (schema.get('entity_analysis') or {}).get('relevant_entities') or []:
+        if isinstance(entity, dict) and isinstance(entity.get('entity'), str):
+            label, _, text = entity['entity'].rpartition(": ")
+            entities.append(_entity(text, label, entity.get('relevance_score'), entity.get('description'), None, source))
+    return entities
+
+
+def _merge_relationships(relationships):
+    merged = {}
+    for relationship in relationships:
+        key = (fold(relationship['target']), fold(relationship.get('type') or ""))
+        current = merged.get(key)
+        if current is None:
+            merged[key] = dict(relationship)
+        elif len(relationship.get('description') or "") > len(current.get('description') or ""):
+            current['description'] = relationship['description']
+    return list(merged.values())
+
+
+# Function to merge two entity lists in code.
+# Entities match when their folded names are equal (case, accents, punctuation, possessives and
+# salt/acid suffixes, as in uecm_normalize). Matching entities are combined: the first non-empty
+# type, the highest relevance score, the longest description and the union of relationships.
+# A group whose members disagree on type is returned as a conflict for the LLM to settle; its
+# provisional merge is kept until then. Returns (entities, conflicts).
+def merge_entity_lists(first, second):
+    groups = {}
+    for entity in list(first) + list(second):
+        groups.setdefault(fold(entity['name']), []).append(entity)
+    merged, conflicts = [], []
+    for key, group in groups.items():
+        scores = [entity['relevance_score'] for entity in group if isinstance(entity['relevance_score'], (int, float))]
+        entity = {
+            "name": group[0]['name'],
+            "type": next((member['type'] for member in group if member['type']), ""),
+            "relevance_score": max(scores) if scores else None,
+            "description": max((member['description'] for member in group), key=len),
+            "relationships": _merge_relationships([relationship for member in group for relationship in member['relationships']]),
+            "sources": sorted({source for member in group for source in member['sources']}),
+        }
+        merged.append(entity)
+        types = {fold(member['type']) for member in group if member['type']}
+        if len(types) > 1:
+            conflicts.append({
+                "key": key,
+                "candidates": [{"name": member['name'], "type": member['type'], "description": _short(member['description'])} for member in group],
+            })
+    return merged, conflicts
+
+
+# Function to call the LLM for a JSON object; returns None when the call or the parse fails or the
+# answer is not an object
+def generate_json(prompt, model=DEFAULT_MODEL):
+    try:
+        response = get_client().generate(prompt, model=model, format="json")
+        answer = json.loads(response.get("response", "{}"))
+    except (LLMError, json.JSONDecodeError, AttributeError) as e:
+        loguru.logger.error(f"Schema merge LLM call failed: {e}")
+        return None
+    if not isinstance(answer, dict):
+        loguru.logger.error(f"Schema merge LLM call returned {type(answer).__name__}, expected a JSON object")
+        return None
+    return answer
+
+
+# Function to read a list of objects from an LLM answer, skipping anything that is not an object
+def _records(answer, field):
+    records = answer.get(field)
+    return [record for record in records if isinstance(record, dict)] if isinstance(records, list) else []
+
+
+def _text(record, field):
+    value = record.get(field)
+    return value if isinstance(value, str) else ""
+
+
+def _resolve_conflicts(entities, conflicts, research_goal, complete_json):
+    if not conflicts:
+        return entities
+    prompt = f"""{SYSTEM_INSTRUCTIONS}
+
+Research Goal: {research_goal}
+
+The same entity was described differently by different source schemas. For each conflict, choose the entity name, type and a one-sentence description that best fit the research goal.
+
+Conflicts:
+{_compact(conflicts)}
+
+Return a JSON object: {{"resolutions": [{{"key": "string (from the conflict)", "name": "string", "type": "string", "description": "string"}}]}}
+"""
+    answer = complete_json(prompt) or {}
+    by_key = {fold(entity['name']): entity for entity in entities}
+    resolved = 0
+    for resolution in _records(answer, 'resolutions'):
+        entity = by_key.get(_text(resolution, 'key'))
+        if entity is None:
+            continue
+        for field in ("name", "type", "description"):
+            if _text(resolution, field):
+                entity[field] = resolution[field]
+        resolved += 1
+    if resolved < len(conflicts):
+        loguru.logger.warning(f"{len(conflicts) - resolved} of {len(conflicts)} entity conflicts kept their first-source values")
+    return entities
+
+
+def _scoring_batches(entities):
+    batch, size = [], 0
+    for entity in entities:
+        item = {"name": entity['name'], "type": entity['type'], "description": _short(entity['description'])}
+        length = len(_compact(item))
+        if batch and size + length > SCORING_BATCH_CHARS:
+            yield batch
+            batch, size = [], 0
+        batch.append(item)
+        size += length
+    if batch:
+        yield batch
+
+
+def _score_entities(batch, research_goal, context, complete_json):
+    prompt = f"""{SYSTEM_INSTRUCTIONS}
+
+Research Goal: {research_goal}
+
+Entities already in the schema (for context): {_compact(context)}
+
+Score how relevant each of these entities is to the research goal (0-1), say whether it should be kept, and suggest relationships between them and the entities above that would be valuable for the research goal.
+
+Entities to score:
+{_compact(batch)}
+
+Return a JSON object: {{"scores": [{{"name": "string", "relevance_score": float, "include": true}}], "relationships": [{{"source": "string", "target": "string", "type": "string", "description": "string"}}]}}
+"""
+    return complete_json(prompt) or {}
+
+
+def _summarize(entities, research_goal, stats, complete_json):
+    top = sorted(entities, key=lambda entity: -(entity['relevance_score'] or 0.0))[:CONTEXT_ENTITIES]
+    prompt = f"""{SYSTEM_INSTRUCTIONS}
+
+Research Goal: {research_goal}
+
+A unified schema of {len(entities)} entities was merged from {stats['sources']} source schemas ({stats['matched']} entities matched across sources, {stats['conflicts']} conflicts resolved). The most relevant entities are:
+{_compact([{"name": entity['name'], "type": entity['type'], "relevance_score": entity['relevance_score'], "description": _short(entity['description'])} for entity in top])}
+
+Provide key insights for the research goal and suggestions for new entities, relationships or analyses.
+
+Return a JSON object: {{"insights": [{{"description": "string", "relevance_to_goal": "string"}}], "suggestions": [{{"title": "string", "description": "string"}}]}}
+"""
+    return complete_json(prompt) or {}
+
+
+# Function to integrate any number of UECM schemas into one merged schema.
+#
+# Sources are reduced as a pairwise tree (pairs merged concurrently, level by level). Each merge
+# matches entities in code and sends only type conflicts to the LLM. At the root, entities
+# that still lack a relevance score are scored against the goal in size-bounded batches, and a last
+# call over the top entities produces insights and suggestions. No prompt contains a full schema.
+# complete_json(prompt) -> dict or None performs the LLM calls; complete_summary optionally
+# replaces it for the final call (e.g. to stream insights as they arrive). A None answer counts as a
+# failed call in merge_stats; if every call failed (e.g. Ollama is down) the merge returns None.
+def merge_schemas(schemas, research_goal, complete_json=None, complete_summary=None, max_workers=DEFAULT_MERGE_WORKERS, model=DEFAULT_MODEL):
+    with uecm_trace.span("schema_merge", "merge", sources=len(schemas)) as span:
+        merged = _merge_schemas(schemas, research_goal, complete_json, complete_summary, max_workers, model)
+        if merged is not None:
+            span.set(**merged["merge_stats"])
+        return merged
+
+
+def _merge_schemas(schemas, research_goal, complete_json, complete_summary, max_workers, model):
+    complete_json = complete_json or (lambda prompt: generate_json(prompt, model))
+    complete_summary = complete_summary or complete_json
+    stats = {"sources": len(schemas), "input_entities": 0, "matched": 0, "conflicts": 0, "llm_calls": 0, "llm_failures": 0}
+    stats_lock = threading.Lock()
+
+    def count(**increments):
+        with stats_lock:
+            for key, value in increments.items():
+                stats[key] += value
+
+    def counted(function):
+        def call(prompt):
+            answer = function(prompt)
+            if not isinstance(answer, dict):
+                answer = None
+            count(llm_calls=1, llm_failures=int(answer is None))
+            return answer
+        return call
+
+    complete_json, complete_summary = counted(complete_json), counted(complete_summary)
+
+    def merge_pair(first, second):
+        with uecm_trace.span("schema_merge.pair", "merge", entities=len(first) + len(second)) as span:
+            entities, conflicts = merge_entity_lists(first, second)
+            count(matched=len(first) + len(second) - len(entities), conflicts=len(conflicts))
+            span.set(conflicts=len(conflicts))
+            return _resolve_conflicts(entities, conflicts, research_goal, complete_json)
+
+    def score(batch):
+        with uecm_trace.span("schema_merge.score", "merge", entities=len(batch)):
+            return _score_entities(batch, research_goal, context, complete_json)
+
+    level = [schema_entities(schema, source) for source, schema in enumerate(schemas)]
+    stats["input_entities"] = sum(len(entities) for entities in level)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        if len(level) == 1:
+            level = [merge_pair(level[0], [])]
+        while len(level) > 1:
+            merged = list(executor.map(lambda pair: merge_pair(*pair), zip(level[0::2], level[1::2])))
+            if len(level) % 2:
+                merged.append(level[-1])
+            level = merged
+        entities = level[0] if level else []
+
+        unscored = [entity for entity in entities if entity['relevance_score'] is None]
+        context = [entity['name'] for entity in entities if entity['relevance_score'] is not None][:CONTEXT_ENTITIES]
+        answers = list(executor.map(score, list(_scoring_batches(unscored))))
+
+    # Point relationships at the surviving spelling of their target
+    by_name = {fold(entity['name']): entity for entity in entities}
+    for entity in entities:
+        for relationship in entity['relationships']:
+            target = by_name.get(fold(relationship['target']))
+            if target is not None:
+                relationship['target'] = target['name']
+        entity['relationships'] = _merge_relationships(entity['relationships'])
+
+    excluded = set()
+    for answer in answers:
+        for score in _records(answer, 'scores'):
+            entity = by_name.get(fold(_text(score, 'name')))
+            if entity is None:
+                continue
+            if isinstance(score.get('relevance_score'), (int, float)) and not isinstance(score['relevance_score'], bool):
+                entity['relevance_score'] = float(score['relevance_score'])
+            if score.get('include') is False:
+                excluded.add(fold(entity['name']))
+        for relationship in _records(answer, 'relationships'):
+            source = by_name.get(fold(_text(relationship, 'source')))
+            target = by_name.get(fold(_text(relationship, 'target')))
+            if source is not None and target is not None:
+                source['relationships'] = _merge_relationships(source['relationships'] + [{
+                    "target": target['name'], "type": _text(relationship, 'type'), "description": _text(relationship, 'description'),
+                }])
+    for entity in entities:
+        if entity['relevance_score'] is None:
+            entity['relevance_score'] = DEFAULT_RELEVANCE
+    entities = [entity for entity in entities if fold(entity['name']) not in excluded]
+    for entity in entities:
+        del entity['sources']
+        entity['relationships'] = [relationship for relationship in entity['relationships'] if fold(relationship['target']) not in excluded]
+
+    with uecm_trace.span("schema_merge.summary", "merge"):
+        summary = _summarize(entities, research_goal, stats, complete_summary)
+    if stats["llm_calls"] and stats["llm_failures"] == stats["llm_calls"]:
+        loguru.logger.error(f"Schema merge failed: all {stats['llm_calls']} LLM calls failed")
+        return None
+    if stats["llm_failures"]:
+        loguru.logger.warning(f"{stats['llm_failures']} of {stats['llm_calls']} schema merge LLM calls failed; "
+                              f"affected entities keep default scores or first-source values")
+    stats["output_entities"] = len(entities)
+    loguru.logger.info(f"Merged {stats['input_entities']} entities from {stats['sources']} schemas into {len(entities)} "
+                       f"({stats['matched']} matched, {stats['conflicts']} conflicts, {stats['llm_calls']} LLM calls, {stats['llm_failures']} failed)")
+    return {
+        "research_goal": research_goal,
+        "entities": entities,
+        "insights": _records(summary, 'insights'),
+        "suggestions": _records(summary, 'suggestions'),
+        "merge_stats": stats,
+    }
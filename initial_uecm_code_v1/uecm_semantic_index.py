@@ -0,0 +1,143 @@
+import hashlib
+import json
+import os
+import loguru
+import numpy as np
+from uecm_models import get_sentence_model, DEFAULT_SENTENCE_MODEL
+
+DEFAULT_EMBEDDING_MODEL = DEFAULT_SENTENCE_MODEL
+DEFAULT_INDEX_DIR = "uecm_semantic_index"
+INTENT_THRESHOLD = 0.45
+ENTITY_THRESHOLD = 0.35
+
+# Example phrasings for each query handler in MemoryManager; queries are routed to the nearest one
+INTENTS = {
+    "mechanism_of_action": [
+        "what is the mechanism of action",
+        "how does this drug work",
+        "which pathway or target does it act on",
+        "what does the drug inhibit or activate",
+    ],
+    "clinical_trials": [
+        "what clinical trials exist",
+        "which trial phase is this drug in",
+        "is this treatment being tested in patients",
+        "what studies evaluated this therapy",
+    ],
+    "multi_hop": [
+        "how are these two related",
+        "what connects this drug to that disease",
+        "what is the path between them",
+        "which genes link this treatment to the condition",
+    ],
+}
+
+
+# Function to get the shared sentence-transformers encoder on the CPU (optional dependency)
+def load_encoder(model_name=DEFAULT_EMBEDDING_MODEL):
+    return get_sentence_model(model_name)
+
+
+# Nearest-neighbour index over a merged UECM schema.
+#
+# Entity names with their descriptions, relationship descriptions and the intent phrasings above are
+# embedded once and saved to `index_dir` as a float32 .npy matrix plus JSON metadata. On later
+# startups the matrix is memory-mapped instead of re-encoded, as long as the schema and model match.
+# Search is a brute-force dot product over normalized vectors, which stays in the millisecond range
+# for tens of thousands of rows.
+class SemanticIndex:
+    def __init__(self, entities, encoder=None, model_name=DEFAULT_EMBEDDING_MODEL, index_dir=DEFAULT_INDEX_DIR):
+        self.model_name = model_name
+        self.index_dir = index_dir
+        self._encoder = encoder
+        self.documents = self._documents(entities)
+        self.fingerprint = hashlib.sha256(json.dumps([model_name, self.documents], sort_keys=True).encode("utf-8")).hexdigest()
+        self.embeddings = self._load() if index_dir else None
+        if self.embeddings is None:
+            self.embeddings = self._build()
+        kinds = np.array([document["kind"] for document in self.documents])
+        self.rows = {kind: np.flatnonzero(kinds == kind) for kind in ("entity", "relationship", "intent")}
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = load_encoder(self.model_name)
+        return self._encoder
+
+    @staticmethod
+    def _documents(entities):
+        documents = []
+        for entity in entities:
+            text = entity['name']
+            if entity.get('description'):
+                text = f"{text}: {entity['description']}"
+            documents.append({"kind": "entity", "entity": entity['name'], "text": text})
+            for relationship in entity.get('relationships') or []:
+                if isinstance(relationship, dict) and relationship.get('target'):
+                    documents.append({
+                        "kind": "relationship",
+                        "entity": entity['name'],
+                        "text": f"{entity['name']} {relationship.get('type', '')} {relationship['target']}: {relationship.get('description', '')}",
+                    })
+        for intent, phrasings in INTENTS.items():
+            documents.extend({"kind": "intent", "intent": intent, "text": phrasing} for phrasing in phrasings)
+        return documents
+
+    def _encode(self, texts):
+        return np.asarray(self.encoder.encode(texts, batch_size=64, normalize_embeddings=True, show_progress_bar=False), dtype=np.float32)
+
+    def _load(self):
+        meta_path = os.path.join(self.index_dir, "meta.json")
+        matrix_path = os.path.join(self.index_dir, "embeddings.npy")
+        if not (os.path.exists(meta_path) and os.path.exists(matrix_path)):
+            return None
+        try:
+            with open(meta_path, 'r') as f:
+                if json.load(f).get("fingerprint") != self.fingerprint:
+                    return None
+            embeddings = np.load(matrix_path, mmap_mode="r")
+        except Exception as e:
+            loguru.logger.warning(f"Ignoring unreadable semantic index in {self.index_dir}: {e}")
+            return None
+        loguru.logger.info(f"Memory-mapped semantic index with {len(embeddings)} rows from {self.index_dir}")
+        return embeddings
+
+    def _build(self):
+        loguru.logger.info(f"Encoding {len(self.documents)} schema texts with {self.model_name}")
+        embeddings = self._encode([document["text"] for document in self.documents])
+        if self.index_dir:
+            try:
+                os.makedirs(self.index_dir, exist_ok=True)
+                np.save(os.path.join(self.index_dir, "embeddings.npy"), embeddings)
+                with open(os.path.join(self.index_dir, "meta.json"), 'w') as f:
+                    json.dump({"fingerprint": self.fingerprint, "model": self.model_name, "documents": self.documents}, f)
+            except Exception as e:
+                loguru.logger.error(f"Failed to save semantic index: {e}")
+        return embeddings
+
+    def _nearest(self, all_scores, kind, k):
+        rows = self.rows[kind]
+        if not len(rows):
+            return []
+        scores = all_scores[rows]
+        if k < len(rows):
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(len(rows))
+        top = top[np.argsort(-scores[top])]
+        return [(self.documents[rows[index]], float(scores[index])) for index in top]
+
+    # Function to route a query: returns (intent or None, intent score, [(entity name, score), ...])
+    def query(self, text, k=5, intent_threshold=INTENT_THRESHOLD, entity_threshold=ENTITY_THRESHOLD):
+        all_scores = np.asarray(self.embeddings @ self._encode([text])[0])
+        intent, intent_score = None, 0.0
+        nearest_intents = self._nearest(all_scores, "intent", 1)
+        if nearest_intents and nearest_intents[0][1] >= intent_threshold:
+            intent, intent_score = nearest_intents[0][0]["intent"], nearest_intents[0][1]
+        entity_scores = {}
+        for kind in ("entity", "relationship"):
+            for document, score in self._nearest(all_scores, kind, k):
+                if score >= entity_threshold and score > entity_scores.get(document["entity"], 0.0):
+                    entity_scores[document["entity"]] = score
+        ranked = sorted(entity_scores.items(), key=lambda item: -item[1])[:k]
+        return intent, intent_score, ranked
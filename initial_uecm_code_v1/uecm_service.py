@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import loguru
+from uecm_models import get_gliner, get_spacy, is_loaded, DEFAULT_GLINER_MODEL, DEFAULT_SPACY_MODEL
+from uecm_ner_engine import NEREngine, DEFAULT_BATCH_SIZE
+from uecm_llm_client import get_client
+import uecm_trace
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_PENDING = 32
+DEFAULT_BATCH_WAIT_MS = 10
+DEFAULT_MAX_BATCH_DOCUMENTS = 64
+DEFAULT_SCHEMA_PATH = "UECM_final_schema.json"
+# Same labels as the unstructured pre-flight
+DEFAULT_NER_LABELS = ["DISEASE", "DRUG", "TREATMENT", "MECHANISM", "TRIAL_PHASE", "APPROVAL_STATUS", "SIDE_EFFECT"]
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+# Function to import uecm_prepare_compare-memory.py, whose file name is not a valid module name
+def load_compare_module():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uecm_prepare_compare-memory.py")
+    spec = importlib.util.spec_from_file_location("uecm_prepare_compare_memory", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+# Collects NER requests from concurrent clients and runs them through GLiNER together.
+#
+# A single worker thread takes the first pending request, waits up to `max_wait` seconds for more to
+# arrive (up to `max_documents` texts), then groups them by (labels, threshold) and runs each group
+# as one NEREngine pass so windows from different clients share batches.
+class NERBatcher:
+    def __init__(self, model, batch_size=DEFAULT_BATCH_SIZE, max_wait=DEFAULT_BATCH_WAIT_MS / 1000,
+                 max_documents=DEFAULT_MAX_BATCH_DOCUMENTS):
+        self.model = model
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.max_documents = max_documents
+        self.pending = queue.Queue()
+        self.stats = {"requests": 0, "documents": 0, "rounds": 0, "windows": 0, "seconds": 0.0}
+        self._stats_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="ner-batcher", daemon=True)
+        self._thread.start()
+
+    # Function to queue texts for NER; returns a Future resolving to one span list per text
+    def submit(self, texts, labels, threshold):
+        future = Future()
+        self.pending.put((list(texts), tuple(labels), threshold, future))
+        return future
+
+    def _collect(self):
+        jobs = [self.pending.get()]
+        documents = len(jobs[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while documents < self.max_documents:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                job = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            jobs.append(job)
+            documents += len(job[0])
+        return jobs
+
+    def _run(self):
+        while True:
+            jobs = self._collect()
+            groups = {}
+            for job in jobs:
+                groups.setdefault((job[1], job[2]), []).append(job)
+            for (labels, threshold), group in groups.items():
+                texts = [text for job in group for text in job[0]]
+                try:
+                    engine = NEREngine(self.model, labels, batch_size=self.batch_size, threshold=threshold)
+                    spans = engine.predict_documents(texts)
+                except Exception as e:
+                    for job in group:
+                        job[3].set_exception(e)
+                    continue
+                start = 0
+                for job in group:
+                    job[3].set_result(spans[start:start + len(job[0])])
+                    start += len(job[0])
+                with self._stats_lock:
+                    self.stats["requests"] += len(group)
+                    self.stats["documents"] += len(texts)
+                    self.stats["rounds"] += 1
+                    self.stats["windows"] += engine.stats["windows"]
+                    self.stats["seconds"] += engine.stats["seconds"]
+
+    def metrics(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["queued"] = self.pending.qsize()
+        stats["mean_documents_per_round"] = stats["documents"] / stats["rounds"] if stats["rounds"] else 0.0
+        return stats
+
+
+# State shared by all request threads: the warm models, the NER batcher and the resident MemoryManager
+class UECMService:
+    def __init__(self, schema_path=DEFAULT_SCHEMA_PATH, gliner_model_id=DEFAULT_GLINER_MODEL, max_pending=DEFAULT_MAX_PENDING,
+                 batch_wait_ms=DEFAULT_BATCH_WAIT_MS, max_batch_documents=DEFAULT_MAX_BATCH_DOCUMENTS):
+        self.compare = load_compare_module()
+        self.gliner_model_id = gliner_model_id
+        self.batcher = NERBatcher(get_gliner(gliner_model_id, lazy=True), max_wait=batch_wait_ms / 1000, max_documents=max_batch_documents)
+        self.slots = threading.BoundedSemaphore(max_pending)
+        self.started = time.time()
+        self.counters = {"requests": 0, "errors": 0, "rejected": 0}
+        self.latency = {}
+        self._lock = threading.Lock()
+        self.memory_manager = None
+        if schema_path and os.path.exists(schema_path):
+            with open(schema_path, 'r') as f:
+                self.set_schema(json.load(f))
+            loguru.logger.info(f"Loaded UECM schema from {schema_path}")
+
+    def set_schema(self, schema):
+        self.memory_manager = self.compare.MemoryManager(schema)
+
+    # Function to load every model up front so the first requests do not pay for it
+    def warm_up(self):
+        get_gliner(self.gliner_model_id)
+        get_spacy()
+        if self.memory_manager is not None:
+            self.memory_manager.entity_index
+
+    def record(self, endpoint, seconds, error=False):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.counters["errors"] += int(error)
+            total = self.latency.setdefault(endpoint, {"calls": 0, "seconds": 0.0})
+            total["calls"] += 1
+            total["seconds"] += seconds
+
+    def reject(self):
+        with self._lock:
+            self.counters["rejected"] += 1
+
+    def ner(self, body):
+        texts = body.get("texts")
+        if isinstance(body.get("text"), str):
+            texts = [body["text"]]
+        if not isinstance(texts, list) or not all(isinstance(text, str) for text in texts):
+            raise ValueError("'texts' must be a list of strings")
+        labels = body.get("labels", DEFAULT_NER_LABELS)
+        if not isinstance(labels, list) or not labels or not all(isinstance(label, str) and label for label in labels):
+            raise ValueError("'labels' must be a non-empty list of strings")
+        threshold = float(body.get("threshold", 0.5))
+        spans = self.batcher.submit(texts, labels, threshold).result()
+        return {"entities": spans}
+
+    def merge(self, body):
+        schemas = body.get("schemas")
+        if schemas is None:
+            schemas = [body.get("structured_schema"), body.get("unstructured_schema")]
+        if not isinstance(schemas, list) or not schemas or not all(isinstance(schema, dict) for schema in schemas):
+            raise ValueError("pass 'schemas' as a list of JSON objects, or 'structured_schema' and 'unstructured_schema'")
+        combined = self.compare.integrate_schemas(schemas, body.get("research_goal", ""))
+        if combined is None:
+            raise RuntimeError("schema merge failed")
+        if body.get("activate"):
+            self.set_schema(combined)
+        return {"schema": combined}
+
+    def query(self, body):
+        if self.memory_manager is None:
+            raise LookupError("no UECM schema loaded; POST /merge with \"activate\": true or start with --schema")
+        if not isinstance(body.get("query"), str):
+            raise ValueError("'query' must be a string")
+        return {"result": self.memory_manager.process_query(body["query"])}
+
+    def health(self):
+        return {
+            "status": "ok",
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "models": {"gliner": is_loaded("gliner", self.gliner_model_id), "spacy": is_loaded("spacy", DEFAULT_SPACY_MODEL)},
+            "schema_loaded": self.memory_manager is not None,
+        }
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self.counters)
+            latency = {endpoint: {**total, "mean_seconds": total["seconds"] / total["calls"]} for endpoint, total in self.latency.items()}
+        return {**counters, "latency": latency, "ner": self.batcher.metrics(), "llm": get_client().metrics()}
+
+    # Function to return the trace counters in Prometheus text format (empty unless started with --trace)
+    def prometheus(self):
+        tracer = uecm_trace.get_tracer()
+        return tracer.prometheus_text() if tracer is not None else ""
+
+
+class UECMRequestHandler(BaseHTTPRequestHandler):
+    service = None
+    get_routes = {"/health": "health", "/metrics": "metrics", "/metrics/prometheus": "prometheus"}
+    post_routes = {"/ner": "ner", "/merge": "merge", "/query": "query"}
+
+    def log_message(self, format, *args):
+        loguru.logger.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, payload):
+        if isinstance(payload, str):
+            data, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        route = self.get_routes.get(self.path.split("?", 1)[0])
+        if route is None:
+            return self._send(404, {"error": f"unknown endpoint {self.path}"})
+        self._send(200, getattr(self.service, route)())
+
+    def do_POST(self):
+        route = self.post_routes.get(self.path.split("?", 1)[0])
+        if route is None:
+            return self._send(404, {"error": f"unknown endpoint {self.path}"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            return self._send(413, {"error": "request body too large"})
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            return self._send(400, {"error": f"invalid JSON: {e}"})
+        if not isinstance(body, dict):
+            return self._send(400, {"error": "request body must be a JSON object"})
+        # Bounded request queue: shed load instead of piling up threads behind the model
+        if not self.service.slots.acquire(blocking=False):
+            self.service.reject()
+            return self._send(503, {"error": "server busy, retry later"})
+        started = time.perf_counter()
+        error = True
+        try:
+            with uecm_trace.span(f"service.{route}", "service"):
+                result = getattr(self.service, route)(body)
+            error = False
+            self._send(200, result)
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+        except LookupError as e:
+            self._send(409, {"error": str(e)})
+        except Exception as e:
+            loguru.logger.exception(f"{route} request failed")
+            self._send(500, {"error": str(e)})
+        finally:
+            self.service.slots.release()
+            self.service.record(route, time.perf_counter() - started, error)
+
+
+# Function to build the HTTP server around a service instance (port 0 picks a free port)
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    handler = type("BoundUECMRequestHandler", (UECMRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="UECM service: resident NER, schema merge and query over a local HTTP/JSON API")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="interface to bind")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+    parser.add_argument("--schema", default=DEFAULT_SCHEMA_PATH, help="final UECM schema to serve /query from, if it exists")
+    parser.add_argument("--max-pending", type=int, default=DEFAULT_MAX_PENDING, help="requests in progress before new ones get 503")
+    parser.add_argument("--batch-wait-ms", type=float, default=DEFAULT_BATCH_WAIT_MS, help="how long the NER batcher waits to fill a batch")
+    parser.add_argument("--max-batch-documents", type=int, default=DEFAULT_MAX_BATCH_DOCUMENTS, help="texts combined into one NER batch")
+    parser.add_argument("--no-preload", action="store_true", help="load models on the first request instead of at startup")
+    parser.add_argument("--trace", help="collect spans and counters (served at /metrics/prometheus) and write a Chrome trace here on shutdown")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.trace:
+        uecm_trace.enable()
+    service = UECMService(args.schema, max_pending=args.max_pending, batch_wait_ms=args.batch_wait_ms, max_batch_documents=args.max_batch_documents)
+    if not args.no_preload:
+        loguru.logger.info("Loading models.")
+        service.warm_up()
+    server = create_server(service, args.host, args.port)
+    loguru.logger.info(f"UECM service listening on http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        uecm_trace.export(args.trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from uecm_structured_profile import collect_column_value_counts
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+DEFAULT_CHUNK_ROWS = 50000
+DEFAULT_MAX_COLUMN_VALUES = 100000
+READ_BYTES = 1024 * 1024
+# Largest single array element the fallback parser buffers before declaring the file malformed
+MAX_ELEMENT_CHARS = 64 * 1024 * 1024
+NUMERIC_DTYPES = ("int", "uint", "float")
+
+
+# Function to stream the elements of a top-level JSON array without loading the whole file.
+# Uses ijson when installed, otherwise decodes one element at a time from a rolling buffer.
+# Malformed JSON raises ValueError on both paths, including an element over max_element_chars.
+def iter_json_array(path, max_element_chars=MAX_ELEMENT_CHARS):
+    if ijson is not None:
+        with open(path, 'rb') as f:
+            try:
+                yield from ijson.items(f, 'item', use_float=True)
+            except ijson.JSONError as e:
+                raise ValueError(f"{path} is not valid JSON: {e}") from e
+        return
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer = f.read(READ_BYTES).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} does not contain a top-level JSON array")
+        # expect_item: after '[' or ','; first: nothing read yet, so ']' may close an empty array
+        position, eof, expect_item, first = 1, False, True, True
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n':
+                position += 1
+            char = buffer[position] if position < len(buffer) else None
+            if char is None or expect_item and char != ']' and char != ',':
+                if char is not None:
+                    try:
+                        item, end = decoder.raw_decode(buffer, position)
+                        # A value ending exactly at the buffer edge (e.g. a number) may continue in the next read
+                        complete = end < len(buffer) or eof
+                    except json.JSONDecodeError as e:
+                        if eof:
+                            raise ValueError(f"{path} is not valid JSON: {e}") from e
+                        complete = False
+                    if complete:
+                        yield item
+                        position, expect_item, first = end, False, False
+                        continue
+                elif eof:
+                    raise ValueError(f"{path}: JSON array is not terminated")
+                if len(buffer) - position > max_element_chars:
+                    raise ValueError(f"{path}: an array element is not valid JSON within {max_element_chars} characters")
+                chunk = f.read(READ_BYTES)
+                eof = not chunk
+                buffer, position = buffer[position:] + chunk, 0
+            elif char == ',' and not expect_item:
+                position, expect_item = position + 1, True
+            elif char == ']' and (not expect_item or first):
+                rest = buffer[position + 1:]
+                while rest is not None:
+                    if rest.strip():
+                        raise ValueError(f"{path}: unexpected data after the JSON array")
+                    rest = f.read(READ_BYTES) or None
+                return
+            else:
+                expected = "an array element" if expect_item else "',' or ']'"
+                raise ValueError(f"{path}: expected {expected} but got {char!r}")
+
+
+def _batched(records, chunk_rows):
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= chunk_rows:
+            yield pd.DataFrame(batch)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch)
+
+
+# Function to read a structured data file as a sequence of DataFrame chunks.
+# Supports JSON arrays of records, JSON Lines, CSV and Parquet; a JSON object of columns (the other
+# shape pd.DataFrame accepts) cannot be streamed and is loaded whole.
+def iter_dataframe_chunks(path, chunk_rows=DEFAULT_CHUNK_ROWS):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in (".jsonl", ".ndjson"):
+        yield from pd.read_json(path, lines=True, chunksize=chunk_rows)
+    elif extension == ".csv":
+        yield from pd.read_csv(path, chunksize=chunk_rows)
+    elif extension == ".parquet":
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            first = f.read(READ_BYTES).lstrip()[:1]
+        if first == '{':
+            with open(path, 'r', encoding='utf-8') as f:
+                yield pd.DataFrame(json.load(f))
+        else:
+            yield from _batched(iter_json_array(path), chunk_rows)
+
+
+# Function to combine two column dtypes the way pandas infers them for the concatenated frame.
+# None stands for a column that only held nulls (or was missing) so far.
+def merge_dtypes(a, b):
+    if a is None:
+        a, b = b, a
+    if b is None:
+        if a is None:
+            return None
+        if a.startswith(NUMERIC_DTYPES[:2]):
+            return "float64"
+        return "object" if a == "bool" else a
+    if a == b:
+        return a
+    if a.startswith(NUMERIC_DTYPES) and b.startswith(NUMERIC_DTYPES):
+        return np.result_type(a, b).name
+    return "object"
+
+
+def _merge_schema(schema_info, chunk, first):
+    chunk_schema = {col: (None if chunk[col].isna().all() else dtype.name) for col, dtype in chunk.dtypes.items()}
+    if first:
+        schema_info.update(chunk_schema)
+        return
+    for col in schema_info:
+        schema_info[col] = merge_dtypes(schema_info[col], chunk_schema.get(col))
+    for col, dtype in chunk_schema.items():
+        if col not in schema_info:
+            schema_info[col] = merge_dtypes(dtype, None)
+
+
+# Function to profile a structured data file chunk by chunk.
+# Returns (schema_info, column value counts, row count); schema_info has the same {column: dtype name}
+# shape as df.dtypes on the whole file. With sample_rows set, only that many leading rows are read;
+# max_values caps the distinct values kept per column so high-cardinality columns stay bounded.
+def profile_structured_file(path, chunk_rows=DEFAULT_CHUNK_ROWS, sample_rows=None, max_values=DEFAULT_MAX_COLUMN_VALUES):
+    schema_info, value_counts = {}, {}
+    rows = 0
+    for chunk in iter_dataframe_chunks(path, chunk_rows):
+        if sample_rows is not None and rows + len(chunk) > sample_rows:
+            chunk = chunk.iloc[:sample_rows - rows]
+        _merge_schema(schema_info, chunk, first=rows == 0)
+        collect_column_value_counts(chunk, chunk.columns, value_counts, max_values)
+        rows += len(chunk)
+        if sample_rows is not None and rows >= sample_rows:
+            break
+    for col in schema_info:
+        value_counts.setdefault(col, {})
+        if schema_info[col] is None:
+            schema_info[col] = "object"
+    return schema_info, value_counts, rows
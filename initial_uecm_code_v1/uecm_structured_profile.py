@@ -0,0 +1,86 @@
+import random
+from uecm_ner_engine import NEREngine
+
+DEFAULT_SAMPLE_SIZE = 2000
+DEFAULT_STRATA = 4
+DEFAULT_PROFILE_BATCH_SIZE = 32
+
+
+# Function to count distinct string values per column; pass `counts` back in to accumulate chunks.
+# With max_values set, a column stops admitting new values once it holds that many (existing values keep counting).
+def collect_column_value_counts(df, columns, counts=None, max_values=None):
+    counts = {} if counts is None else counts
+    for col in columns:
+        column_counts = counts.setdefault(col, {})
+        for value, count in df[col].dropna().astype(str).value_counts().items():
+            if value in column_counts:
+                column_counts[value] += int(count)
+            elif max_values is None or len(column_counts) < max_values:
+                column_counts[value] = int(count)
+    return counts
+
+
+# Function to pick distinct values for NER, stratified by frequency rank.
+# Values are ranked by count and split into `strata` equal bands; each band contributes an equal
+# share of the sample, so rare values are represented alongside the head of the distribution.
+# The head band keeps its most frequent values, the other bands are sampled at random.
+def sample_column_values(value_counts, sample_size=DEFAULT_SAMPLE_SIZE, strata=DEFAULT_STRATA, seed=0):
+    ranked = sorted(value_counts, key=lambda value: (-value_counts[value], value))
+    if sample_size is None or len(ranked) <= sample_size:
+        return ranked
+    rng = random.Random(seed)
+    strata = max(1, min(strata, sample_size))
+    band_size = -(-len(ranked) // strata)
+    sample = []
+    for band in range(strata):
+        values = ranked[band * band_size:(band + 1) * band_size]
+        share = sample_size // strata + (1 if band < sample_size % strata else 0)
+        if len(values) <= share:
+            sample.extend(values)
+        else:
+            sample.extend(values[:share] if band == 0 else rng.sample(values, share))
+    return sample
+
+
+# Function to run NER over each column's distinct values and weight the results by value frequency.
+# NER cost follows column cardinality (capped by sample_size) instead of row count; values from all
+# columns share batches and a value seen in several columns is predicted once. Pass the same
+# `predictions` dict to later calls (with the same threshold) to reuse spans for labels that were
+# already run and only predict the new ones. Returns [{column: [{"text", "label", "score", "frequency"}, ...]}, ...].
+def recognize_column_entities(model, value_counts, labels, sample_size=DEFAULT_SAMPLE_SIZE, strata=DEFAULT_STRATA,
+                              batch_size=DEFAULT_PROFILE_BATCH_SIZE, threshold=0.5, columns=None, predictions=None):
+    columns = list(value_counts) if columns is None else columns
+    predictions = {} if predictions is None else predictions
+    samples = {}
+    pending = {}
+    for col in columns:
+        samples[col] = sample_column_values(value_counts.get(col, {}), sample_size, strata)
+        for value in samples[col]:
+            cached = predictions.setdefault(value, {"labels": set(), "spans": []})
+            missing = tuple(label for label in labels if label not in cached["labels"])
+            if missing:
+                pending.setdefault(missing, {})[value] = None
+    for missing, values in pending.items():
+        values = list(values)
+        engine = NEREngine(model, missing, batch_size=batch_size, threshold=threshold)
+        for index, spans in engine.iter_predict(values):
+            predictions[values[index]]["spans"].extend(spans)
+        for value in values:
+            predictions[value]["labels"].update(missing)
+
+    wanted = set(labels)
+    found = {col: {} for col in columns}
+    for col in columns:
+        for value in samples[col]:
+            frequency = value_counts[col][value]
+            for entity in predictions[value]["spans"]:
+                if entity['label'] not in wanted:
+                    continue
+                key = (entity['label'], entity['text'])
+                current = found[col].get(key)
+                if current is None:
+                    found[col][key] = {"text": entity['text'], "label": entity['label'], "score": entity['score'], "frequency": frequency}
+                else:
+                    current["score"] = max(current["score"], entity['score'])
+                    current["frequency"] += frequency
+    return [{col: sorted(found[col].values(), key=lambda entity: -entity["frequency"])} for col in columns]
@@ -0,0 +1,186 @@
+import os
+import re
+import json
+import time
+import threading
+from collections import deque
+import loguru
+
+DEFAULT_MAX_EVENTS = 1_000_000
+METRIC_PREFIX = "uecm"
+_LABEL_ESCAPES = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n"})
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, category, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.add_span(self.name, self.started, time.perf_counter() - self.started, self.category, self.args)
+        return False
+
+    # Function to attach arguments known only once the work is done, e.g. token counts
+    def set(self, **args):
+        self.args.update(args)
+
+
+# Collects timing spans and counters for one process.
+#
+# Spans are stored as Chrome trace "complete" events (thread, start, duration) in a bounded buffer,
+# so nested spans show up nested per thread in chrome://tracing or Perfetto. Every span also adds to
+# per-name call and second totals, and counters are labelled totals; those aggregates are kept even
+# once the event buffer is full and are what the Prometheus snapshot reports.
+class Tracer:
+    def __init__(self, max_events=DEFAULT_MAX_EVENTS):
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.events = deque(maxlen=max_events)
+        self.dropped = 0
+        self.span_totals = {}
+        self.counters = {}
+        self.thread_names = {}
+        self._lock = threading.Lock()
+
+    def span(self, name, category="uecm", **args):
+        return Span(self, name, category, args)
+
+    # Function to record a span timed elsewhere (another process, or a callback with its own clock).
+    # `started` is a time.perf_counter() value; `thread` names the timeline row the span is drawn on.
+    def add_span(self, name, started, seconds, category="uecm", args=None, thread=None):
+        thread = thread or threading.current_thread().name
+        event = {"name": name, "cat": category, "ph": "X", "ts": round((started - self.origin) * 1e6, 1),
+                 "dur": round(seconds * 1e6, 1), "pid": self.pid, "tid": thread, "args": args or {}}
+        with self._lock:
+            if len(self.events) == self.events.maxlen:
+                self.dropped += 1
+            self.events.append(event)
+            total = self.span_totals.setdefault(name, [0, 0.0])
+            total[0] += 1
+            total[1] += seconds
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+        threads = sorted({event["tid"] for event in events})
+        ids = {thread: index for index, thread in enumerate(threads)}
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self.pid, "tid": ids[thread], "args": {"name": thread}} for thread in threads]
+        return {
+            "traceEvents": metadata + [{**event, "tid": ids[event["tid"]]} for event in events],
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_events": self.dropped},
+        }
+
+    def prometheus_text(self):
+        with self._lock:
+            span_totals = {name: tuple(total) for name, total in self.span_totals.items()}
+            counters = dict(self.counters)
+        lines = [
+            f"# HELP {METRIC_PREFIX}_span_calls_total Completed spans by name.",
+            f"# TYPE {METRIC_PREFIX}_span_calls_total counter",
+        ]
+        lines += [f"{METRIC_PREFIX}_span_calls_total{_labels({'span': name})} {calls}" for name, (calls, _) in sorted(span_totals.items())]
+        lines += [
+            f"# HELP {METRIC_PREFIX}_span_seconds_total Seconds spent in spans by name.",
+            f"# TYPE {METRIC_PREFIX}_span_seconds_total counter",
+        ]
+        lines += [f"{METRIC_PREFIX}_span_seconds_total{_labels({'span': name})} {seconds:.6f}" for name, (_, seconds) in sorted(span_totals.items())]
+        metrics = {}
+        for (name, labels), value in counters.items():
+            metrics.setdefault(name, []).append((labels, value))
+        for name, samples in sorted(metrics.items()):
+            metric = f"{METRIC_PREFIX}_{re.sub(r'[^a-zA-Z0-9_]', '_', name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines += [f"{metric}{_labels(dict(labels))} {value}" for labels, value in sorted(samples)]
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value).translate(_LABEL_ESCAPES)}"' for key, value in labels.items()) + "}"
+
+
+_tracer = None
+
+
+# Function to start collecting spans and counters in this process; returns the tracer
+def enable(max_events=DEFAULT_MAX_EVENTS):
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_events)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def get_tracer():
+    return _tracer
+
+
+# Function to time a block: `with span("ner.batch", windows=8) as s: ... s.set(tokens=...)`.
+# While tracing is disabled this returns a shared no-op span, so instrumented code costs one call.
+def span(name, category="uecm", **args):
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, category, **args)
+
+
+def add_span(name, started, seconds, category="uecm", args=None, thread=None):
+    if _tracer is not None:
+        _tracer.add_span(name, started, seconds, category, args, thread)
+
+
+def count(name, value=1, **labels):
+    if _tracer is not None:
+        _tracer.count(name, value, **labels)
+
+
+def write_chrome_trace(path):
+    with open(path, 'w') as f:
+        json.dump(_tracer.chrome_trace() if _tracer is not None else {"traceEvents": []}, f)
+    loguru.logger.info(f"Trace saved to {path} (open in chrome://tracing or https://ui.perfetto.dev)")
+
+
+def write_prometheus(path):
+    with open(path, 'w') as f:
+        f.write(_tracer.prometheus_text() if _tracer is not None else "")
+    loguru.logger.info(f"Metrics snapshot saved to {path}")
+
+
+# Function to write whichever exports were requested on the command line (None skips one)
+def export(trace_path=None, metrics_path=None):
+    if trace_path:
+        write_chrome_trace(trace_path)
+    if metrics_path:
+        write_prometheus(metrics_path)